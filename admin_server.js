@@ -5,8 +5,9 @@ const path = require('path');
 const { execSync } = require('child_process');
 const url = require('url');
 const crypto = require('crypto');
+const zlib = require('zlib');
 
-const PORT = 3000;
+const PORT = parseInt(process.env.PORT, 10) || 3000; // scripts/load_test.py --start sets PORT
 const SESSION_TIMEOUT = 3600 * 1000 * 24; // 24 hours
 
 const BASE_DIR = __dirname;
@@ -16,13 +17,33 @@ const TEMP_SQL_FILE = path.join(BASE_DIR, 'temp_op.sql');
 
 const sessions = {};
 
-const MIME_TYPES = { '.html': 'text/html', '.css': 'text/css', '.js': 'text/javascript', '.png': 'image/png', '.jpg': 'image/jpeg' };
+const MIME_TYPES = { '.html': 'text/html', '.css': 'text/css', '.js': 'text/javascript', '.json': 'application/json', '.xml': 'application/xml', '.png': 'image/png', '.jpg': 'image/jpeg' };
 
 function escapeSql(str) { if (!str) return "''"; return "'" + str.replace(/'/g, "''") + "'"; }
 function getBody(req) { return new Promise((resolve, reject) => { let body = ''; req.on('data', c => body += c.toString()); req.on('end', () => resolve(new URLSearchParams(body))); req.on('error', reject); }); }
 function getSession(req) { const cookie = req.headers.cookie; if (!cookie) return null; const m = cookie.match(/sessionId=([a-zA-Z0-9]+)/); if (!m) return null; const sid = m[1]; if (sessions[sid] && sessions[sid].expires > Date.now()) return sessions[sid]; delete sessions[sid]; return null; }
 function setSession(res, username) { const sid = crypto.randomBytes(16).toString('hex'); sessions[sid] = { username, expires: Date.now() + SESSION_TIMEOUT }; res.setHeader('Set-Cookie', `sessionId=${sid}; HttpOnly; Path=/; Max-Age=86400`); }
 function generateSlug(pubDate, title) { const d = new Date(pubDate); const datePrefix = `${d.getFullYear()}${String(d.getMonth()+1).padStart(2,'0')}${String(d.getDate()).padStart(2,'0')}`; let h = 0; for (let i=0;i<title.length;i++){ h = ((h<<5)-h)+title.charCodeAt(i); h |=0;} return `article_${datePrefix}_${Math.abs(h)}`; }
+// pub_ts + idx_articles_list come from scripts/migrate_db.py; fall back to pub_date on an unmigrated DB
+function hasColumn(table, col){ try { const out = execSync(`sqlite3 -json "${DB_FILE}" "PRAGMA table_info(${table})"`).toString(); return JSON.parse(out || '[]').some(c => c.name === col); } catch (e) { return false; } }
+const LIST_ORDER = hasColumn('articles', 'pub_ts') ? 'pub_ts DESC, id DESC' : 'pub_date DESC';
+// The media table appears once scripts/media_index.py has run. Cached like LIST_ORDER once it exists;
+// until then the check is retried at most every MEDIA_INDEX_RETRY_MS
+const MEDIA_INDEX_RETRY_MS = 30000;
+let mediaIndex = { ok: false, checked: 0 };
+function hasMediaIndex(){ if (!mediaIndex.ok && Date.now() - mediaIndex.checked >= MEDIA_INDEX_RETRY_MS) mediaIndex = { ok: hasColumn('media', 'path'), checked: Date.now() }; return mediaIndex.ok; }
+// Old flat article URLs -> articles/YYYY/MM/ shard, from articles/redirects.json (scripts/layout.py --migrate)
+const REDIRECTS_FILE = path.join(BASE_DIR, 'articles', 'redirects.json');
+let redirectCache = { mtime: 0, map: {} };
+function articleRedirect(pathname){ try { const mtime = fs.statSync(REDIRECTS_FILE).mtimeMs; if (mtime !== redirectCache.mtime) redirectCache = { mtime, map: JSON.parse(fs.readFileSync(REDIRECTS_FILE, 'utf8')) }; } catch (e) { return null; } return redirectCache.map[pathname] || null; }
+// feed.xml and sitemap*.xml from scripts/feeds.py, sent as their precompressed .br/.gz copy when the client accepts it
+const FEED_RE = /^\/(feed|sitemap(-\d{4})?)\.xml$/;
+function serveFeed(req, res, pathname){ if (!FEED_RE.test(pathname)) return false; const file = path.join(BASE_DIR, pathname.slice(1)); if (!fs.existsSync(file)) return false; const accept = req.headers['accept-encoding'] || ''; const enc = [['br', '.br'], ['gzip', '.gz']].find(([name, ext]) => accept.includes(name) && fs.existsSync(file + ext)); const headers = { 'Content-Type': 'application/xml; charset=utf-8', 'Vary': 'Accept-Encoding' }; if (enc) headers['Content-Encoding'] = enc[0]; res.writeHead(200, headers); res.end(fs.readFileSync(enc ? file + enc[1] : file)); return true; }
+// Article pages in articles/ and its YYYY/MM shards, as paths relative to articles/
+function listArticlePages(dir){ const isShard = (name, width) => name.length === width && /^\d+$/.test(name); const pages = d => fs.readdirSync(d, { withFileTypes: true }).filter(e => e.isFile() && e.name.toLowerCase().endsWith('.html')).map(e => e.name).sort(); let files = pages(dir); fs.readdirSync(dir).filter(y => isShard(y, 4)).sort().forEach(y => { fs.readdirSync(path.join(dir, y)).filter(m => isShard(m, 2)).sort().forEach(m => { files = files.concat(pages(path.join(dir, y, m)).map(f => `${y}/${m}/${f}`)); }); }); return files; }
+// articles.content may be a zlib BLOB written by scripts/content_store.py; select it as hex and inflate here
+const CONTENT_COLUMNS = "CASE WHEN typeof(content)='blob' THEN hex(content) END AS content_hex, CASE WHEN typeof(content)='blob' THEN NULL ELSE content END AS content";
+function decodeContent(row){ if (!row.content_hex) return row.content || ''; const buf = Buffer.from(row.content_hex, 'hex'); const tag = buf.subarray(0, 3).toString('latin1'); if (tag === '\x00zl') return zlib.inflateSync(buf.subarray(3)).toString('utf8'); if (tag === '\x00zs') throw new Error('zstd content: run scripts/content_store.py --migrate zlib'); return buf.toString('utf8'); }
 function getExcerpt(content, len=120){ let t = (content||'').replace(/<[^>]+>/g,'').replace(/\s+/g,' ').trim(); return t.length<=len? t: t.substring(0,len)+'...'; }
 
 // Password helpers
@@ -171,7 +192,7 @@ function serveStaticIfExists(res, reqPath){ const p = path.join(BASE_DIR, reqPat
                         try {
                             const dir = path.join(BASE_DIR, 'articles');
                             if (fs.existsSync(dir) && fs.statSync(dir).isDirectory()){
-                                const files = fs.readdirSync(dir).filter(f => f.toLowerCase().endsWith('.html')).sort();
+                                const files = listArticlePages(dir);
                                 // simple HTML listing with anchors so client-side parser can read <a> tags
                                 const items = files.map(f => `<li><a href="${f}">${f}</a></li>`).join('\n');
                                 const html = `<!doctype html><html><head><meta charset="utf-8"><title>Articles</title></head><body><ul>${items}</ul></body></html>`;
@@ -182,16 +203,40 @@ function serveStaticIfExists(res, reqPath){ const p = path.join(BASE_DIR, reqPat
                         } catch(e){ /* fallthrough to static handling */ }
                     }
 
-                    if (pathname.startsWith('/articles/') || pathname.match(/\.(png|jpg|css|js|mp3)$/)) {
+                    if (serveFeed(req, res, pathname)) return;
+
+                    if (pathname.startsWith('/articles/') || pathname.match(/\.(png|jpg|css|js|mp3)$/) || pathname === '/precache-manifest.json') {
                         const safePath = path.normalize(pathname).replace(/^(\.{2,}[\/\\])+/, '');
                         const fullPath = path.join(BASE_DIR, safePath);
                         const injectSession = pathname.endsWith('.html') ? session : null;
                         if (fs.existsSync(fullPath)) { serveStatic(res, fullPath, injectSession); return; }
+                        const moved = articleRedirect(pathname);
+                        if (moved) { res.writeHead(301, { 'Location': moved }); res.end(); return; }
                     }
 
                     // Media list endpoint for admin (returns images under articles/facebook_media)
                 if (pathname === '/media-list') {
                     if (!session) { res.writeHead(403); res.end('Forbidden'); return; }
+                    // Served from the media table kept by scripts/media_index.py; ?page=N&per_page=M returns
+                    // {page, per_page, total, items}, without them the whole list as before
+                    if (hasMediaIndex()) {
+                        try {
+                            const range = "path >= 'articles/facebook_media/' AND path < 'articles/facebook_media0' AND type IN ('image', 'video')";
+                            const page = parseInt(parsedUrl.query.page);
+                            if (page > 0) {
+                                const perPage = Math.min(Math.max(parseInt(parsedUrl.query.per_page) || 100, 1), 1000);
+                                const total = JSON.parse(execSync(`sqlite3 -json "${DB_FILE}" "SELECT COUNT(1) AS n FROM media WHERE ${range}"`).toString() || '[]')[0].n;
+                                const items = JSON.parse(execSync(`sqlite3 -json "${DB_FILE}" "SELECT '/' || path AS url, size, width, height, type FROM media WHERE ${range} ORDER BY path LIMIT ${perPage} OFFSET ${(page - 1) * perPage}"`, { maxBuffer: 1024 * 1024 * 50 }).toString() || '[]');
+                                res.writeHead(200, { 'Content-Type': 'application/json' });
+                                res.end(JSON.stringify({ page, per_page: perPage, total, items }));
+                            } else {
+                                const rows = JSON.parse(execSync(`sqlite3 -json "${DB_FILE}" "SELECT '/' || path AS url FROM media WHERE ${range} ORDER BY path"`, { maxBuffer: 1024 * 1024 * 50 }).toString() || '[]');
+                                res.writeHead(200, { 'Content-Type': 'application/json' });
+                                res.end(JSON.stringify(rows.map(r => r.url)));
+                            }
+                            return;
+                        } catch (e) { res.writeHead(500); res.end('Error: ' + e.message); return; }
+                    }
                     try {
                         const mediaRoot = path.join(BASE_DIR, 'articles', 'facebook_media');
                         const results = [];
@@ -294,7 +339,7 @@ function serveStaticIfExists(res, reqPath){ const p = path.join(BASE_DIR, reqPat
                     const success = parsedUrl.query.status === 'success' ? `<div class="success">操作成功！<a href="/home" target="_blank">查看日记</a></div>` : '';
                     const deleted = parsedUrl.query.status === 'deleted' ? `<div class="success">文章已删除。</div>` : '';
                     let articles = [];
-                    try { const query = `SELECT id, title, pub_date FROM articles ORDER BY pub_date DESC LIMIT 50`; const result = execSync(`sqlite3 -json "${DB_FILE}" "${query}"`).toString(); articles = JSON.parse(result || '[]'); } catch (e) { console.error(e); }
+                    try { const query = `SELECT id, title, pub_date FROM articles ORDER BY ${LIST_ORDER} LIMIT 50`; const result = execSync(`sqlite3 -json "${DB_FILE}" "${query}"`).toString(); articles = JSON.parse(result || '[]'); } catch (e) { console.error(e); }
                     let rows = articles.map(a => `
                         <tr>
                             <td>${new Date(a.pub_date).toISOString().split('T')[0]}</td>
@@ -342,7 +387,7 @@ function serveStaticIfExists(res, reqPath){ const p = path.join(BASE_DIR, reqPat
                     if (!session) { res.writeHead(302, { 'Location': '/login' }); res.end(); return; }
                     const id = parsedUrl.query.id; if (!id) { res.end('Missing ID'); return; }
                     let article = null;
-                    try { const query = `SELECT * FROM articles WHERE id = ${parseInt(id)}`; const result = execSync(`sqlite3 -json "${DB_FILE}" "${query}"`).toString(); const rows = JSON.parse(result || '[]'); if (rows.length > 0) article = rows[0]; } catch (e) { console.error(e); }
+                    try { const query = `SELECT id, title, pub_date, slug, excerpt, ${CONTENT_COLUMNS} FROM articles WHERE id = ${parseInt(id)}`; const result = execSync(`sqlite3 -json "${DB_FILE}" "${query}"`).toString(); const rows = JSON.parse(result || '[]'); if (rows.length > 0) { article = rows[0]; article.content = decodeContent(article); } } catch (e) { console.error(e); }
                     if (!article) { res.end('Article not found'); return; }
 
                     // Extract inner .article-content when possible for friendlier editing
@@ -1,6 +1,7 @@
 const fs = require('fs');
 const path = require('path');
 const { execSync } = require('child_process');
+const zlib = require('zlib');
 
 const BASE_DIR = __dirname;
 const dbFile = path.join(BASE_DIR, 'articles.db');
@@ -27,21 +28,111 @@ if (!fs.existsSync(fullArticlesDir)) {
     fs.mkdirSync(fullArticlesDir);
 }
 
+// Once scripts/layout.py --migrate has run (articles/.sharded exists) pages go to articles/YYYY/MM/,
+// taken from the first YYYYMMDD token of the slug; slugs without one stay in articles/
+const sharded = fs.existsSync(path.join(fullArticlesDir, '.sharded'));
+function shardFor(slug) {
+    if (!sharded) return '';
+    const tok = String(slug).split(/[_.\-]/).find(t => t.length === 8 && /^\d+$/.test(t));
+    if (!tok) return '';
+    const y = +tok.slice(0, 4), m = +tok.slice(4, 6), d = +tok.slice(6, 8);
+    const date = new Date(Date.UTC(y, m - 1, d));
+    if (date.getUTCFullYear() !== y || date.getUTCMonth() !== m - 1 || date.getUTCDate() !== d) return '';
+    return `${tok.slice(0, 4)}/${tok.slice(4, 6)}/`;
+}
+// Link from one article page to another, relative to the first page's directory
+function articleHref(fromSlug, toSlug) {
+    return path.posix.relative(shardFor(fromSlug) || '.', `${shardFor(toSlug)}${toSlug}.html`);
+}
+// DB content is written relative to articles/; prefix its relative src/href/poster for a page in a shard
+function relinkContent(html, prefix) {
+    if (!prefix) return html;
+    return html.replace(/(\b(?:src|href|poster)\s*=\s*["'])([^"']+)(["'])/gi, (m, a, ref, b) =>
+        /^(?:[a-z][a-z0-9+.\-]*:|\/|#|\?|\{\{)/i.test(ref.trim()) ? m : a + prefix + ref + b);
+}
+
 // 1. Fetch Data from DB
 console.log("Fetching articles from DB...");
-const query = `SELECT * FROM articles ORDER BY pub_date DESC, id DESC;`;
+// Sort on the integer pub_ts (covered by idx_articles_list) once scripts/migrate_db.py has run
+const columns = JSON.parse(execSync(`sqlite3 ${dbFile} -json "PRAGMA table_info(articles);"`).toString() || '[]').map(c => c.name);
+const order = columns.includes('pub_ts') ? 'pub_ts DESC, id DESC' : 'pub_date DESC, id DESC';
+// content may be a zlib BLOB written by scripts/content_store.py, so it is selected as hex and inflated below
+const contentColumns = "CASE WHEN typeof(content)='blob' THEN hex(content) END AS content_hex, CASE WHEN typeof(content)='blob' THEN NULL ELSE content END AS content";
+const query = `SELECT id, title, slug, pub_date, excerpt, ${contentColumns} FROM articles ORDER BY ${order};`;
 const jsonStr = execSync(`sqlite3 ${dbFile} -json "${query.replace(/"/g, '\\"')}"`, { maxBuffer: 1024 * 1024 * 200 }).toString();
 const allItems = JSON.parse(jsonStr || '[]');
 
-// Read Templates
-const articleTemplate = fs.readFileSync(articleTemplateFile, 'utf8');
-const indexTemplate = fs.readFileSync(htmlTemplate, 'utf8');
+function decodeContent(item) {
+    if (!item.content_hex) return item.content || '';
+    const buf = Buffer.from(item.content_hex, 'hex');
+    const tag = buf.subarray(0, 3).toString('latin1');
+    if (tag === '\x00zl') return zlib.inflateSync(buf.subarray(3)).toString('utf8');
+    if (tag === '\x00zs') throw new Error(`${item.slug}: zstd content, run scripts/content_store.py --migrate zlib`);
+    return buf.toString('utf8');
+}
+allItems.forEach(item => { item.content = decodeContent(item); delete item.content_hex; });
+
+// Related posts precomputed by scripts/related_posts.py, fetched in one query for all pages
+const tables = JSON.parse(execSync(`sqlite3 ${dbFile} -json "SELECT name FROM sqlite_master WHERE type='table';"`).toString() || '[]').map(t => t.name);
+const relatedBySlug = {};
+if (tables.includes('related_posts')) {
+    const relatedRows = JSON.parse(execSync(`sqlite3 ${dbFile} -json "SELECT slug, related_slug FROM related_posts ORDER BY slug, rank;"`, { maxBuffer: 1024 * 1024 * 50 }).toString() || '[]');
+    relatedRows.forEach(r => { (relatedBySlug[r.slug] = relatedBySlug[r.slug] || []).push(r.related_slug); });
+}
+// Prev/next links precomputed by scripts/related_posts.py; used only while the table covers exactly the
+// current articles, otherwise (an article added or removed since) they are taken from the ordering here
+let navBySlug = null;
+if (tables.includes('article_nav')) {
+    const navRows = JSON.parse(execSync(`sqlite3 ${dbFile} -json "SELECT slug, newer_slug, older_slug FROM article_nav;"`, { maxBuffer: 1024 * 1024 * 50 }).toString() || '[]');
+    const slugs = new Set(allItems.map(item => item.slug));
+    if (navRows.length === slugs.size && navRows.every(r => slugs.has(r.slug))) {
+        navBySlug = {};
+        navRows.forEach(r => { navBySlug[r.slug] = r; });
+    }
+}
+// Reading time from scripts/text_stats.py, shown next to the date on article pages
+const readingSecsBySlug = {};
+if (tables.includes('text_stats')) {
+    JSON.parse(execSync(`sqlite3 ${dbFile} -json "SELECT slug, reading_secs FROM text_stats;"`, { maxBuffer: 1024 * 1024 * 50 }).toString() || '[]')
+        .forEach(r => { readingSecsBySlug[r.slug] = r.reading_secs; });
+}
+function readingTime(slug) {
+    const secs = readingSecsBySlug[slug];
+    return secs === undefined ? '' : `<span class="reading-time"> · 约 ${Math.max(1, Math.round(secs / 60))} 分钟</span>`;
+}
+const itemsBySlug = {};
+allItems.forEach(item => { itemsBySlug[item.slug] = item; });
 
 function escapeHtml(str){
   if(!str) return '';
   return String(str).replace(/[&<>\"]/g, s => ({'&':'&amp;','<':'&lt;','>':'&gt;','"':'&quot;'}[s]));
 }
 
+// Templates are split once at their {{NAME}} placeholders, as scripts/templates.py does for the Python
+// writers; a render fills the names and joins, instead of copying the template through a .replace chain.
+// Values are escaped unless the placeholder holds ready-made HTML; {{AUTH_LINKS}} is left for the server.
+// TITLE is raw here: DB titles are stored as HTML (WordPress entities such as &#8212;).
+const RAW_PLACEHOLDERS = new Set(['TITLE', 'CONTENT', 'PREV_LINK', 'NEXT_LINK', 'RELATED_LINKS', 'READING_TIME', 'SIDEBAR_CONTENT', 'GRID_CONTENT']);
+const RUNTIME_PLACEHOLDERS = new Set(['AUTH_LINKS']);
+function compileTemplate(text) {
+    const parts = text.split(/\{\{([A-Z_]+)\}\}/);
+    return { literals: parts.filter((_, i) => i % 2 === 0), names: parts.filter((_, i) => i % 2 === 1) };
+}
+function renderTemplate(tpl, values) {
+    const out = [tpl.literals[0]];
+    tpl.names.forEach((name, i) => {
+        const v = values[name];
+        if (v === undefined || v === null) out.push(RUNTIME_PLACEHOLDERS.has(name) ? `{{${name}}}` : '');
+        else out.push(RAW_PLACEHOLDERS.has(name) ? String(v) : escapeHtml(v));
+        out.push(tpl.literals[i + 1]);
+    });
+    return out.join('');
+}
+
+// Read Templates
+const articleTemplate = compileTemplate(fs.readFileSync(articleTemplateFile, 'utf8'));
+const indexTemplate = compileTemplate(fs.readFileSync(htmlTemplate, 'utf8'));
+
 function cleanExcerpt(str){
   if(!str) return '';
   return String(str).replace(/\bPhotos\b/gi, '').replace(/\s+/g, ' ').trim();
@@ -59,21 +150,27 @@ allItems.forEach((item, index) => {
     const month = String(pubDate.getMonth() + 1).padStart(2, '0');
     const dateStr = formatDate(item.pub_date);
     const filename = `${item.slug}.html`;
-    const relativeLink = `${articlesSubDir}/${filename}`;
+    const shard = shardFor(item.slug);
+    const relativeLink = `${articlesSubDir}/${shard}${filename}`;
     
     // Timeline collection
     if (!timelineData[year]) timelineData[year] = new Set();
     timelineData[year].add(month);
     
-    // Generate Article HTML Page - compute prev/next based on current ordering
-    const prevItem = index > 0 ? allItems[index - 1] : null;
-    const nextItem = index < allItems.length - 1 ? allItems[index + 1] : null;
+    // Generate Article HTML Page - prev/next from article_nav, or from the current ordering
+    const nav = navBySlug && navBySlug[item.slug];
+    const prevItem = nav ? itemsBySlug[nav.newer_slug] || null : (index > 0 ? allItems[index - 1] : null);
+    const nextItem = nav ? itemsBySlug[nav.older_slug] || null : (index < allItems.length - 1 ? allItems[index + 1] : null);
+
+    const prevHtml = prevItem ? `<a class="prev-link" href="${escapeHtml(articleHref(item.slug, prevItem.slug))}">← ${escapeHtml(prevItem.title)}</a>` : `<span class="empty"></span>`;
+    const nextHtml = nextItem ? `<a class="next-link" href="${escapeHtml(articleHref(item.slug, nextItem.slug))}">${escapeHtml(nextItem.title)} →</a>` : `<span class="empty"></span>`;
 
-    const prevHtml = prevItem ? `<a class="prev-link" href="${escapeHtml(prevItem.slug)}.html">← ${escapeHtml(prevItem.title)}</a>` : `<span class="empty"></span>`;
-    const nextHtml = nextItem ? `<a class="next-link" href="${escapeHtml(nextItem.slug)}.html">${escapeHtml(nextItem.title)} →</a>` : `<span class="empty"></span>`;
+    const related = (relatedBySlug[item.slug] || []).map(s => itemsBySlug[s]).filter(Boolean);
+    const relatedHtml = related.length ? `<aside class="related-posts"><h2>相关文章</h2><ul>${related.map(r =>
+      `<li><a href="${escapeHtml(articleHref(item.slug, r.slug))}">${escapeHtml(r.title)}</a><span class="related-date">${formatDate(r.pub_date)}</span></li>`).join('')}</ul></aside>` : '';
 
     // Server-side process article content: remove stray 'Photos' tokens and wrap standalone <img> tags into thumbnail anchors
-    let contentHtml = item.content || '';
+    let contentHtml = relinkContent(item.content || '', shard ? '../../' : '');
     // remove standalone word 'Photos' (case-insensitive) and collapse repeated whitespace
     contentHtml = String(contentHtml).replace(/\bPhotos\b/gi, '').replace(/\s+/g, ' ');
 
@@ -107,15 +204,19 @@ allItems.forEach((item, index) => {
       return linkedPlaceholders[Number(idx)] || '';
     });
 
-    let pageContent = articleTemplate
-      .replace('href="index.html"', 'href="../home.html"') // Back link now points to home.html
-      .replace(/{{TITLE}}/g, item.title)
-      .replace(/{{DATE}}/g, dateStr)
-      .replace(/{{CONTENT}}/g, contentHtml)
-      .replace(/{{PREV_LINK}}/g, prevHtml)
-      .replace(/{{NEXT_LINK}}/g, nextHtml);
+    const pageContent = renderTemplate(articleTemplate, {
+      TITLE: item.title,
+      DATE: dateStr,
+      READING_TIME: readingTime(item.slug),
+      CONTENT: contentHtml,
+      PREV_LINK: prevHtml,
+      NEXT_LINK: nextHtml,
+      RELATED_LINKS: relatedHtml,
+    });
 
-    fs.writeFileSync(path.join(fullArticlesDir, filename), pageContent);
+    const pageDir = path.join(fullArticlesDir, shard);
+    if (shard && !fs.existsSync(pageDir)) fs.mkdirSync(pageDir, { recursive: true });
+    fs.writeFileSync(path.join(pageDir, filename), pageContent);
     
     // Generate Index Card HTML
     const colorClass = getRandomColor(index);
@@ -154,9 +255,7 @@ sortedYears.forEach(year => {
 });
 
 // 4. Update Home (Diary List)
-let finalHtml = indexTemplate
-    .replace('{{SIDEBAR_CONTENT}}', sidebarHtml)
-    .replace('{{GRID_CONTENT}}', gridHtml);
+let finalHtml = renderTemplate(indexTemplate, { SIDEBAR_CONTENT: sidebarHtml, GRID_CONTENT: gridHtml });
 
 // Inject Audio Player into home.html
 const playerHtml = `
@@ -195,4 +294,15 @@ finalHtml = finalHtml.replace('</body>', playerHtml);
 
 fs.writeFileSync(path.join(outputDir, 'home.html'), finalHtml);
 
+// 5. Post-build stages over the pages just written: each rewrites only pages whose size/mtime changed since
+// its last run and is skipped with a warning if it fails, so a missing Python setup never blocks a publish
+function runStage(script) {
+    try { execSync(`python3 "${path.join(BASE_DIR, 'scripts', script)}"`, { stdio: 'inherit' }); }
+    catch (e) { console.warn(`scripts/${script} failed: ${e.message}`); }
+}
+// loading/decoding/width/height on <img> tags (generated pages carry none of them)
+runStage('lazy_images.py');
+// precache manifest + /sw.js, last so it hashes the final bytes of every page
+runStage('build_sw.py');
+
 console.log("Done! Site regenerated (home.html + articles).");
@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+"""Service worker and precache manifest for offline reading.
+
+generate_from_db.js runs it as its last stage, so the manifest and `/sw.js`
+follow every save and delete. It writes two files at the site root:
+
+  - `precache-manifest.json`: `{"version": ..., "entries": [{"url", "hash",
+    "size"}, ...]}` for home.html, every article page (all shards), the
+    image thumbnails and video posters under the media directories, and
+    the site logo
+  - `sw.js`: the service worker, with the manifest version baked in so the
+    browser sees a new worker exactly when some entry changed
+
+Hashes are SHA-256 prefixes of the file content, recomputed only for
+files whose size or mtime differ from the `precache_files` table, so
+unchanged entries keep their hashes and both files are only rewritten
+when something changed.
+
+The worker keeps the hash it cached for every URL. On install it fetches
+only the entries whose hash differs and drops entries that left the
+manifest, so an update costs the changed pages rather than the archive.
+Precached URLs are answered from the cache, other GETs go to the network
+with the cache as fallback, and navigations fall back to home.html
+offline. Range requests and the admin routes are never intercepted.
+Precaching fetches without cookies, so cached pages carry the anonymous
+`{{AUTH_LINKS}}` header even if an update installs during a login. After
+the browser has visited an admin route, pages come from the network
+(their header is per session) until `/logout`.
+
+The templates register `/sw.js`; pages opened from `file://` skip it.
+
+Run from the repo root: `python3 scripts/build_sw.py [--force]`
+"""
+from hashlib import sha256
+from pathlib import Path
+from urllib.parse import quote
+import argparse
+import json
+import sqlite3
+
+from layout import iter_pages
+from media_index import MEDIA_DIRS
+from safe_write import WriteBatch, write_text
+
+ROOT = Path(__file__).resolve().parents[1]
+ART_DIR = ROOT / 'articles'
+DB_PATH = ROOT / 'articles.db'
+MANIFEST = ROOT / 'precache-manifest.json'
+SW_PATH = ROOT / 'sw.js'
+
+ASSETS = ['home.html', 'skycity_cutout.png']
+THUMB_PATTERNS = ['*_thumb.*', '*.poster.jpg']
+HASH_CHARS = 16
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS precache_files (
+    path TEXT PRIMARY KEY,
+    size INTEGER,
+    mtime REAL,
+    hash TEXT
+);
+'''
+
+SW_SOURCE = r"""// Generated by scripts/build_sw.py from precache-manifest.json; do not edit.
+const VERSION = '{{VERSION}}';
+// v2: earlier versions precached with cookies and could hold pages with a logged-in header
+const CACHE = 'skycity-pages-v2';
+const META = 'skycity-meta';
+const MANIFEST_URL = '/precache-manifest.json';
+const ADMIN_PATHS = ['/admin', '/edit', '/update', '/delete', '/login', '/register', '/media-list'];
+const BATCH = 8;
+
+async function readMeta(key) {
+  const r = await (await caches.open(META)).match(key);
+  return r ? r.json() : null;
+}
+
+async function writeMeta(key, value) {
+  await (await caches.open(META)).put(key, new Response(JSON.stringify(value)));
+}
+
+let adminMode = null;
+async function isAdmin() {
+  if (adminMode === null) adminMode = !!(await readMeta('/__admin'));
+  return adminMode;
+}
+function setAdmin(on) {
+  adminMode = on;
+  return writeMeta('/__admin', on);
+}
+
+self.addEventListener('install', event => {
+  event.waitUntil((async () => {
+    const manifest = await (await fetch(MANIFEST_URL, { cache: 'no-store' })).json();
+    const known = (await readMeta('/__hashes')) || {};
+    const cache = await caches.open(CACHE);
+    const stale = [];
+    for (const e of manifest.entries) {
+      if (known[e.url] !== e.hash || !(await cache.match(e.url))) stale.push(e);
+    }
+    // only new or changed entries are fetched; the rest stay cached from earlier versions
+    for (let i = 0; i < stale.length; i += BATCH) {
+      await Promise.all(stale.slice(i, i + BATCH).map(async e => {
+        // without cookies, so pages are cached as anonymous visitors see them, never with the admin header
+        const res = await fetch(e.url, { cache: 'no-cache', credentials: 'omit' });
+        if (!res.ok) throw new Error(`${e.url}: ${res.status}`);
+        await cache.put(e.url, res);
+        known[e.url] = e.hash;
+      }));
+    }
+    const hashes = {};
+    manifest.entries.forEach(e => { hashes[e.url] = known[e.url]; });
+    await writeMeta('/__hashes', hashes);
+    await self.skipWaiting();
+  })());
+});
+
+self.addEventListener('activate', event => {
+  event.waitUntil((async () => {
+    const hashes = (await readMeta('/__hashes')) || {};
+    for (const name of await caches.keys()) {
+      if (name !== CACHE && name !== META) await caches.delete(name);
+    }
+    const cache = await caches.open(CACHE);
+    for (const req of await cache.keys()) {
+      if (!(new URL(req.url).pathname in hashes)) await cache.delete(req);
+    }
+    await self.clients.claim();
+  })());
+});
+
+self.addEventListener('fetch', event => {
+  const req = event.request;
+  const url = new URL(req.url);
+  if (url.origin !== self.location.origin) return;
+  if (url.pathname === '/logout') { event.waitUntil(setAdmin(false)); return; }
+  if (ADMIN_PATHS.includes(url.pathname)) { event.waitUntil(setAdmin(true)); return; }
+  if (req.method !== 'GET' || req.headers.has('range')) return;
+  const key = url.pathname === '/home' ? '/home.html' : url.pathname;
+  event.respondWith((async () => {
+    const cache = await caches.open(CACHE);
+    if (!(await isAdmin())) {
+      const hit = await cache.match(key);
+      if (hit) return hit;
+    }
+    try {
+      return await fetch(req);
+    } catch (err) {
+      const fallback = (await cache.match(key)) || (req.mode === 'navigate' && (await cache.match('/home.html')));
+      if (fallback) return fallback;
+      throw err;
+    }
+  })());
+});
+"""
+
+
+def _hash(path):
+    h = sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()[:HASH_CHARS]
+
+
+def outputs():
+    """Files to precache, as paths under ROOT."""
+    files = [ROOT / a for a in ASSETS if (ROOT / a).exists()]
+    files += iter_pages('*.html', ART_DIR)
+    for d in MEDIA_DIRS:
+        if d.exists():
+            files += sorted({p for pattern in THUMB_PATTERNS for p in d.rglob(pattern) if p.is_file()})
+    return files
+
+
+def entries(conn, force=False):
+    """Manifest entries, hashing only files that changed since the last build."""
+    known = {r[0]: r[1:] for r in conn.execute('SELECT path, size, mtime, hash FROM precache_files')}
+    out, seen, hashed = [], set(), 0
+    for path in outputs():
+        rel = path.relative_to(ROOT).as_posix()
+        st = path.stat()
+        row = known.get(rel)
+        if force or row is None or (row[0], row[1]) != (st.st_size, st.st_mtime):
+            h = _hash(path)
+            hashed += 1
+            conn.execute('INSERT OR REPLACE INTO precache_files VALUES (?,?,?,?)', (rel, st.st_size, st.st_mtime, h))
+        else:
+            h = row[2]
+        seen.add(rel)
+        out.append({'url': '/' + quote(rel), 'hash': h, 'size': st.st_size})
+    conn.executemany('DELETE FROM precache_files WHERE path = ?', [(p,) for p in known if p not in seen])
+    return out, hashed
+
+
+def build(force=False, db_path=DB_PATH):
+    conn = sqlite3.connect(str(db_path))
+    conn.executescript(SCHEMA)
+    items, hashed = entries(conn, force)
+    version = sha256(''.join(f"{e['url']} {e['hash']}\n" for e in items).encode('utf-8')).hexdigest()[:HASH_CHARS]
+    manifest = {'version': version, 'entries': items}
+    with WriteBatch():
+        changed = write_text(MANIFEST, json.dumps(manifest, ensure_ascii=False, indent=1) + '\n')
+        changed |= write_text(SW_PATH, SW_SOURCE.replace('{{VERSION}}', version))
+    conn.commit()
+    conn.close()
+    return manifest, hashed, changed
+
+
+if __name__ == '__main__':
+    p = argparse.ArgumentParser(description='Write sw.js and precache-manifest.json from the built pages')
+    p.add_argument('--force', action='store_true', help='rehash every file')
+    p.add_argument('--db', default=str(DB_PATH))
+    args = p.parse_args()
+    manifest, hashed, changed = build(args.force, args.db)
+    total = sum(e['size'] for e in manifest['entries'])
+    print(f"{len(manifest['entries'])} entries ({total} bytes), {hashed} rehashed, version {manifest['version']}"
+          f"{'' if changed else ' (unchanged)'}")
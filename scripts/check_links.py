@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+"""Check that every src/href in the articles and home.html resolves.
+
+All references are extracted in a single pass over `articles/*.html` and
+`home.html`. Local targets are resolved with one `os.scandir` per directory
+rather than an `os.stat` per reference; remote URLs are only checked with
+`--remote`, using HEAD requests from a bounded thread pool, and the results
+are cached in `.linkcheck_cache.json` so reruns only hit new or expired URLs.
+Root-relative links (`/foo`) are checked on disk by default, or against a
+running server with `--server http://localhost:3000`.
+
+The report lists missing local media, failing remote URLs and files under
+`articles/facebook_media` that no page references.
+
+Run from the repo root: `python3 scripts/check_links.py [--remote] [--json report.json]`
+"""
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from urllib.parse import quote, unquote, urljoin
+import argparse
+import json
+import os
+import re
+import time
+import urllib.error
+import urllib.request
+
+from layout import iter_pages
+
+ROOT = Path(__file__).resolve().parents[1]
+ART_DIR = ROOT / 'articles'
+HOME = ROOT / 'home.html'
+MEDIA_DIR = ART_DIR / 'facebook_media'
+CACHE_PATH = ROOT / '.linkcheck_cache.json'
+
+REF_RE = re.compile(r'''\b(?:src|href|poster)\s*=\s*["']([^"']+)["']''', re.I)
+ONCLICK_RE = re.compile(r'''location\.href\s*=\s*\\?["']([^"'\\]+)\\?["']''', re.I)
+SKIP_PREFIXES = ('data:', 'javascript:', 'mailto:', 'tel:', '#', '{{')
+MEDIA_EXTS = {'.jpg', '.jpeg', '.png', '.gif', '.webp', '.mp4', '.mov', '.webm', '.mp3'}
+
+CACHE_TTL = 7 * 24 * 3600
+
+
+def extract_refs(text):
+    """Return every src/href/poster/onclick target in `text`, in document order."""
+    refs = REF_RE.findall(text)
+    refs.extend(ONCLICK_RE.findall(text))
+    return [r.strip() for r in refs if r.strip() and not r.strip().startswith(SKIP_PREFIXES)]
+
+
+def is_remote(ref):
+    return ref.startswith(('http://', 'https://', '//'))
+
+
+def resolve_local(ref, page):
+    """Map a local reference from `page` to a filesystem path under ROOT."""
+    path = unquote(ref.split('#', 1)[0].split('?', 1)[0])
+    if not path:
+        return None
+    if path.startswith('/'):
+        return (ROOT / path.lstrip('/')).resolve()
+    return (page.parent / path).resolve()
+
+
+def page_files(articles_dir=ART_DIR, home=HOME):
+    files = list(iter_pages('*.html', articles_dir))
+    if Path(home).exists():
+        files.append(Path(home))
+    return files
+
+
+def collect_refs(files):
+    """One pass over `files`; returns {ref target: set(page names)} split into local and remote."""
+    local = defaultdict(set)
+    remote = defaultdict(set)
+    for page in files:
+        text = page.read_text(encoding='utf-8', errors='ignore')
+        for ref in extract_refs(text):
+            if is_remote(ref):
+                remote['https:' + ref if ref.startswith('//') else ref].add(page.name)
+            else:
+                target = resolve_local(ref, page)
+                if target is not None:
+                    local[target].add(page.name)
+    return local, remote
+
+
+def existing_paths(paths):
+    """Batch existence check: scan each parent directory once."""
+    by_dir = defaultdict(list)
+    for p in paths:
+        by_dir[p.parent].append(p)
+    found = set()
+    for d, members in by_dir.items():
+        try:
+            with os.scandir(d) as it:
+                names = {e.name for e in it}
+        except (FileNotFoundError, NotADirectoryError, PermissionError):
+            continue
+        found.update(p for p in members if p.name in names)
+    return found
+
+
+def load_cache(path=CACHE_PATH):
+    try:
+        return json.loads(Path(path).read_text(encoding='utf-8'))
+    except (OSError, ValueError):
+        return {}
+
+
+def save_cache(cache, path=CACHE_PATH):
+    Path(path).write_text(json.dumps(cache, indent=1, sort_keys=True), encoding='utf-8')
+
+
+def head_status(url, timeout=10):
+    req = urllib.request.Request(url, method='HEAD', headers={'User-Agent': 'skycity-linkcheck'})
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as r:
+            return r.status
+    except urllib.error.HTTPError as e:
+        if e.code in (403, 405):
+            # some hosts refuse HEAD; retry with a one-byte ranged GET
+            req = urllib.request.Request(url, headers={'User-Agent': 'skycity-linkcheck', 'Range': 'bytes=0-0'})
+            try:
+                with urllib.request.urlopen(req, timeout=timeout) as r:
+                    return r.status
+            except urllib.error.HTTPError as e2:
+                return e2.code
+            except Exception:
+                return 0
+        return e.code
+    except Exception:
+        return 0
+
+
+def check_urls(urls, workers=8, cache=None, ttl=CACHE_TTL):
+    """HEAD each url with at most `workers` in flight; returns {url: status}."""
+    cache = {} if cache is None else cache
+    now = time.time()
+    results = {}
+    todo = []
+    for u in urls:
+        hit = cache.get(u)
+        if hit and now - hit['checked'] < ttl:
+            results[u] = hit['status']
+        else:
+            todo.append(u)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for u, status in zip(todo, pool.map(head_status, todo)):
+            results[u] = status
+            cache[u] = {'status': status, 'checked': now}
+    return results
+
+
+def orphaned_media(local_refs, media_dir=MEDIA_DIR):
+    if not Path(media_dir).exists():
+        return []
+    referenced = set(local_refs)
+    orphans = []
+    for f in sorted(Path(media_dir).rglob('*')):
+        if f.is_file() and f.suffix.lower() in MEDIA_EXTS and f.resolve() not in referenced:
+            orphans.append(f)
+    return orphans
+
+
+def rel(p):
+    try:
+        return str(Path(p).relative_to(ROOT))
+    except ValueError:
+        return str(p)
+
+
+def run(remote=False, server=None, workers=8):
+    pages = page_files()
+    local, remote_refs = collect_refs(pages)
+    report = {'pages': len(pages), 'local_refs': len(local), 'remote_refs': len(remote_refs)}
+
+    if server:
+        # root-relative links go to the running server instead of disk
+        rooted = [t for t in local if str(t).startswith(str(ROOT))]
+        urls = {urljoin(server, quote('/' + rel(t))): t for t in rooted}
+        statuses = check_urls(list(urls), workers=workers)
+        missing = [urls[u] for u, s in statuses.items() if not 200 <= s < 400]
+    else:
+        found = existing_paths(local)
+        missing = [t for t in local if t not in found]
+    report['missing'] = [{'target': rel(t), 'pages': sorted(local[t])} for t in sorted(missing)]
+
+    if remote:
+        cache = load_cache()
+        statuses = check_urls(sorted(remote_refs), workers=workers, cache=cache)
+        save_cache(cache)
+        report['broken_remote'] = [
+            {'url': u, 'status': s, 'pages': sorted(remote_refs[u])}
+            for u, s in sorted(statuses.items()) if not 200 <= s < 400
+        ]
+
+    orphans = orphaned_media(local)
+    report['orphaned_media'] = [rel(f) for f in orphans]
+    report['orphaned_bytes'] = sum(f.stat().st_size for f in orphans)
+    return report
+
+
+if __name__ == '__main__':
+    p = argparse.ArgumentParser(description='Check src/href references in articles and home.html')
+    p.add_argument('--remote', action='store_true', help='also HEAD-check http(s) URLs')
+    p.add_argument('--server', help='check local links against a running server, e.g. http://localhost:3000')
+    p.add_argument('--workers', type=int, default=8, help='max concurrent HEAD requests')
+    p.add_argument('--json', help='write the full report to this file')
+    args = p.parse_args()
+    report = run(args.remote, args.server, args.workers)
+    print(f"Scanned {report['pages']} pages: {report['local_refs']} local and {report['remote_refs']} remote targets")
+    print(f"Missing local targets: {len(report['missing'])}")
+    for m in report['missing']:
+        print(' -', m['target'], '<-', ', '.join(m['pages'][:3]))
+    if 'broken_remote' in report:
+        print(f"Broken remote URLs: {len(report['broken_remote'])}")
+        for b in report['broken_remote']:
+            print(' -', b['status'], b['url'])
+    print(f"Orphaned files in facebook_media: {len(report['orphaned_media'])} ({report['orphaned_bytes']} bytes)")
+    if args.json:
+        Path(args.json).write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding='utf-8')
+        print('Report written to', args.json)
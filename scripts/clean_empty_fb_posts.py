@@ -1,50 +1,63 @@
 #!/usr/bin/env python3
 from pathlib import Path
-from bs4 import BeautifulSoup
 import shutil
 import argparse
+import sqlite3
+
+from fingerprints import DB_PATH, duplicate_clusters, fingerprint_file, fingerprint_dir
+from layout import find_page
 
 def is_empty_post(path):
-    text = path.read_text(encoding='utf-8', errors='ignore')
-    soup = BeautifulSoup(text, 'html.parser')
-    # check normalized title
-    h1 = soup.find('h1', class_='article-title')
-    if h1 and 'Yao Min posted something via Microsoft' in h1.get_text():
-        return True
-    # fallback: check h2 from original facebook section
-    h2 = soup.find('h2')
-    if h2 and 'Yao Min posted something via Microsoft' in h2.get_text():
-        return True
-    # check for minimal content: no paragraph text or very short
-    content = soup.find(class_='article-content') or soup.find('section')
-    if content:
-        text_content = ''.join(content.stripped_strings)
-        if len(text_content) < 30:
-            return True
-    return False
+    return fingerprint_file(path)['empty']
+
+def duplicate_targets(fps, skip=()):
+    """Reposts to move: every post of a duplicate cluster except its oldest."""
+    targets = set()
+    for cluster in duplicate_clusters(fps):
+        keep = [n for n in cluster if n not in skip][:1]
+        targets.update(n for n in cluster if n not in keep and n not in skip)
+    return targets
+
+def clean(articles_dir, db_path=DB_PATH, duplicates=False):
+    """Move empty posts (and, with duplicates=True, reposts) aside.
 
-def clean(articles_dir):
+    Returns (moved, reposts): the names moved and the reposts found, which
+    are only listed unless `duplicates` is set.
+    """
     p = Path(articles_dir)
     removed_dir = p / 'removed_empty_fb'
     removed_dir.mkdir(parents=True, exist_ok=True)
-    files = list(p.glob('article_fb_*.html'))
+    fps, _ = fingerprint_dir(p, 'article_fb_*.html', db_path)
+    targets = {name for name, fp in fps.items() if fp['empty']}
+    reposts = duplicate_targets(fps, targets)
+    if duplicates:
+        targets |= reposts
     removed = []
-    for f in files:
+    for name in sorted(targets):
         try:
-            if is_empty_post(f):
-                dest = removed_dir / f.name
-                shutil.move(str(f), str(dest))
-                removed.append(f.name)
+            shutil.move(str(find_page(Path(name).stem, p)), str(removed_dir / name))
+            removed.append(name)
         except Exception:
             continue
-    return removed
+    if removed:
+        conn = sqlite3.connect(str(db_path))
+        conn.executemany('DELETE FROM fingerprints WHERE name = ?', [(n,) for n in removed])
+        conn.commit()
+        conn.close()
+    return removed, sorted(reposts)
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument('--articles', default='articles')
+    parser.add_argument('--db', default=str(DB_PATH))
+    parser.add_argument('--duplicates', action='store_true', help='also move near-duplicate reposts (listed only by default)')
     args = parser.parse_args()
-    removed = clean(args.articles)
+    removed, reposts = clean(args.articles, args.db, args.duplicates)
     print(f'Moved {len(removed)} files to {args.articles}/removed_empty_fb')
     if removed:
         for n in removed:
             print(' -', n)
+    if reposts and not args.duplicates:
+        print(f'{len(reposts)} near-duplicate reposts left in place (rerun with --duplicates to move them):')
+        for n in reposts:
+            print(' -', n)
@@ -12,6 +12,10 @@ import sqlite3
 from pathlib import Path
 from bs4 import BeautifulSoup
 
+from layout import iter_pages
+from safe_write import write_text
+from text_stats import make_excerpt
+
 ROOT = Path(__file__).resolve().parents[1]
 ART_DIR = ROOT / 'articles'
 DB_PATH = ROOT / 'articles.db'
@@ -39,22 +43,14 @@ def clean_article_file(path: Path) -> str:
             # Replace the contents of the article-content div
             content_div.clear()
             content_div.append(BeautifulSoup(new_contents, 'html.parser'))
-            path.write_text(str(soup), encoding='utf-8')
+            write_text(path, str(soup))
             # Return cleaned text for excerpting
             return content_div.get_text(separator=' ', strip=True)
     # Nothing changed, return current text
     return content_div.get_text(separator=' ', strip=True)
 
-def calc_excerpt(text: str, length: int = 160) -> str:
-    t = ' '.join(text.split())
-    if len(t) <= length:
-        return t
-    # cut on word boundary
-    cut = t[:length].rsplit(' ', 1)[0]
-    return cut + '...'
-
 def main():
-    files = sorted(ART_DIR.glob('article_fb_*.html'))
+    files = list(iter_pages('article_fb_*.html', ART_DIR))
     if not files:
         print('No FB article files found in articles/.')
         return
@@ -65,7 +61,7 @@ def main():
         cleaned_text = clean_article_file(f)
         if not cleaned_text:
             continue
-        excerpt = calc_excerpt(cleaned_text, 160)
+        excerpt = make_excerpt(cleaned_text, 160)
         # Update DB row matching filename (filename stored in `filename` or `path` column)
         # Try common column names: `filename`, `path`, `file`.
         updated_rows = 0
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""Shared accessor for `articles.content`, with optional compression.
+
+Every script that reads or writes article bodies goes through `decode` /
+`encode` (or the `get_content` / `set_content` helpers) instead of touching
+the column directly. Plain HTML is stored as TEXT, exactly as before.
+Compressed bodies are stored as a BLOB with a 3-byte tag followed by the
+compressed UTF-8 bytes:
+
+    b'\\x00zl' + zlib data     readable by generate_from_db.js / admin_server.js
+    b'\\x00zs' + zstd data     Python only, needs the `zstandard` package
+
+The codec used for new writes is recorded in the `settings` table
+(`content_codec`), so all scripts agree on it; rows written in another
+format are still read correctly, which lets the admin server keep saving
+plain TEXT.
+
+Run from the repo root:
+    python3 scripts/content_store.py --bench             # size / read latency per codec
+    python3 scripts/content_store.py --migrate zlib      # one-shot rewrite of every row
+    python3 scripts/content_store.py --migrate none      # back to plain TEXT
+"""
+from pathlib import Path
+import argparse
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+import zlib
+
+try:
+    import zstandard
+except Exception:
+    zstandard = None
+
+ROOT = Path(__file__).resolve().parents[1]
+DB_PATH = ROOT / 'articles.db'
+
+TAG_ZLIB = b'\x00zl'
+TAG_ZSTD = b'\x00zs'
+CODECS = ('none', 'zlib', 'zstd')
+ZLIB_LEVEL = 9
+ZSTD_LEVEL = 19
+
+
+def decode(value):
+    """Return the HTML for a stored `content` value (TEXT, BLOB or NULL)."""
+    if value is None or isinstance(value, str):
+        return value
+    data = bytes(value)
+    tag, body = data[:3], data[3:]
+    if tag == TAG_ZLIB:
+        return zlib.decompress(body).decode('utf-8')
+    if tag == TAG_ZSTD:
+        if zstandard is None:
+            raise RuntimeError('content is zstd-compressed; pip install zstandard')
+        return zstandard.ZstdDecompressor().decompress(body).decode('utf-8')
+    return data.decode('utf-8')
+
+
+def encode(html, codec='none'):
+    """Return the value to store for `html` under `codec`."""
+    if html is None or codec == 'none':
+        return html
+    raw = html.encode('utf-8')
+    if codec == 'zlib':
+        return sqlite3.Binary(TAG_ZLIB + zlib.compress(raw, ZLIB_LEVEL))
+    if codec == 'zstd':
+        if zstandard is None:
+            raise RuntimeError('zstd codec needs the zstandard package')
+        return sqlite3.Binary(TAG_ZSTD + zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(raw))
+    raise ValueError(f'unknown content codec: {codec}')
+
+
+def ensure_settings(conn):
+    conn.execute('CREATE TABLE IF NOT EXISTS settings (key TEXT PRIMARY KEY, value TEXT)')
+
+
+def write_codec(conn):
+    """Codec new writes should use, as recorded in the DB (default: none)."""
+    try:
+        row = conn.execute("SELECT value FROM settings WHERE key = 'content_codec'").fetchone()
+    except sqlite3.OperationalError:
+        return 'none'
+    return row[0] if row else 'none'
+
+
+def get_content(conn, slug):
+    row = conn.execute('SELECT content FROM articles WHERE slug = ?', (slug,)).fetchone()
+    return decode(row[0]) if row else None
+
+
+def set_content(conn, slug, html, codec=None):
+    """Update one article's body; returns the number of rows changed."""
+    codec = write_codec(conn) if codec is None else codec
+    cur = conn.execute('UPDATE articles SET content = ? WHERE slug = ?', (encode(html, codec), slug))
+    return cur.rowcount
+
+
+def iter_content(conn, columns='slug', where='', params=()):
+    """Yield (*columns, html) for every article, decoding bodies on the way."""
+    sql = f'SELECT {columns}, content FROM articles'
+    if where:
+        sql += ' WHERE ' + where
+    for row in conn.execute(sql, params):
+        yield (*row[:-1], decode(row[-1]))
+
+
+def migrate(conn, codec):
+    """Rewrite every body under `codec` and record it as the write codec."""
+    encode('', codec)  # fail early on an unavailable codec
+    rows = conn.execute('SELECT id, content FROM articles').fetchall()
+    conn.executemany('UPDATE articles SET content = ? WHERE id = ?',
+                     [(encode(decode(c), codec), i) for i, c in rows])
+    ensure_settings(conn)
+    conn.execute("INSERT OR REPLACE INTO settings (key, value) VALUES ('content_codec', ?)", (codec,))
+    conn.commit()
+    conn.execute('VACUUM')
+    return len(rows)
+
+
+def db_size(conn):
+    pages = conn.execute('PRAGMA page_count').fetchone()[0]
+    size = conn.execute('PRAGMA page_size').fetchone()[0]
+    return pages * size
+
+
+def bench(db_path=DB_PATH, rounds=5):
+    """Migrate temp copies of the DB to each codec and time full-body reads."""
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for codec in CODECS:
+            if codec == 'zstd' and zstandard is None:
+                continue
+            copy = os.path.join(tmp, f'{codec}.db')
+            shutil.copy2(db_path, copy)
+            conn = sqlite3.connect(copy)
+            migrate(conn, codec)
+            size = db_size(conn)
+            best = None
+            for _ in range(rounds):
+                t0 = time.perf_counter()
+                n = sum(1 for _ in iter_content(conn))
+                dt = time.perf_counter() - t0
+                best = dt if best is None else min(best, dt)
+            conn.close()
+            results.append((codec, size, n, best))
+    base = results[0][1]
+    print(f'{"codec":6} {"db size":>10} {"vs none":>8} {"read all":>10} {"per row":>9}')
+    for codec, size, n, t in results:
+        print(f'{codec:6} {size:>10} {size / base:>7.0%} {t * 1000:>8.1f}ms {t / max(n, 1) * 1e6:>7.1f}us')
+    return results
+
+
+if __name__ == '__main__':
+    p = argparse.ArgumentParser(description='Compress articles.content or benchmark codecs')
+    p.add_argument('--db', default=str(DB_PATH))
+    p.add_argument('--migrate', choices=CODECS, help='rewrite every row with this codec')
+    p.add_argument('--bench', action='store_true', help='compare DB size and read latency per codec')
+    args = p.parse_args()
+    if args.bench:
+        bench(args.db)
+    if args.migrate:
+        conn = sqlite3.connect(args.db)
+        before = db_size(conn)
+        n = migrate(conn, args.migrate)
+        print(f'Rewrote {n} rows as {args.migrate}: {before} -> {db_size(conn)} bytes')
+        conn.close()
+    if not args.bench and not args.migrate:
+        conn = sqlite3.connect(args.db)
+        print(f'content codec: {write_codec(conn)}, db size: {db_size(conn)} bytes')
+        conn.close()
@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""Shared date parsing for Facebook export and WordPress timestamps.
+
+Every script that turns a date string into a datetime goes through
+`parse_date`. The handful of formats that actually occur in the archive are
+matched with precompiled regexes; anything else falls back to
+`dateutil.parser.parse`. Results are memoized per input string, and inputs
+that needed the dateutil fallback are recorded so they can be reported and,
+if they recur, given a fast path of their own.
+
+Run from the repo root to see which article dates miss the fast paths:
+`python3 scripts/dates.py --articles articles`
+"""
+from collections import Counter
+from email.utils import parsedate_to_datetime
+from functools import lru_cache
+import argparse
+import datetime
+import re
+
+from dateutil import parser as dateparser
+
+MONTHS = {
+    'jan': 1, 'feb': 2, 'mar': 3, 'apr': 4, 'may': 5, 'jun': 6,
+    'jul': 7, 'aug': 8, 'sep': 9, 'sept': 9, 'oct': 10, 'nov': 11, 'dec': 12,
+}
+
+# "Aug 05, 2023 9:37:35 pm", "Saturday, August 5, 2023 at 9:37 PM", "June 6, 2010"
+FB_EN_RE = re.compile(
+    r'^(?:[A-Za-z]+,\s*)?([A-Za-z]{3,9})\.?\s+(\d{1,2}),?\s+(\d{4})'
+    r'(?:,?\s+(?:at\s+)?(\d{1,2}):(\d{2})(?::(\d{2}))?\s*([AaPp][Mm])?)?$'
+)
+# "2023年8月5日 下午9:37", "2023年8月5日星期六 21:37:35", "2010年6月6日"
+FB_ZH_RE = re.compile(
+    r'^(\d{4})年(\d{1,2})月(\d{1,2})日\s*(?:(?:星期|周)[一二三四五六日天])?'
+    r'\s*(?:(上午|下午|凌晨|早上|中午|晚上)?\s*(\d{1,2}):(\d{2})(?::(\d{2}))?)?$'
+)
+# article-date and WordPress display dates, filename tokens: "2008.03.23", "2010/06/06", "20080323"
+DOTTED_RE = re.compile(r'^(\d{4})[./](\d{1,2})[./](\d{1,2})$')
+COMPACT_RE = re.compile(r'^(\d{4})(\d{2})(\d{2})$')
+# "2008-03-23T16:10:23.000Z", "2023-09-06T00:00:00", "2010-06-06 09:53:00"
+ISO_RE = re.compile(r'^\d{4}-\d{2}-\d{2}(?:[T ]\d{2}:\d{2}(?::\d{2}(?:\.\d+)?)?)?(?:Z|[+-]\d{2}:?\d{2})?$')
+# WXR <pubDate>: "Sun, 06 Jun 2010 01:53:00 +0000"
+RFC822_RE = re.compile(r'^[A-Za-z]{3},\s+\d{1,2}\s+[A-Za-z]{3}\s+\d{4}\s+\d{2}:\d{2}(?::\d{2})?\s+(?:[+-]\d{4}|GMT|UTC)$')
+
+PM_ZH = ('下午', '晚上')
+
+hits = Counter()
+slow_inputs = Counter()
+
+
+def _to_24h(hour, ampm):
+    if not ampm:
+        return hour
+    pm = ampm.lower() == 'pm' or ampm in PM_ZH
+    if ampm == '中午':
+        pm = hour != 11
+    hour = hour % 12
+    return hour + 12 if pm else hour
+
+
+def _parse_en(m):
+    month = MONTHS.get(m.group(1).lower()[:4]) or MONTHS.get(m.group(1).lower()[:3])
+    if not month:
+        return None
+    hour = _to_24h(int(m.group(4) or 0), m.group(7))
+    return datetime.datetime(int(m.group(3)), month, int(m.group(2)),
+                             hour, int(m.group(5) or 0), int(m.group(6) or 0))
+
+
+def _parse_zh(m):
+    hour = _to_24h(int(m.group(5) or 0), m.group(4))
+    return datetime.datetime(int(m.group(1)), int(m.group(2)), int(m.group(3)),
+                             hour, int(m.group(6) or 0), int(m.group(7) or 0))
+
+
+def _parse_ymd(m):
+    return datetime.datetime(int(m.group(1)), int(m.group(2)), int(m.group(3)))
+
+
+def _parse_iso(m):
+    return datetime.datetime.fromisoformat(m.group(0))
+
+
+def _parse_rfc822(m):
+    return parsedate_to_datetime(m.group(0))
+
+
+FAST_PATHS = [
+    ('iso', ISO_RE, _parse_iso),
+    ('fb_en', FB_EN_RE, _parse_en),
+    ('fb_zh', FB_ZH_RE, _parse_zh),
+    ('compact', COMPACT_RE, _parse_ymd),
+    ('dotted', DOTTED_RE, _parse_ymd),
+    ('rfc822', RFC822_RE, _parse_rfc822),
+]
+
+
+@lru_cache(maxsize=8192)
+def _parse_cached(text):
+    for name, regex, func in FAST_PATHS:
+        m = regex.match(text)
+        if not m:
+            continue
+        try:
+            dt = func(m)
+        except (ValueError, TypeError):
+            dt = None
+        if dt is not None:
+            hits[name] += 1
+            return dt
+    hits['dateutil'] += 1
+    slow_inputs[text] += 1
+    try:
+        return dateparser.parse(text)
+    except (ValueError, OverflowError):
+        # memoize failures too, so recurring non-dates stay cheap
+        return None
+
+
+def parse_date(text):
+    """Parse `text` into a datetime, raising ValueError if it is not a date.
+
+    Drop-in replacement for `dateutil.parser.parse(text)` for the formats
+    used in this archive.
+    """
+    if text is None:
+        raise ValueError('no date string given')
+    text = ' '.join(str(text).split())
+    if not text:
+        raise ValueError('empty date string')
+    dt = _parse_cached(text)
+    if dt is None:
+        raise ValueError(f'unknown date format: {text!r}')
+    return dt
+
+
+def parse_date_or_none(text):
+    try:
+        return parse_date(text)
+    except ValueError:
+        return None
+
+
+def parse_token(name):
+    """Return the datetime for the first YYYYMMDD token in a file name."""
+    for tok in re.split(r'[_.\-]', name):
+        if len(tok) == 8 and tok.isdigit():
+            return parse_date_or_none(tok)
+    return None
+
+
+def stats():
+    info = _parse_cached.cache_info()
+    return {
+        'calls': info.hits + info.misses,
+        'memo_hits': info.hits,
+        'fast_paths': {k: v for k, v in hits.items() if k != 'dateutil'},
+        'slow_path': hits.get('dateutil', 0),
+    }
+
+
+def slow_path_inputs():
+    """Inputs that needed the dateutil fallback, most frequent first."""
+    return [t for t, _ in slow_inputs.most_common()]
+
+
+def report():
+    s = stats()
+    print(f"Parsed {s['calls']} date strings ({s['memo_hits']} memoized)")
+    for name, n in sorted(s['fast_paths'].items()):
+        print(f'  {name}: {n}')
+    print(f"  dateutil fallback: {s['slow_path']}")
+    for t in slow_path_inputs():
+        print('   -', t)
+
+
+DATE_SNIPPETS = [
+    re.compile(r'class="_a72d">([^<]+)<'),
+    re.compile(r'class="article-date">([^<]+)<'),
+]
+
+
+def scan_articles(articles_dir):
+    n = 0
+    from layout import iter_pages
+
+    for f in iter_pages('*.html', articles_dir):
+        text = f.read_text(encoding='utf-8', errors='ignore')
+        for regex in DATE_SNIPPETS:
+            for m in regex.finditer(text):
+                parse_date_or_none(m.group(1))
+                n += 1
+    return n
+
+
+if __name__ == '__main__':
+    p = argparse.ArgumentParser(description='Parse dates and report which inputs miss the fast paths')
+    p.add_argument('dates', nargs='*', help='date strings to parse')
+    p.add_argument('--articles', help='scan article files for date strings')
+    args = p.parse_args()
+    for d in args.dates:
+        print(repr(d), '->', parse_date_or_none(d))
+    if args.articles:
+        scan_articles(args.articles)
+    report()
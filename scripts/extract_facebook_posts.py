@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
 from bs4 import BeautifulSoup
-from dateutil import parser as dateparser
+from dates import parse_date
+from safe_write import write_text
 from pathlib import Path
 import argparse
 
@@ -30,7 +31,7 @@ def extract_posts(src_path, out_dir, chronological='asc'):
         date_div = sec.find('div', class_='_a72d')
         date_text = date_div.get_text(strip=True) if date_div else ''
         try:
-            dt = dateparser.parse(date_text)
+            dt = parse_date(date_text)
         except Exception:
             dt = None
         items.append((dt, i, sec))
@@ -78,7 +79,7 @@ def extract_posts(src_path, out_dir, chronological='asc'):
                     except Exception:
                         pass
         body = str(sec_copy)
-        path.write_text(TEMPLATE.format(title=title, body=body), encoding='utf-8')
+        write_text(path, TEMPLATE.format(title=title, body=body))
         written += 1
     return written
 
@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+"""Atom feed and per-year sitemaps built from articles.db.
+
+Writes, at the site root:
+
+  - `feed.xml`: Atom feed of the newest `--limit` posts with their excerpts
+  - `sitemap-YYYY.xml`: one sitemap per publication year, with `lastmod`
+    set to when the article page's content last changed
+  - `sitemap.xml`: the sitemap index pointing at the yearly files
+
+The article list comes from `migrate_db.LIST_QUERY`, which the
+`idx_articles_list` covering index answers without reading `content`; an
+unmigrated DB falls back to sorting on `pub_date`. Page URLs follow the
+articles layout (see layout.py), so they include the YYYY/MM shard once
+the archive is sharded.
+
+The `feed_state` table keeps, per article, a hash of its page, recomputed
+only when the page's size or mtime differ (the generator rewrites every
+page on each save, usually with the same bytes), and a signature over
+URL, title, date, excerpt and that hash. `lastmod` stays as recorded
+until the page hash changes. Only the yearly sitemaps that contain a new,
+changed or removed article are rendered again; the index and the
+feed are small and rendered every run but, like everything else, only
+written when their bytes change. Every file written gets `.gz` (and
+`.br` when the brotli module is installed) copies next to it for the
+servers to send as-is.
+
+Run from the repo root: `python3 scripts/feeds.py [--base-url https://example.org] [--limit 20] [--all]`
+"""
+from hashlib import sha1, sha256
+from pathlib import Path
+from urllib.parse import quote
+from xml.sax.saxutils import escape
+import argparse
+import datetime
+import gzip
+import sqlite3
+
+from layout import find_page
+from migrate_db import LIST_QUERY, columns, to_epoch
+from safe_write import WriteBatch, write_bytes, write_text
+
+try:
+    import brotli
+except Exception:
+    brotli = None
+
+ROOT = Path(__file__).resolve().parents[1]
+DB_PATH = ROOT / 'articles.db'
+BASE_URL = 'http://localhost:3000'
+SITE_TITLE = '天空之城'
+FEED_LIMIT = 20
+
+HASH_CHARS = 16
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS feed_state (
+    slug TEXT PRIMARY KEY,
+    year INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    page_hash TEXT NOT NULL,
+    sig TEXT NOT NULL,
+    lastmod TEXT NOT NULL
+);
+'''
+STATE_COLUMNS = 'slug, year, size, mtime, page_hash, sig, lastmod'
+
+
+def _iso(ts):
+    return datetime.datetime.fromtimestamp(ts, datetime.timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+def articles(conn):
+    """(slug, title, pub_date, pub_ts, excerpt) newest first."""
+    if 'pub_ts' in columns(conn):
+        rows = conn.execute(LIST_QUERY)
+        for _, slug, title, pub_date, ts, excerpt in rows:
+            yield slug, title, pub_date, ts if ts is not None else to_epoch(pub_date or ''), excerpt
+    else:
+        rows = conn.execute('SELECT slug, title, pub_date, excerpt FROM articles ORDER BY pub_date DESC, id DESC')
+        for slug, title, pub_date, excerpt in rows:
+            yield slug, title, pub_date, to_epoch(pub_date or ''), excerpt
+
+
+def _hash(path):
+    h = sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()[:HASH_CHARS]
+
+
+def collect(conn, base_url, known, root=ROOT):
+    """{slug: entry dict} for every article with a page and a parseable date, newest first.
+
+    `known` maps slug to its stored (year, size, mtime, page_hash, sig,
+    lastmod); pages whose size and mtime match keep their stored hash.
+    """
+    out = {}
+    for slug, title, pub_date, ts, excerpt in articles(conn):
+        if not slug or ts is None:
+            continue
+        page = find_page(slug)
+        try:
+            st = page.stat()
+        except FileNotFoundError:
+            continue
+        url = base_url + '/' + quote(page.relative_to(root).as_posix())
+        title, excerpt = title or slug, excerpt or ''
+        old = known.get(slug)
+        same_file = old is not None and (old[1], old[2]) == (st.st_size, st.st_mtime)
+        page_hash = old[3] if same_file else _hash(page)
+        # a byte-identical rewrite keeps the recorded lastmod
+        lastmod = old[5] if old is not None and old[3] == page_hash else _iso(st.st_mtime)
+        sig = sha1('\x1f'.join([url, title, pub_date or '', excerpt, page_hash])
+                   .encode('utf-8')).hexdigest()[:HASH_CHARS]
+        out[slug] = {'year': datetime.datetime.fromtimestamp(ts, datetime.timezone.utc).year, 'size': st.st_size,
+                     'mtime': st.st_mtime, 'page_hash': page_hash, 'sig': sig, 'lastmod': lastmod,
+                     'published': _iso(ts), 'url': url, 'title': title, 'excerpt': excerpt}
+    return out
+
+
+def render_sitemap(entries):
+    lines = ['<?xml version="1.0" encoding="UTF-8"?>',
+             '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">']
+    lines += [f"  <url><loc>{escape(e['url'])}</loc><lastmod>{e['lastmod']}</lastmod></url>" for e in entries]
+    lines.append('</urlset>')
+    return '\n'.join(lines) + '\n'
+
+
+def render_index(base_url, years):
+    lines = ['<?xml version="1.0" encoding="UTF-8"?>',
+             '<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">']
+    lines += [f'  <sitemap><loc>{escape(base_url)}/sitemap-{y}.xml</loc><lastmod>{lastmod}</lastmod></sitemap>'
+              for y, lastmod in sorted(years.items(), reverse=True)]
+    lines.append('</sitemapindex>')
+    return '\n'.join(lines) + '\n'
+
+
+def render_feed(base_url, entries):
+    updated = max((e['lastmod'] for e in entries), default=_iso(0))
+    lines = ['<?xml version="1.0" encoding="UTF-8"?>',
+             '<feed xmlns="http://www.w3.org/2005/Atom">',
+             f'  <title>{escape(SITE_TITLE)}</title>',
+             f'  <id>{escape(base_url)}/</id>',
+             f'  <link href="{escape(base_url)}/home.html"/>',
+             f'  <link rel="self" href="{escape(base_url)}/feed.xml"/>',
+             f'  <updated>{updated}</updated>']
+    for e in entries:
+        lines += ['  <entry>',
+                  f"    <title>{escape(e['title'])}</title>",
+                  f"    <id>{escape(e['url'])}</id>",
+                  f"    <link href=\"{escape(e['url'])}\"/>",
+                  f"    <published>{e['published']}</published>",
+                  f"    <updated>{e['lastmod']}</updated>",
+                  f"    <summary>{escape(e['excerpt'])}</summary>",
+                  '  </entry>']
+    lines.append('</feed>')
+    return '\n'.join(lines) + '\n'
+
+
+def _variants(path):
+    out = [(path.with_name(path.name + '.gz'), lambda b: gzip.compress(b, 9, mtime=0))]
+    if brotli is not None:
+        out.append((path.with_name(path.name + '.br'), lambda b: brotli.compress(b, quality=11)))
+    return out
+
+
+def write_xml(path, text):
+    """Write `path` and its precompressed copies; returns True if the XML changed."""
+    changed = write_text(path, text)
+    data = None
+    for variant, compress in _variants(path):
+        if changed or not variant.exists():
+            data = data if data is not None else text.encode('utf-8')
+            write_bytes(variant, compress(data))
+    return changed
+
+
+def remove_xml(path):
+    for p in (path, path.with_name(path.name + '.gz'), path.with_name(path.name + '.br')):
+        p.unlink(missing_ok=True)
+
+
+def build(base_url=BASE_URL, limit=FEED_LIMIT, everything=False, db_path=DB_PATH, out_dir=ROOT):
+    base_url = base_url.rstrip('/')
+    out_dir = Path(out_dir)
+    conn = sqlite3.connect(str(db_path))
+    if 'page_hash' not in columns(conn, 'feed_state'):
+        conn.execute('DROP TABLE IF EXISTS feed_state')  # older layout; it only caches state
+    conn.executescript(SCHEMA)
+    known = {r[0]: r[1:] for r in conn.execute(f'SELECT {STATE_COLUMNS} FROM feed_state')}
+    current = collect(conn, base_url, known)
+
+    dirty = set()
+    for slug, e in current.items():
+        old = known.get(slug)
+        if old is None or (old[0], old[4]) != (e['year'], e['sig']):
+            dirty.add(e['year'])
+            if old is not None:
+                dirty.add(old[0])
+    dirty.update(old[0] for slug, old in known.items() if slug not in current)
+    by_year = {}
+    for e in current.values():
+        by_year.setdefault(e['year'], []).append(e)
+    dirty.update(y for y in by_year if everything or not (out_dir / f'sitemap-{y}.xml').exists())
+
+    written = []
+    with WriteBatch():
+        for y in sorted(dirty):
+            path = out_dir / f'sitemap-{y}.xml'
+            if y not in by_year:
+                remove_xml(path)
+                written.append(path)
+            elif write_xml(path, render_sitemap(by_year[y])):
+                written.append(path)
+        years = {y: max(e['lastmod'] for e in entries) for y, entries in by_year.items()}
+        for path, text in ((out_dir / 'sitemap.xml', render_index(base_url, years)),
+                           (out_dir / 'feed.xml', render_feed(base_url, list(current.values())[:limit]))):
+            if write_xml(path, text):
+                written.append(path)
+
+    conn.executemany('DELETE FROM feed_state WHERE slug = ?', [(s,) for s in known if s not in current])
+    rows = [(s, e['year'], e['size'], e['mtime'], e['page_hash'], e['sig'], e['lastmod'])
+            for s, e in current.items()]
+    conn.executemany(f'INSERT OR REPLACE INTO feed_state ({STATE_COLUMNS}) VALUES (?,?,?,?,?,?,?)',
+                     [r for r in rows if known.get(r[0]) != r[1:]])
+    conn.commit()
+    conn.close()
+    return len(current), len(by_year), sorted(dirty), written
+
+
+if __name__ == '__main__':
+    p = argparse.ArgumentParser(description='Build feed.xml and per-year sitemaps from articles.db')
+    p.add_argument('--base-url', default=BASE_URL, help='absolute site URL used in the feed and sitemaps')
+    p.add_argument('--limit', type=int, default=FEED_LIMIT, help='posts in feed.xml')
+    p.add_argument('--all', action='store_true', help='rewrite every yearly sitemap')
+    p.add_argument('--db', default=str(DB_PATH))
+    args = p.parse_args()
+    n, years, dirty, written = build(args.base_url, args.limit, args.all, args.db)
+    print(f'{n} articles in {years} yearly sitemaps; rebuilt {len(dirty)} years'
+          f"{' (' + ', '.join(map(str, dirty)) + ')' if dirty else ''}, wrote {len(written)} files")
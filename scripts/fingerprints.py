@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+"""Content fingerprints for article files, stored in `articles.db`.
+
+Each post is parsed once and reduced to:
+  - the length of its visible text and an `empty` flag (the old
+    `is_empty_post` rules: the "posted something via Microsoft" stub title,
+    or fewer than 30 characters of content)
+  - a 64-bit SimHash over character 3-gram shingles of that text, which
+    works for Chinese posts without spaces as well as English ones
+  - a 64-bit dHash per local image (needs Pillow; skipped otherwise)
+
+Rows are keyed by file name and reused while the file's size and mtime are
+unchanged, so reruns only parse new or edited posts. Duplicate clusters are
+found by bucketing hashes into 16-bit bands (LSH) and comparing only posts
+that share a bucket, instead of comparing every pair.
+
+Run from the repo root: `python3 scripts/fingerprints.py` to refresh the
+table and list duplicate clusters.
+"""
+from collections import defaultdict
+from hashlib import blake2b
+from pathlib import Path
+import argparse
+import sqlite3
+
+from bs4 import BeautifulSoup
+
+from check_links import resolve_local
+from layout import find_page, iter_pages
+
+try:
+    from PIL import Image
+except Exception:
+    Image = None
+
+ROOT = Path(__file__).resolve().parents[1]
+ART_DIR = ROOT / 'articles'
+DB_PATH = ROOT / 'articles.db'
+
+EMPTY_TITLE = 'Yao Min posted something via Microsoft'
+MIN_TEXT = 30
+SHINGLE = 3
+TEXT_DISTANCE = 3
+IMAGE_DISTANCE = 4
+MIN_SHARED = 2
+BANDS = 4
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS fingerprints (
+    name TEXT PRIMARY KEY,
+    size INTEGER,
+    mtime REAL,
+    text_len INTEGER,
+    empty INTEGER,
+    image_count INTEGER,
+    simhash TEXT,
+    image_hashes TEXT
+)
+'''
+
+
+def ensure_schema(conn):
+    conn.execute(SCHEMA)
+
+
+def _h64(s):
+    return int.from_bytes(blake2b(s.encode('utf-8'), digest_size=8).digest(), 'big')
+
+
+def simhash(text):
+    t = ''.join(text.split()).lower()
+    if not t:
+        return 0
+    grams = {t[i:i + SHINGLE] for i in range(max(1, len(t) - SHINGLE + 1))}
+    v = [0] * 64
+    for g in grams:
+        h = _h64(g)
+        for bit in range(64):
+            v[bit] += 1 if h >> bit & 1 else -1
+    return sum(1 << bit for bit in range(64) if v[bit] > 0)
+
+
+def dhash(path, size=8):
+    """Difference hash: compare adjacent pixels of a (size+1)x size greyscale thumbnail."""
+    with Image.open(path) as im:
+        px = list(im.convert('L').resize((size + 1, size)).getdata())
+    bits = 0
+    for row in range(size):
+        for col in range(size):
+            i = row * (size + 1) + col
+            bits = bits << 1 | (px[i] > px[i + 1])
+    return bits
+
+
+def hamming(a, b):
+    return bin(a ^ b).count('1')
+
+
+def fingerprint_file(path):
+    path = Path(path)
+    soup = BeautifulSoup(path.read_text(encoding='utf-8', errors='ignore'), 'html.parser')
+    # the normalized h1 and the h2 of the original facebook section may each carry the stub title
+    titles = [soup.find('h1', class_='article-title'), soup.find('h2')]
+    content = soup.find(class_='article-content') or soup.find('section')
+    text = ''.join(content.stripped_strings) if content else ''
+    empty = any(t is not None and EMPTY_TITLE in t.get_text() for t in titles) or \
+        (content is not None and len(text) < MIN_TEXT)
+    imgs = content.find_all('img') if content is not None else []
+    images = []
+    if Image is not None:
+        for img in imgs:
+            src = img.get('src') or ''
+            if not src or src.startswith(('http://', 'https://', '//', 'data:')):
+                continue
+            target = resolve_local(src, path)
+            try:
+                images.append(dhash(target))
+            except Exception:
+                continue
+    return {
+        'text_len': len(text),
+        'empty': empty,
+        'image_count': len(imgs),
+        'simhash': simhash(text),
+        'image_hashes': images,
+    }
+
+
+def _row_to_fp(row):
+    text_len, empty, image_count, sh, imgs = row
+    return {
+        'text_len': text_len,
+        'empty': bool(empty),
+        'image_count': image_count,
+        'simhash': int(sh, 16),
+        'image_hashes': [int(h, 16) for h in imgs.split()] if imgs else [],
+    }
+
+
+def update(files, conn):
+    """Fingerprint `files`, reusing stored rows whose size/mtime still match."""
+    ensure_schema(conn)
+    stored = {r[0]: r[1:] for r in conn.execute(
+        'SELECT name, size, mtime, text_len, empty, image_count, simhash, image_hashes FROM fingerprints')}
+    out = {}
+    fresh = 0
+    for f in files:
+        st = f.stat()
+        row = stored.get(f.name)
+        if row and row[0] == st.st_size and row[1] == st.st_mtime:
+            out[f.name] = _row_to_fp(row[2:])
+            continue
+        fp = fingerprint_file(f)
+        conn.execute(
+            'INSERT OR REPLACE INTO fingerprints '
+            '(name, size, mtime, text_len, empty, image_count, simhash, image_hashes) VALUES (?,?,?,?,?,?,?,?)',
+            (f.name, st.st_size, st.st_mtime, fp['text_len'], int(fp['empty']), fp['image_count'],
+             f"{fp['simhash']:016x}", ' '.join(f'{h:016x}' for h in fp['image_hashes'])))
+        out[f.name] = fp
+        fresh += 1
+    conn.commit()
+    return out, fresh
+
+
+def _bands(h):
+    width = 64 // BANDS
+    mask = (1 << width) - 1
+    return [(i, h >> (i * width) & mask) for i in range(BANDS)]
+
+
+def _shared_images(a, b):
+    """Images of `a` with a near-identical image in `b`."""
+    return sum(1 for ha in a if any(hamming(ha, hb) <= IMAGE_DISTANCE for hb in b))
+
+
+def duplicate_clusters(fps):
+    """Group near-duplicate posts; returns lists of names, oldest name first.
+
+    Posts sharing a near-identical image are only candidates: they are
+    duplicates if their text SimHashes are within TEXT_DISTANCE, or if at
+    least MIN_SHARED images and a majority of each post's images match, so
+    one reused photo does not merge two different posts. Posts without
+    images are duplicates when their (non-empty) text is within
+    TEXT_DISTANCE. Empty posts are handled by the `empty` flag instead.
+    """
+    parent = {n: n for n in fps}
+
+    def find(n):
+        while parent[n] != n:
+            parent[n] = parent[parent[n]]
+            n = parent[n]
+        return n
+
+    def union(a, b):
+        ra, rb = find(a), find(b)
+        if ra != rb:
+            parent[max(ra, rb)] = min(ra, rb)
+
+    def candidates(items, distance):
+        buckets = defaultdict(list)
+        for name, h in items:
+            for band in _bands(h):
+                buckets[band].append((name, h))
+        pairs = set()
+        for members in buckets.values():
+            for i, (a, ha) in enumerate(members):
+                for b, hb in members[i + 1:]:
+                    if a != b and hamming(ha, hb) <= distance:
+                        pairs.add((min(a, b), max(a, b)))
+        return pairs
+
+    def same_images(a, b):
+        ia, ib = fps[a]['image_hashes'], fps[b]['image_hashes']
+        shared = min(_shared_images(ia, ib), _shared_images(ib, ia))
+        return shared >= MIN_SHARED and 2 * shared > max(len(ia), len(ib))
+
+    def same_text(a, b):
+        return not (fps[a]['empty'] or fps[b]['empty']) and \
+            hamming(fps[a]['simhash'], fps[b]['simhash']) <= TEXT_DISTANCE
+
+    for a, b in candidates([(n, h) for n, fp in fps.items() for h in fp['image_hashes']], IMAGE_DISTANCE):
+        if same_text(a, b) or same_images(a, b):
+            union(a, b)
+    for a, b in candidates([(n, fp['simhash']) for n, fp in fps.items()
+                            if not fp['image_count'] and not fp['empty']], TEXT_DISTANCE):
+        union(a, b)
+
+    groups = defaultdict(list)
+    for n in fps:
+        groups[find(n)].append(n)
+    return [sorted(g) for g in groups.values() if len(g) > 1]
+
+
+def fingerprint_dir(articles_dir=ART_DIR, pattern='article_fb_*.html', db_path=DB_PATH):
+    files = list(iter_pages(pattern, articles_dir))
+    conn = sqlite3.connect(str(db_path))
+    try:
+        fps, fresh = update(files, conn)
+        # forget posts that have been moved out of the directory
+        gone = [n for (n,) in conn.execute('SELECT name FROM fingerprints')
+                if not find_page(Path(n).stem, articles_dir).exists()]
+        conn.executemany('DELETE FROM fingerprints WHERE name = ?', [(n,) for n in gone])
+        conn.commit()
+    finally:
+        conn.close()
+    return fps, fresh
+
+
+if __name__ == '__main__':
+    p = argparse.ArgumentParser(description='Fingerprint posts and list empty / duplicate ones')
+    p.add_argument('--articles', default=str(ART_DIR))
+    p.add_argument('--pattern', default='article_fb_*.html')
+    p.add_argument('--db', default=str(DB_PATH))
+    args = p.parse_args()
+    fps, fresh = fingerprint_dir(args.articles, args.pattern, args.db)
+    print(f'Fingerprinted {len(fps)} posts ({fresh} parsed, {len(fps) - fresh} reused)')
+    empties = sorted(n for n, fp in fps.items() if fp['empty'])
+    print(f'Empty: {len(empties)}')
+    for n in empties:
+        print(' -', n)
+    clusters = duplicate_clusters(fps)
+    print(f'Duplicate clusters: {len(clusters)}')
+    for c in clusters:
+        print(' -', c[0], '<=', ', '.join(c[1:]))
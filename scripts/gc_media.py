@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""Garbage-collect unreferenced media and stale backup copies.
+
+Builds one reference set from every live article page, `home.html` and the
+`content` column of `articles.db`, then lists media under
+`articles/facebook_media` and `articles/media` that nothing points at, plus
+`.wpback` / `.wphtml` / `.bak` copies sitting next to the articles. Media
+that is only used by posts moved into `articles/removed_empty_fb` counts as
+unreferenced.
+
+Dry-run by default. `--apply` moves the candidates into a quarantine
+directory (relative paths preserved, so a move back restores them);
+`--delete` removes them outright.
+
+Run from the repo root: `python3 scripts/gc_media.py [--apply | --delete]`
+"""
+from pathlib import Path
+import argparse
+import datetime
+import shutil
+import sqlite3
+import time
+
+from check_links import extract_refs, is_remote, resolve_local, MEDIA_EXTS
+from content_store import iter_content
+from layout import iter_pages
+from media_index import MEDIA_DIRS, forget
+
+ROOT = Path(__file__).resolve().parents[1]
+ART_DIR = ROOT / 'articles'
+DB_PATH = ROOT / 'articles.db'
+HOME = ROOT / 'home.html'
+BACKUP_SUFFIXES = ('.wpback', '.wphtml', '.bak')
+QUARANTINE_DIR = ROOT / '.gc_quarantine'
+
+
+def live_pages():
+    pages = list(iter_pages('*.html', ART_DIR))
+    if HOME.exists():
+        pages.append(HOME)
+    return pages
+
+
+def reference_set(db_path=DB_PATH):
+    """Resolved local paths referenced by live pages or by DB content."""
+    refs = set()
+
+    def add(text, page):
+        for ref in extract_refs(text):
+            if not is_remote(ref):
+                target = resolve_local(ref, page)
+                if target is not None:
+                    refs.add(target)
+
+    for page in live_pages():
+        add(page.read_text(encoding='utf-8', errors='ignore'), page)
+    if Path(db_path).exists():
+        conn = sqlite3.connect(str(db_path))
+        # content is rendered into articles/<slug>.html, so resolve from there
+        for slug, content in iter_content(conn):
+            if content and slug:
+                add(content, ART_DIR / f'{slug}.html')
+        conn.close()
+    return refs
+
+
+def unreferenced_media(refs):
+    out = []
+    for d in MEDIA_DIRS:
+        if not d.exists():
+            continue
+        for f in d.rglob('*'):
+            if f.is_file() and f.suffix.lower() in MEDIA_EXTS and f.resolve() not in refs:
+                out.append(f)
+    return sorted(out)
+
+
+def stale_backups(min_age_days=0):
+    cutoff = time.time() - min_age_days * 86400
+    out = []
+    for suffix in BACKUP_SUFFIXES:
+        for f in iter_pages('*' + suffix, ART_DIR):
+            if f.stat().st_mtime <= cutoff:
+                out.append(f)
+    if HOME.with_suffix('.html.bak').exists():
+        out.append(HOME.with_suffix('.html.bak'))
+    return sorted(out)
+
+
+def human(n):
+    if n < 1024:
+        return f'{n} B'
+    for unit in ('KB', 'MB', 'GB'):
+        n /= 1024
+        if n < 1024 or unit == 'GB':
+            return f'{n:.1f} {unit}'
+
+
+def collect(min_age_days=0, db_path=DB_PATH):
+    refs = reference_set(db_path)
+    return {'media': unreferenced_media(refs), 'backups': stale_backups(min_age_days)}
+
+
+def quarantine(files, dest_root):
+    for f in files:
+        dest = dest_root / f.relative_to(ROOT)
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        shutil.move(str(f), str(dest))
+
+
+def main(apply=False, delete=False, min_age_days=0, include=('media', 'backups')):
+    found = collect(min_age_days)
+    files = []
+    total = 0
+    for kind in include:
+        size = sum(f.stat().st_size for f in found[kind])
+        total += size
+        print(f'{kind}: {len(found[kind])} files, {human(size)}')
+        for f in found[kind]:
+            print('  ', f.relative_to(ROOT))
+        files.extend(found[kind])
+    if delete or apply:
+        forget(files)
+    if delete:
+        for f in files:
+            f.unlink()
+        print(f'Deleted {len(files)} files, reclaimed {human(total)}')
+    elif apply:
+        dest = QUARANTINE_DIR / datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
+        quarantine(files, dest)
+        print(f'Moved {len(files)} files ({human(total)}) to {dest.relative_to(ROOT)}')
+    else:
+        print(f'Dry run: {len(files)} files, {human(total)} reclaimable (use --apply or --delete)')
+    return files, total
+
+
+if __name__ == '__main__':
+    p = argparse.ArgumentParser(description='List or remove unreferenced media and stale backups')
+    g = p.add_mutually_exclusive_group()
+    g.add_argument('--apply', action='store_true', help='move candidates into .gc_quarantine/<timestamp>/')
+    g.add_argument('--delete', action='store_true', help='delete candidates permanently')
+    p.add_argument('--min-age', type=float, default=0, help='only collect backups older than this many days')
+    p.add_argument('--only', choices=['media', 'backups'], help='restrict to one kind of candidate')
+    args = p.parse_args()
+    kinds = (args.only,) if args.only else ('media', 'backups')
+    main(args.apply, args.delete, args.min_age, kinds)
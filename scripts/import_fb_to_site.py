@@ -4,6 +4,10 @@ from bs4 import BeautifulSoup
 import shutil
 import argparse
 
+from layout import page_path, relink
+from media_index import record
+from safe_write import write_text
+
 
 def import_posts(extracted_dir, site_articles_dir):
     extracted = Path(extracted_dir)
@@ -13,6 +17,7 @@ def import_posts(extracted_dir, site_articles_dir):
     articles.mkdir(parents=True, exist_ok=True)
     media_src = extracted / 'media'
     media_dst = articles / 'facebook_media'
+    copied = []
     # copy media tree if exists
     if media_src.exists():
         if media_dst.exists():
@@ -23,15 +28,18 @@ def import_posts(extracted_dir, site_articles_dir):
                     dest = media_dst / rel
                     dest.parent.mkdir(parents=True, exist_ok=True)
                     shutil.copy2(src, dest)
+                    copied.append(dest)
         else:
             shutil.copytree(media_src, media_dst)
+            copied.extend(f for f in media_dst.rglob('*') if f.is_file())
 
     count = 0
+    pages = []
     for f in sorted(extracted.glob('*.html')):
         # skip if somehow target exists
         orig_name = f.name
-        target_name = f'article_fb_{orig_name}'
-        target_path = articles / target_name
+        target_path = page_path(f'article_fb_{f.stem}', articles)
+        target_path.parent.mkdir(parents=True, exist_ok=True)
         html = f.read_text(encoding='utf-8', errors='ignore')
         soup = BeautifulSoup(html, 'html.parser')
         # fix local media paths: media/... -> facebook_media/...
@@ -47,8 +55,10 @@ def import_posts(extracted_dir, site_articles_dir):
                     else:
                         remainder = val
                     tag[attr] = str(Path('facebook_media') / remainder)
-        target_path.write_text(str(soup), encoding='utf-8')
+        write_text(target_path, relink(str(soup), articles, target_path.parent))
+        pages.append(target_path)
         count += 1
+    record(copied, pages)
     return count
 
 
@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+"""Bulk-import WordPress posts into articles.db.
+
+Sources (any combination):
+  --wxr export.xml        a WordPress WXR export, streamed with iterparse
+  --loaddata loaddata.txt subject/target/from triples; `from` is fetched and
+                          the post is stored under the slug of `target`
+  --urls list.txt         one post URL per line
+
+URLs are read from a local mirror rather than the live blog when
+`--mirror DIR` (wget -m layout: DIR/<host>/<path>/index.html) or
+`--mirror-url http://localhost:8000` is given.
+
+Pages are fetched and parsed in a process pool. Each batch of posts is
+written in one transaction together with its rows in `import_progress`
+(so an interrupted run resumes where it stopped; `--force` re-imports) and
+its remote images in `image_queue`, which
+`process_wp_images.py --from-queue` drains once the pages are generated.
+
+Run from the repo root:
+`python3 scripts/import_wordpress.py --loaddata loaddata.txt --mirror-url http://localhost:8000`
+"""
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from urllib.parse import unquote, urlsplit
+import argparse
+import datetime
+import re
+import sqlite3
+import urllib.request
+import xml.etree.ElementTree as ET
+
+from bs4 import BeautifulSoup
+
+from content_store import encode, write_codec
+from dates import parse_date_or_none
+from text_stats import html_to_text, make_excerpt
+
+ROOT = Path(__file__).resolve().parents[1]
+DB_PATH = ROOT / 'articles.db'
+
+WXR_NS = {
+    'content': 'http://purl.org/rss/1.0/modules/content/',
+    'wp': 'http://wordpress.org/export/1.2/',
+}
+STRIP_SELECTORS = ['.sharedaddy', '#jp-post-flair', '.jp-relatedposts', 'script', 'style']
+URL_DATE_RE = re.compile(r'/(\d{4})/(\d{2})/(\d{2})/')
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS import_progress (
+    source TEXT PRIMARY KEY,
+    slug TEXT,
+    status TEXT NOT NULL,
+    error TEXT,
+    updated TEXT
+);
+CREATE TABLE IF NOT EXISTS image_queue (
+    slug TEXT NOT NULL,
+    src TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    PRIMARY KEY (slug, src)
+);
+'''
+
+
+def make_slug(pub_date, title):
+    """Same slug as admin_server.js generateSlug: article_YYYYMMDD_<title hash>."""
+    h = 0
+    units = title.encode('utf-16-le')
+    for i in range(0, len(units), 2):
+        h = ((h << 5) - h + int.from_bytes(units[i:i + 2], 'little')) & 0xFFFFFFFF
+    if h >= 0x80000000:
+        h -= 0x100000000
+    return f'article_{pub_date.strftime("%Y%m%d")}_{abs(h)}'
+
+
+def parse_loaddata(path):
+    """Yield dicts with subject/target/from from a loaddata.txt file."""
+    entry = {}
+    for line in Path(path).read_text(encoding='utf-8').splitlines() + ['']:
+        m = re.match(r'\s*(subject|target|from)\s*:\s*(.*)$', line)
+        if m:
+            entry[m.group(1)] = m.group(2).strip()
+        elif entry:
+            if 'from' in entry:
+                yield entry
+            entry = {}
+    if entry.get('from'):
+        yield entry
+
+
+def mirror_location(url, mirror=None, mirror_url=None):
+    if mirror_url:
+        parts = urlsplit(url)
+        return mirror_url.rstrip('/') + parts.path
+    if mirror:
+        parts = urlsplit(url)
+        local = Path(mirror) / parts.netloc / unquote(parts.path).lstrip('/')
+        return str(local / 'index.html') if url.endswith('/') else str(local)
+    return url
+
+
+def fetch(location):
+    if location.startswith(('http://', 'https://')):
+        req = urllib.request.Request(location, headers={'User-Agent': 'skycity-import'})
+        with urllib.request.urlopen(req, timeout=30) as r:
+            return r.read().decode('utf-8', errors='ignore')
+    return Path(location).read_text(encoding='utf-8', errors='ignore')
+
+
+def parse_post_html(html, url):
+    soup = BeautifulSoup(html, 'html.parser')
+    title_el = soup.select_one('.entry-title') or soup.find('h1') or soup.find('title')
+    title = title_el.get_text(strip=True) if title_el else ''
+    candidates = []
+    t = soup.find('time')
+    if t is not None and t.get('datetime'):
+        candidates.append(t['datetime'])
+    date_el = soup.select_one('.entry-date') or t
+    if date_el is not None:
+        candidates.append(date_el.get_text(strip=True))
+    date = next(filter(None, map(parse_date_or_none, candidates)), None)
+    if date is None:
+        m = URL_DATE_RE.search(url)
+        if m:
+            date = datetime.datetime(int(m.group(1)), int(m.group(2)), int(m.group(3)))
+    content = soup.select_one('.entry-content')
+    if content is None:
+        raise ValueError('no .entry-content in page')
+    for sel in STRIP_SELECTORS:
+        for el in content.select(sel):
+            el.decompose()
+    return title, date, ''.join(str(c) for c in content.contents).strip()
+
+
+def load_job(job):
+    """Worker: fetch and parse one URL job. Runs in a subprocess."""
+    source, location, slug = job['source'], job['location'], job.get('slug')
+    try:
+        title, date, content = parse_post_html(fetch(location), source)
+        return {'source': source, 'slug': slug, 'title': title or job.get('subject', ''),
+                'date': date, 'content': content}
+    except Exception as e:
+        return {'source': source, 'slug': slug, 'error': f'{type(e).__name__}: {e}'}
+
+
+def iter_wxr(path):
+    """Yield published posts from a WXR export without loading it all."""
+    for _, el in ET.iterparse(str(path), events=('end',)):
+        if el.tag != 'item':
+            continue
+        if el.findtext('wp:post_type', '', WXR_NS) == 'post' and \
+                el.findtext('wp:status', 'publish', WXR_NS) == 'publish':
+            date = parse_date_or_none(el.findtext('wp:post_date', '', WXR_NS)) or \
+                parse_date_or_none(el.findtext('pubDate', ''))
+            yield {
+                'source': el.findtext('link', '') or el.findtext('guid', ''),
+                'slug': None,
+                'title': el.findtext('title', ''),
+                'date': date,
+                'content': el.findtext('content:encoded', '', WXR_NS),
+            }
+        el.clear()
+
+
+def remote_images(content):
+    return sorted(set(re.findall(r'<img[^>]+src=["\'](https?:)?(//[^"\']+)["\']', content, re.I)))
+
+
+def store_batch(conn, posts, codec):
+    """Write one batch of parsed posts, their progress rows and image queue in one transaction."""
+    now = datetime.datetime.now().isoformat(timespec='seconds')
+    done = failed = 0
+    with conn:
+        for post in posts:
+            if 'error' in post or not post.get('date'):
+                conn.execute('INSERT OR REPLACE INTO import_progress VALUES (?,?,?,?,?)',
+                             (post['source'], post.get('slug'), 'failed',
+                              post.get('error', 'no publish date'), now))
+                failed += 1
+                continue
+            slug = post['slug'] or make_slug(post['date'], post['title'])
+            conn.execute(
+                'INSERT INTO articles (title, content, pub_date, slug, excerpt) VALUES (?,?,?,?,?) '
+                'ON CONFLICT(slug) DO UPDATE SET title = excluded.title, content = excluded.content, '
+                'excerpt = excluded.excerpt, pub_date = COALESCE(articles.pub_date, excluded.pub_date)',
+                (post['title'], encode(post['content'], codec), post['date'].isoformat(), slug,
+                 make_excerpt(html_to_text(post['content']), 160)))
+            conn.executemany('INSERT OR IGNORE INTO image_queue (slug, src) VALUES (?, ?)',
+                             [(slug, (scheme or 'https:') + rest) for scheme, rest in remote_images(post['content'])])
+            conn.execute('INSERT OR REPLACE INTO import_progress VALUES (?,?,?,?,?)',
+                         (post['source'], slug, 'done', None, now))
+            done += 1
+    return done, failed
+
+
+def batched(items, size):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def run(jobs, wxr_posts, db_path=DB_PATH, workers=4, batch_size=500, force=False):
+    conn = sqlite3.connect(str(db_path))
+    conn.executescript(SCHEMA)
+    codec = write_codec(conn)
+    finished = set() if force else {s for (s,) in conn.execute(
+        "SELECT source FROM import_progress WHERE status = 'done'")}
+    skipped = [0]
+
+    def pending(items):
+        for item in items:
+            if item['source'] in finished:
+                skipped[0] += 1
+            else:
+                yield item
+
+    jobs = list(pending(jobs))
+    total_done = total_failed = 0
+    for batch in batched(pending(wxr_posts), batch_size):
+        d, f = store_batch(conn, batch, codec)
+        total_done += d
+        total_failed += f
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        results = pool.map(load_job, jobs, chunksize=8)
+        for batch in batched(results, batch_size):
+            d, f = store_batch(conn, batch, codec)
+            total_done += d
+            total_failed += f
+            print(f'  {total_done} imported, {total_failed} failed')
+    queued = conn.execute("SELECT COUNT(1) FROM image_queue WHERE status = 'pending'").fetchone()[0]
+    conn.close()
+    return total_done, total_failed, skipped[0], queued
+
+
+def build_jobs(args):
+    jobs = []
+    if args.loaddata:
+        for e in parse_loaddata(args.loaddata):
+            target = e.get('target', '')
+            slug = Path(urlsplit(target).path).stem if target else None
+            jobs.append({'source': e['from'], 'slug': slug or None, 'subject': e.get('subject', ''),
+                         'location': mirror_location(e['from'], args.mirror, args.mirror_url)})
+    if args.urls:
+        for line in Path(args.urls).read_text(encoding='utf-8').splitlines():
+            url = line.strip()
+            if url and not url.startswith('#'):
+                jobs.append({'source': url, 'location': mirror_location(url, args.mirror, args.mirror_url)})
+    return jobs
+
+
+if __name__ == '__main__':
+    p = argparse.ArgumentParser(description='Bulk-import WordPress posts into articles.db')
+    p.add_argument('--wxr', help='WordPress WXR export file')
+    p.add_argument('--loaddata', help='loaddata.txt with subject/target/from triples')
+    p.add_argument('--urls', help='file with one post URL per line')
+    p.add_argument('--mirror', help='directory holding a wget -m mirror of the blog')
+    p.add_argument('--mirror-url', help='base URL of a local server mirroring the blog')
+    p.add_argument('--db', default=str(DB_PATH))
+    p.add_argument('--workers', type=int, default=4)
+    p.add_argument('--batch', type=int, default=500, help='posts per transaction')
+    p.add_argument('--force', action='store_true', help='re-import sources already marked done')
+    args = p.parse_args()
+    if not (args.wxr or args.loaddata or args.urls):
+        p.error('give at least one of --wxr, --loaddata, --urls')
+    jobs = build_jobs(args)
+    wxr_posts = iter_wxr(args.wxr) if args.wxr else iter(())
+    done, failed, skipped, queued = run(jobs, wxr_posts, args.db, args.workers, args.batch, args.force)
+    print(f'Imported {done} posts ({failed} failed, {skipped} already done); {queued} images queued for localization')
@@ -1,20 +1,37 @@
 #!/usr/bin/env python3
 from pathlib import Path
 from bs4 import BeautifulSoup
-from dateutil import parser as dateparser
+from dates import parse_date, parse_date_or_none
+from html.parser import HTMLParser
 import argparse
+import hashlib
 import html
+import re
+import sqlite3
+import zlib
 
+from content_store import iter_content
+from layout import iter_pages
+from safe_write import copy_file, write_text
+from text_stats import WS_RE, article_text, make_excerpt
+
+DB_PATH = Path(__file__).resolve().parents[1] / 'articles.db'
 CARD_CLASSES = ['card--blue','card--teal','card--rust','card--moss','card--gold','card--sky']
+MARK_START = '<!-- FB-IMPORT-START -->'
+MARK_END = '<!-- FB-IMPORT-END -->'
+GRID_MARKER = '<div class="diary-grid" id="diary-grid">'
+CARD_KEY_RE = re.compile(r'data-slug="([^"]+)" data-hash="([0-9a-f]+)"')
+ONCLICK_RE = re.compile(r"window\.location\.href='articles/([^']+)\.html'")
 
-def make_card_html(fname, title, date, excerpt, cls):
+def make_card_html(fname, title, date, excerpt, cls, card_hash=''):
     year = date.strftime('%Y')
     month = date.strftime('%m')
     date_str = date.strftime('%Y.%m.%d')
     safe_title = html.escape(title)
     safe_excerpt = html.escape(excerpt)
     onclick = f"window.location.href='articles/{fname}'"
-    return f'''    <div class="diary-card {cls} reveal" 
+    slug = Path(fname).stem if fname.endswith('.html') else fname
+    return f'''    <div class="diary-card {cls} reveal" data-slug="{slug}" data-hash="{card_hash}"
          data-year="{year}" 
          data-month="{month}"
          onclick="{onclick}">
@@ -26,23 +43,57 @@ def make_card_html(fname, title, date, excerpt, cls):
     </div>
 '''
 
+class _PostText(HTMLParser):
+    """Text of the `._2pin` post blocks of a Facebook export, without the `._a7ng` media cells."""
+    VOID = {'img', 'br', 'hr', 'input', 'meta', 'link', 'source', 'wbr', 'area', 'col', 'embed', 'param', 'track'}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.stack, self.parts, self.seen = [], [], False
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.VOID:
+            return
+        classes = (dict(attrs).get('class') or '').split()
+        kind = 'pin' if '_2pin' in classes else 'media' if '_a7ng' in classes else None
+        self.seen |= kind == 'pin'
+        self.stack.append((tag, kind))
+        self.parts.append(' ')
+
+    def handle_endtag(self, tag):
+        for i in range(len(self.stack) - 1, -1, -1):
+            if self.stack[i][0] == tag:
+                del self.stack[i:]
+                break
+        self.parts.append(' ')
+
+    def handle_data(self, data):
+        kinds = [k for _, k in self.stack]
+        if 'pin' in kinds and 'media' not in kinds:
+            self.parts.append(data)
+
+
+def post_text(body):
+    """The post's own text: its `._2pin` blocks, or the article text for non-Facebook markup."""
+    p = _PostText()
+    p.feed(body or '')
+    p.close()
+    return WS_RE.sub(' ', ''.join(p.parts)).strip() if p.seen else article_text(body)
+
+
 def extract_meta(article_path):
     text = Path(article_path).read_text(encoding='utf-8', errors='ignore')
     soup = BeautifulSoup(text, 'html.parser')
     # title may be in <title>
     title_tag = soup.find('h2')
     title = title_tag.get_text(strip=True) if title_tag else ''
-    # excerpt: first ._2pin div text
-    excerpt = ''
-    pin = soup.find(class_='_2pin')
-    if pin:
-        excerpt = ' '.join(pin.stripped_strings)
+    excerpt = post_text(text)
     # date: look for div._a72d or <title>
     date = None
     date_div = soup.find(class_='_a72d')
     if date_div:
         try:
-            date = dateparser.parse(date_div.get_text(strip=True))
+            date = parse_date(date_div.get_text(strip=True))
         except Exception:
             date = None
     if not date:
@@ -50,63 +101,133 @@ def extract_meta(article_path):
         t = soup.find('title')
         if t:
             try:
-                date = dateparser.parse(t.get_text(strip=True))
+                date = parse_date(t.get_text(strip=True))
             except Exception:
                 date = None
     if not date:
-        date = dateparser.parse('1970-01-01')
+        date = parse_date('1970-01-01')
     if not title:
         title = Path(article_path).stem
-    if not excerpt:
-        excerpt = ''
-    # keep excerpt to 160 chars
-    if len(excerpt) > 160:
-        excerpt = excerpt[:157].rstrip() + '...'
+    excerpt = make_excerpt(excerpt, 160)
     return title, date, excerpt
 
-def inject(home_path, articles_dir):
+def card_hash(*fields):
+    return hashlib.sha1('\x1f'.join(fields).encode('utf-8')).hexdigest()[:12]
+
+
+def card_class(slug):
+    # keyed by slug so adding or removing a post does not recolour the others
+    return CARD_CLASSES[zlib.crc32(slug.encode('utf-8')) % len(CARD_CLASSES)]
+
+
+def wanted_cards(db_path, articles_dir):
+    """(slug, hash, date, title, excerpt, href) for every fb post page, newest first.
+
+    Metadata comes from articles.db, with the excerpt taken from the post
+    text in the body (`articles.excerpt` holds page chrome for these rows);
+    only pages the DB does not know yet are parsed. `href` is the page relative to `articles_dir` (it includes
+    the YYYY/MM shard once the layout is sharded).
+    """
+    pages = {p.stem: p for p in iter_pages('article_fb_*.html', articles_dir)}
+    rows = {}
+    if Path(db_path).exists():
+        conn = sqlite3.connect(str(db_path))
+        for slug, title, pub_date, body in iter_content(conn, 'slug, title, pub_date', "slug LIKE 'article_fb_%'"):
+            date = parse_date_or_none(pub_date or '')
+            if slug in pages and date is not None:
+                rows[slug] = (date, title or slug, make_excerpt(post_text(body), 160))
+        conn.close()
+    for slug, page in pages.items():
+        if slug not in rows:
+            title, date, excerpt = extract_meta(page)
+            rows[slug] = (date, title, excerpt)
+    cards = []
+    for slug, (date, title, excerpt) in rows.items():
+        href = pages[slug].relative_to(articles_dir).as_posix()
+        # keyed by the page path without .html: the bare slug in the flat layout
+        h = card_hash(href[:-5], date.strftime('%Y.%m.%d'), title, excerpt)
+        cards.append((slug, h, date, title, excerpt, href))
+    cards.sort(key=lambda c: (c[2].replace(tzinfo=None), c[0]), reverse=True)
+    return cards
+
+
+def inject(home_path, articles_dir, db_path=DB_PATH):
+    """Splice fb post cards into home.html in one pass.
+
+    Cards live between the FB-IMPORT markers and carry data-slug and
+    data-hash; cards whose hash is unchanged are copied through as they
+    are, only added or edited ones are rendered, removed ones dropped.
+    Posts that already have a card outside the markers (pages generated
+    by generate_from_db.js) are not duplicated.
+    Returns (cards, added, updated, removed).
+    """
     home = Path(home_path)
     backup = home.with_suffix('.html.bak')
     if not backup.exists():
-        home.write_text(home.read_text(encoding='utf-8'), encoding='utf-8')
-        home.rename(backup)
-        # restore original to continue edits
-        backup.write_text(backup.read_text(encoding='utf-8'), encoding='utf-8')
-        home.write_text(backup.read_text(encoding='utf-8'), encoding='utf-8')
-    # read current (from backup) to avoid repeated injections
-    content = backup.read_text(encoding='utf-8')
-    marker_start = '<div class="diary-grid" id="diary-grid">'
-    if marker_start not in content:
-        raise SystemExit('diary-grid marker not found in home.html')
-    insert_point = content.find(marker_start) + len(marker_start)
-    # build cards from articles
-    articles = sorted(Path(articles_dir).glob('article_fb_*.html'), reverse=True)
-    cards = []
-    for i, a in enumerate(articles):
-        fname = a.name
-        title, date, excerpt = extract_meta(a)
-        cls = CARD_CLASSES[i % len(CARD_CLASSES)]
-        card = make_card_html(fname, title, date, excerpt, cls)
-        cards.append((date, card))
-    # sort cards by date desc
-    cards.sort(key=lambda x: x[0], reverse=True)
-    cards_html = '\n'.join(c for _, c in cards)
-    # wrap with markers so we can replace later
-    wrapped = '\n<!-- FB-IMPORT-START -->\n' + cards_html + '\n<!-- FB-IMPORT-END -->\n'
-    # if existing markers exist, replace between them
-    if '<!-- FB-IMPORT-START -->' in content and '<!-- FB-IMPORT-END -->' in content:
-        pre = content.split('<!-- FB-IMPORT-START -->',1)[0]
-        post = content.split('<!-- FB-IMPORT-END -->',1)[1]
-        new_content = pre + wrapped + post
-    else:
-        new_content = content[:insert_point] + '\n' + wrapped + content[insert_point:]
-    home.write_text(new_content, encoding='utf-8')
-    return len(cards)
+        copy_file(home, backup)
+    cards = wanted_cards(db_path, articles_dir)
+
+    out, existing = [], {}
+    outside = set()
+    state = 'before'  # before -> block -> after
+    current = None
+    grid_at = None
+    with open(home, encoding='utf-8') as f:
+        for line in f:
+            if state == 'block':
+                if MARK_END in line:
+                    state = 'after'
+                    out.append(None)  # the block is rendered here
+                    out.append(line)
+                    continue
+                m = CARD_KEY_RE.search(line)
+                if m:
+                    current = m.group(1)
+                    existing[current] = (m.group(2), [line])
+                elif 'class="diary-card' in line:
+                    current = None  # unkeyed card from an older run: re-rendered
+                elif current is not None:
+                    existing[current][1].append(line)
+                continue
+            if MARK_START in line:
+                state = 'block'
+                out.append(line)
+                continue
+            out.append(line)
+            for target in ONCLICK_RE.findall(line):
+                outside.add(target.rsplit('/', 1)[-1])
+            if grid_at is None and GRID_MARKER in line:
+                grid_at = len(out)
+    if state == 'before':
+        if grid_at is None:
+            raise SystemExit('diary-grid marker not found in home.html')
+        out[grid_at:grid_at] = [MARK_START + '\n', None, MARK_END + '\n']
+    elif state == 'block':
+        raise SystemExit('FB-IMPORT-START without FB-IMPORT-END in home.html')
+
+    block, added, updated = [], 0, 0
+    keep = [c for c in cards if c[0] not in outside]
+    for slug, h, date, title, excerpt, href in keep:
+        old = existing.get(slug)
+        if old is not None and old[0] == h:
+            block.extend(old[1])
+            continue
+        if old is None:
+            added += 1
+        else:
+            updated += 1
+        block.append(make_card_html(href, title, date, excerpt, card_class(slug), h) + '\n')
+    removed = len(set(existing) - {c[0] for c in keep})
+    i = out.index(None)
+    out[i:i + 1] = block
+    write_text(home, ''.join(out))
+    return len(keep), added, updated, removed
 
 if __name__ == '__main__':
     p = argparse.ArgumentParser()
     p.add_argument('--home', default='home.html')
     p.add_argument('--articles', default='articles')
+    p.add_argument('--db', default=str(DB_PATH))
     args = p.parse_args()
-    n = inject(args.home, args.articles)
-    print(f'Inserted {n} facebook post cards into {args.home}')
+    n, added, updated, removed = inject(args.home, args.articles, args.db)
+    print(f'{n} facebook post cards in {args.home}: {added} added, {updated} updated, {removed} removed')
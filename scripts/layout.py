@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+"""Where article pages live: flat `articles/` or `articles/YYYY/MM/` shards.
+
+By default every page is `articles/<slug>.html`. Once
+`python3 scripts/layout.py --migrate` has run, the empty marker file
+`articles/.sharded` is present and dated pages live in year/month shards
+(`articles/2008/03/article_20080318_....html`), with their `.bak`,
+`.wpback` and `.wphtml` copies next to them. Slugs without a YYYYMMDD
+token stay in the flat directory. `facebook_media/` and `media/` do not
+move.
+
+Scripts find pages through this module instead of globbing:
+
+  - `iter_pages(pattern)` lists the flat directory and then each YYYY/MM
+    shard with one `os.scandir` per directory, so enumeration never
+    stats or sorts the whole archive at once, and `year=` / `month=`
+    restrict it to a single shard
+  - `page_path(slug)` is where a page for `slug` is written under the
+    current layout; `find_page(slug)` also accepts a page still sitting
+    in the flat directory
+  - `relink(html, src_dir, dst_dir)` rewrites the relative
+    src/href/poster/onclick references of a page written for one
+    directory so they resolve from another. DB `content` stays relative
+    to `articles/`; writers relink it to the page's shard and readers
+    relink it back
+
+The migration moves the pages under a journaled WriteBatch, rewrites
+their relative links and the `articles/<slug>.html` links in home.html,
+and records every old URL in `articles/redirects.json`
+(`{"/articles/<slug>.html": "/articles/2008/03/<slug>.html"}`), which the
+admin servers answer with a 301. `--flat` moves everything back and
+removes the marker and the map.
+
+Run from the repo root:
+    python3 scripts/layout.py                        # layout and shard counts
+    python3 scripts/layout.py --migrate [--dry-run]
+    python3 scripts/layout.py --flat
+"""
+from fnmatch import fnmatch
+from functools import lru_cache
+from pathlib import Path
+import argparse
+import json
+import os
+import posixpath
+import re
+
+from dates import parse_token
+from safe_write import WriteBatch, copy_file, write_text
+
+ROOT = Path(__file__).resolve().parents[1]
+ART_DIR = ROOT / 'articles'
+HOME = ROOT / 'home.html'
+MARKER = '.sharded'
+REDIRECTS = 'redirects.json'
+SIDECARS = ('.bak', '.wpback', '.wphtml')
+
+REF_RE = re.compile(r'''(\b(?:src|href|poster)\s*=\s*["'])([^"']+)(["'])''', re.I)
+ONCLICK_RE = re.compile(r'''(location\.href\s*=\s*\\?["'])([^"'\\]+)(\\?["'])''', re.I)
+ABSOLUTE_PREFIXES = ('/', '#', '?', '{{', 'data:', 'javascript:', 'mailto:', 'tel:')
+SCHEME_RE = re.compile(r'^[a-z][a-z0-9+.-]*:', re.I)
+
+
+@lru_cache(maxsize=None)
+def _sharded(art_dir):
+    return os.path.exists(os.path.join(art_dir, MARKER))
+
+
+def sharded(art_dir=ART_DIR):
+    """True once `articles/` has been migrated to the year/month layout."""
+    return _sharded(str(art_dir))
+
+
+def shard_for(slug):
+    """'YYYY/MM' from the first date token in `slug`, or None."""
+    d = parse_token(slug)
+    return f'{d.year:04d}/{d.month:02d}' if d else None
+
+
+def page_path(slug, art_dir=ART_DIR):
+    """Where the page for `slug` belongs under the current layout."""
+    art_dir = Path(art_dir)
+    shard = shard_for(slug) if sharded(art_dir) else None
+    return art_dir / shard / f'{slug}.html' if shard else art_dir / f'{slug}.html'
+
+
+def find_page(slug, art_dir=ART_DIR):
+    """The existing page for `slug`, looking in its shard and the flat directory."""
+    p = page_path(slug, art_dir)
+    if not p.exists():
+        flat = Path(art_dir) / f'{slug}.html'
+        if flat.exists():
+            return flat
+    return p
+
+
+def _files(d, pattern):
+    try:
+        with os.scandir(d) as it:
+            names = [e.name for e in it if e.is_file() and fnmatch(e.name, pattern)]
+    except FileNotFoundError:
+        return []
+    return [Path(d) / n for n in sorted(names)]
+
+
+def _shard_dirs(d, width, only=None):
+    try:
+        with os.scandir(d) as it:
+            names = [e.name for e in it if e.is_dir() and len(e.name) == width and e.name.isdigit()]
+    except FileNotFoundError:
+        return []
+    return [Path(d) / n for n in sorted(names) if only is None or n == only]
+
+
+def iter_pages(pattern='*.html', art_dir=ART_DIR, year=None, month=None):
+    """Files matching `pattern` in the flat directory, then in each shard in date order."""
+    art_dir = Path(art_dir)
+    if year is None and month is None:
+        yield from _files(art_dir, pattern)
+    for y in _shard_dirs(art_dir, 4, None if year is None else f'{int(year):04d}'):
+        for m in _shard_dirs(y, 2, None if month is None else f'{int(month):02d}'):
+            yield from _files(m, pattern)
+
+
+def _is_relative(ref):
+    return not ref.startswith(ABSOLUTE_PREFIXES) and not SCHEME_RE.match(ref)
+
+
+def relink(html, src_dir, dst_dir, moves=None):
+    """Rewrite relative references written for `src_dir` to resolve from `dst_dir`.
+
+    `moves` maps old absolute (posix) paths of pages to their new paths, so
+    links to pages that moved as well follow them.
+    """
+    src = Path(src_dir).resolve().as_posix()
+    dst = Path(dst_dir).resolve().as_posix()
+    if src == dst and not moves:
+        return html
+
+    def fix(m):
+        ref = m.group(2)
+        if not _is_relative(ref.strip()):
+            return m.group(0)
+        cut = min([i for i in (ref.find('?'), ref.find('#')) if i >= 0] or [len(ref)])
+        path, tail = ref[:cut], ref[cut:]
+        if not path:
+            return m.group(0)
+        target = posixpath.normpath(posixpath.join(src, path))
+        if moves:
+            target = moves.get(target, target)
+        new = posixpath.relpath(target, dst)
+        if path.endswith('/'):
+            new += '/'
+        return m.group(1) + new + tail + m.group(3)
+
+    return ONCLICK_RE.sub(fix, REF_RE.sub(fix, html))
+
+
+def load_redirects(art_dir=ART_DIR):
+    try:
+        return json.loads((Path(art_dir) / REDIRECTS).read_text(encoding='utf-8'))
+    except (OSError, ValueError):
+        return {}
+
+
+def migrate(shard=True, art_dir=ART_DIR, home=HOME, dry_run=False):
+    """Move pages into (or, with shard=False, out of) year/month shards."""
+    art_dir = Path(art_dir).resolve()
+    root = art_dir.parent
+    plan = []
+    for page in iter_pages('*.html', art_dir):
+        s = shard_for(page.stem) if shard else None
+        new = art_dir / s / page.name if s else art_dir / page.name
+        if new != page:
+            plan.append((page, new))
+    if dry_run:
+        return plan
+    moves = {old.as_posix(): new.as_posix() for old, new in plan}
+    moved = set(moves)
+    redirects = load_redirects(art_dir) if shard else {}
+    with WriteBatch(journal=True):
+        for old, new in plan:
+            new.parent.mkdir(parents=True, exist_ok=True)
+            html = old.read_text(encoding='utf-8', errors='ignore')
+            write_text(new, relink(html, old.parent, new.parent, moves))
+            for suffix in SIDECARS:
+                side = old.with_name(old.name + suffix)
+                if side.exists():
+                    copy_file(side, new.with_name(side.name))
+            if shard:
+                redirects['/' + (art_dir / old.name).relative_to(root).as_posix()] = \
+                    '/' + new.relative_to(root).as_posix()
+        if plan:
+            # pages that stay put, and home.html, may link to pages that moved
+            others = [p for p in iter_pages('*.html', art_dir) if p.as_posix() not in moved]
+            for page in others + ([Path(home)] if Path(home).exists() else []):
+                html = page.read_text(encoding='utf-8', errors='ignore')
+                new = relink(html, page.parent, page.parent, moves)
+                if new != html:
+                    write_text(page, new)
+        if shard:
+            write_text(art_dir / REDIRECTS, json.dumps(redirects, ensure_ascii=False, indent=1, sort_keys=True) + '\n')
+            if not (art_dir / MARKER).exists():
+                write_text(art_dir / MARKER, '')
+    # only drop the originals once every new copy is on disk
+    for old, _ in plan:
+        for f in [old] + [old.with_name(old.name + s) for s in SIDECARS]:
+            if f.exists():
+                f.unlink()
+    if not shard:
+        (art_dir / MARKER).unlink(missing_ok=True)
+        (art_dir / REDIRECTS).unlink(missing_ok=True)
+        for y in _shard_dirs(art_dir, 4):
+            for m in _shard_dirs(y, 2):
+                if not any(m.iterdir()):
+                    m.rmdir()
+            if not any(y.iterdir()):
+                y.rmdir()
+    _sharded.cache_clear()
+    return plan
+
+
+def summary(art_dir=ART_DIR):
+    counts = {}
+    for page in iter_pages('*.html', art_dir):
+        rel = page.parent.relative_to(art_dir).as_posix()
+        counts[rel] = counts.get(rel, 0) + 1
+    return counts
+
+
+if __name__ == '__main__':
+    p = argparse.ArgumentParser(description='Show or change the articles/ directory layout')
+    g = p.add_mutually_exclusive_group()
+    g.add_argument('--migrate', action='store_true', help='move pages into articles/YYYY/MM/ shards')
+    g.add_argument('--flat', action='store_true', help='move pages back into articles/')
+    p.add_argument('--dry-run', action='store_true', help='list the moves without making them')
+    p.add_argument('--articles', default=str(ART_DIR))
+    p.add_argument('--home', default=str(HOME))
+    args = p.parse_args()
+    if args.migrate or args.flat:
+        plan = migrate(args.migrate, args.articles, args.home, args.dry_run)
+        for old, new in plan if args.dry_run else []:
+            print(f'{old.name} -> {new.parent.relative_to(Path(args.articles).resolve()).as_posix() or "."}/')
+        verb = 'Would move' if args.dry_run else 'Moved'
+        print(f'{verb} {len(plan)} pages' + ('' if args.dry_run or not args.migrate else
+                                              f'; redirect map in {Path(args.articles) / REDIRECTS}'))
+    else:
+        art_dir = Path(args.articles)
+        print(f"{art_dir}: {'sharded' if sharded(art_dir) else 'flat'}")
+        for d, n in sorted(summary(art_dir).items()):
+            print(f'  {d}/  {n}')
@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+"""Rewrite `<img>` tags in generated pages for lazy loading.
+
+`generate_from_db.js` runs it after writing the pages (so every admin
+save or delete gets the attributes back); run it by hand after
+`import_fb_to_site.py` or `process_wp_images.py`. For every image in the
+`.article-content` of an article (or anywhere in home.html) it adds
+what is missing of:
+
+  - `width` / `height`, read from the file header (JPEG, PNG, GIF, WebP)
+    and cached in the `image_dims` table, so the layout does not jump
+  - `decoding="async"`
+  - `loading="lazy"`, except on the first image of the page, which gets
+    `fetchpriority="high"` instead because it is usually the LCP element
+  - on photo-heavy pages (PLACEHOLDER_MIN or more images from
+    facebook_media) a low-quality placeholder as an inline background:
+    a tiny blurred JPEG data URI when Pillow is installed, a flat paper
+    colour otherwise
+
+Attributes already present are left alone, so the rewrite is idempotent.
+Pages are tracked by size and mtime in `lazy_pages`; only pages changed
+since the last run are parsed again (`--all` forces a full pass).
+
+Run from the repo root: `python3 scripts/lazy_images.py [--all] [pages...]`
+"""
+from pathlib import Path
+from urllib.parse import unquote, urlsplit
+import argparse
+import base64
+import io
+import re
+import sqlite3
+import struct
+
+from layout import iter_pages
+from safe_write import WriteBatch, write_text
+
+try:
+    from PIL import Image, ImageFilter
+except Exception:
+    Image = None
+
+ROOT = Path(__file__).resolve().parents[1]
+ART_DIR = ROOT / 'articles'
+DB_PATH = ROOT / 'articles.db'
+HOME = ROOT / 'home.html'
+
+PLACEHOLDER_MIN = 4
+PLACEHOLDER_WIDTH = 16
+PLACEHOLDER_COLOR = '#efe9df'
+
+IMG_RE = re.compile(r'<img\b([^>]*?)\s*(/?)>', re.I)
+ATTR_RE = re.compile(r'([^\s=/]+)(?:\s*=\s*("[^"]*"|\'[^\']*\'|[^\s>]+))?')
+CONTENT_RE = re.compile(r'<div class="article-content"[^>]*>(.*?)(?=<nav class="article-nav"|<footer|$)', re.S)
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS image_dims (
+    path TEXT PRIMARY KEY,
+    size INTEGER,
+    mtime REAL,
+    width INTEGER,
+    height INTEGER,
+    placeholder TEXT
+);
+CREATE TABLE IF NOT EXISTS lazy_pages (
+    name TEXT PRIMARY KEY,
+    size INTEGER,
+    mtime REAL
+);
+'''
+
+
+def jpeg_orientation(app1):
+    """EXIF orientation from an APP1 segment body, or 1."""
+    if not app1.startswith(b'Exif\x00\x00'):
+        return 1
+    tiff = app1[6:]
+    if len(tiff) < 8:
+        return 1
+    endian = '<' if tiff[:2] == b'II' else '>'
+    ifd = struct.unpack(endian + 'I', tiff[4:8])[0]
+    if ifd + 2 > len(tiff):
+        return 1
+    count = struct.unpack(endian + 'H', tiff[ifd:ifd + 2])[0]
+    for i in range(count):
+        entry = tiff[ifd + 2 + i * 12:ifd + 14 + i * 12]
+        if len(entry) < 12:
+            break
+        tag, typ = struct.unpack(endian + 'HH', entry[:4])
+        if tag == 0x0112:
+            return struct.unpack(endian + 'H', entry[8:10])[0]
+    return 1
+
+
+def _jpeg_size(f):
+    orientation = 1
+    f.seek(2)
+    while True:
+        marker = f.read(2)
+        if len(marker) < 2 or marker[0] != 0xFF:
+            return None
+        while marker[1] == 0xFF:
+            marker = marker[:1] + f.read(1)
+        kind = marker[1]
+        if kind in (0xD8, 0x01) or 0xD0 <= kind <= 0xD7:
+            continue
+        length = struct.unpack('>H', f.read(2))[0]
+        if kind == 0xE1 and orientation == 1:
+            orientation = jpeg_orientation(f.read(length - 2))
+            continue
+        if 0xC0 <= kind <= 0xCF and kind not in (0xC4, 0xC8, 0xCC):
+            h, w = struct.unpack('>xHH', f.read(5))
+            return (h, w) if orientation >= 5 else (w, h)
+        f.seek(length - 2, 1)
+
+
+def image_size(path):
+    """(width, height) from the image header, or None if unknown."""
+    try:
+        with open(path, 'rb') as f:
+            head = f.read(32)
+            if head.startswith(b'\xff\xd8'):
+                return _jpeg_size(f)
+            if head.startswith(b'\x89PNG\r\n\x1a\n') and head[12:16] == b'IHDR':
+                return struct.unpack('>II', head[16:24])
+            if head[:6] in (b'GIF87a', b'GIF89a'):
+                return struct.unpack('<HH', head[6:10])
+            if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+                chunk = head[12:16]
+                if chunk == b'VP8X':
+                    w = int.from_bytes(head[24:27], 'little') + 1
+                    h = int.from_bytes(head[27:30], 'little') + 1
+                    return w, h
+                if chunk == b'VP8L':
+                    f.seek(21)
+                    b = f.read(4)
+                    bits = int.from_bytes(b, 'little')
+                    return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+                if chunk == b'VP8 ':
+                    f.seek(26)
+                    w, h = struct.unpack('<HH', f.read(4))
+                    return w & 0x3FFF, h & 0x3FFF
+    except (OSError, struct.error):
+        return None
+    return None
+
+
+def make_placeholder(path):
+    """Tiny blurred JPEG as a data URI (needs Pillow)."""
+    if Image is None:
+        return None
+    try:
+        with Image.open(path) as im:
+            im = im.convert('RGB')
+            im.thumbnail((PLACEHOLDER_WIDTH, PLACEHOLDER_WIDTH * 4))
+            im = im.filter(ImageFilter.GaussianBlur(1))
+            buf = io.BytesIO()
+            im.save(buf, 'JPEG', quality=40)
+    except Exception:
+        return None
+    return 'data:image/jpeg;base64,' + base64.b64encode(buf.getvalue()).decode('ascii')
+
+
+class DimsCache:
+    """image_dims rows keyed by repo-relative path, refreshed when size/mtime change."""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.rows = {r[0]: r[1:] for r in conn.execute('SELECT * FROM image_dims')}
+
+    def get(self, path, placeholder=False):
+        try:
+            st = path.stat()
+        except OSError:
+            return None
+        key = path.relative_to(ROOT).as_posix()
+        row = self.rows.get(key)
+        if row is None or row[0] != st.st_size or row[1] != st.st_mtime:
+            size = image_size(path) or (None, None)
+            row = (st.st_size, st.st_mtime, size[0], size[1], None)
+        if placeholder and row[4] is None and Image is not None:
+            row = row[:4] + (make_placeholder(path),)
+        if self.rows.get(key) != row:
+            self.rows[key] = row
+            self.conn.execute('INSERT OR REPLACE INTO image_dims VALUES (?,?,?,?,?,?)', (key, *row))
+        return row
+
+
+def local_path(src, page):
+    if not src or src.startswith(('data:', 'javascript:')):
+        return None
+    parts = urlsplit(src)
+    if parts.scheme or parts.netloc:
+        return None
+    rel = unquote(parts.path)
+    p = (ROOT / rel.lstrip('/')) if rel.startswith('/') else (page.parent / rel)
+    try:
+        p = p.resolve()
+        p.relative_to(ROOT)
+    except (OSError, ValueError):
+        return None
+    return p
+
+
+def rewrite_imgs(fragment, page, cache):
+    """Rewrite the <img> tags in one HTML fragment; returns the new fragment."""
+    tags = list(IMG_RE.finditer(fragment))
+    srcs = []
+    for m in tags:
+        attrs = dict((k.lower(), v) for k, v in ATTR_RE.findall(m.group(1)))
+        srcs.append((attrs, (attrs.get('src') or '').strip('"\'')))
+    heavy = sum(1 for _, s in srcs if 'facebook_media/' in s) >= PLACEHOLDER_MIN
+    out, pos, first = [], 0, True
+    for m, (attrs, src) in zip(tags, srcs):
+        out.append(fragment[pos:m.start()])
+        pos = m.end()
+        if not src:
+            out.append(m.group(0))
+            continue
+        extra = []
+        path = local_path(src, page)
+        placeholder = heavy and not first and 'facebook_media/' in src
+        row = cache.get(path, placeholder) if path is not None else None
+        if row and row[2] and 'width' not in attrs and 'height' not in attrs:
+            extra.append(f'width="{row[2]}" height="{row[3]}"')
+        if 'decoding' not in attrs:
+            extra.append('decoding="async"')
+        if 'loading' not in attrs and 'fetchpriority' not in attrs:
+            extra.append('fetchpriority="high"' if first else 'loading="lazy"')
+        if placeholder and 'style' not in attrs:
+            bg = f"url({row[4]}) center/cover no-repeat" if row and row[4] else PLACEHOLDER_COLOR
+            extra.append(f'style="background:{bg}"')
+        first = False
+        if not extra:
+            out.append(m.group(0))
+            continue
+        out.append(f'<img{m.group(1)} {" ".join(extra)}{" /" if m.group(2) else ""}>')
+    out.append(fragment[pos:])
+    return ''.join(out)
+
+
+def rewrite_page(page, cache):
+    """Rewrite one page in place; returns True if it changed."""
+    html = page.read_text(encoding='utf-8')
+    m = CONTENT_RE.search(html)
+    if m:
+        new = html[:m.start(1)] + rewrite_imgs(m.group(1), page, cache) + html[m.end(1):]
+    else:
+        new = rewrite_imgs(html, page, cache)
+    return write_text(page, new) if new != html else False
+
+
+def run(pages=None, everything=False, db_path=DB_PATH):
+    conn = sqlite3.connect(str(db_path))
+    conn.executescript(SCHEMA)
+    # VP8X heights were once read past the header as 1; drop those rows so they are measured again
+    conn.execute("DELETE FROM image_dims WHERE path LIKE '%.webp' AND height = 1")
+    cache = DimsCache(conn)
+    seen = {r[0]: r[1:] for r in conn.execute('SELECT * FROM lazy_pages')}
+    if pages is None:
+        pages = list(iter_pages('*.html', ART_DIR)) + ([HOME] if HOME.exists() else [])
+    checked = changed = 0
+    with WriteBatch():
+        for page in pages:
+            page = Path(page).resolve()
+            st = page.stat()
+            name = page.relative_to(ROOT).as_posix()
+            if not everything and seen.get(name) == (st.st_size, st.st_mtime):
+                continue
+            checked += 1
+            if rewrite_page(page, cache):
+                changed += 1
+                st = page.stat()
+            conn.execute('INSERT OR REPLACE INTO lazy_pages VALUES (?,?,?)', (name, st.st_size, st.st_mtime))
+    conn.commit()
+    conn.close()
+    return len(pages), checked, changed
+
+
+if __name__ == '__main__':
+    p = argparse.ArgumentParser(description='Add lazy-loading attributes and dimensions to page images')
+    p.add_argument('pages', nargs='*', help='pages to rewrite (default: articles/*.html and home.html)')
+    p.add_argument('--all', action='store_true', help='reprocess pages even if unchanged since the last run')
+    p.add_argument('--db', default=str(DB_PATH))
+    args = p.parse_args()
+    total, checked, changed = run(args.pages or None, args.all, args.db)
+    print(f'{total} pages, {checked} checked, {changed} rewritten')
@@ -0,0 +1,445 @@
+#!/usr/bin/env python3
+"""Load test for the site server: concurrent readers plus admin saves.
+
+Replays a weighted mix of requests against a locally running
+`admin_server.js` (or `admin_server_fixed.js`, `--url`):
+
+  - home     GET /home.html
+  - article  GET of a random page under articles/ (every shard)
+  - media    GET of a random facebook_media file with a 64 KB `Range`.
+             206 answers are counted as `media`; a 200 means the server
+             ignored the Range and sent the whole file, and is counted
+             as `media_full` with a note in the report
+  - save     POST /update re-saving a random article with its stored
+             title, date and body, which makes the server rerun
+             generate_from_db.js; needs `--user` and `--password` of an
+             admin account and is dropped from the mix without them
+
+`--concurrency` workers, each with its own keep-alive connection, issue
+requests back to back for `--duration` seconds (or `--requests` in
+total). The client is plain asyncio streams, so nothing beyond the
+standard library is needed. `--start` launches the server itself on a
+free port (passed as the `PORT` environment variable, which both admin
+servers read), makes sure that process is the one answering, and stops
+it afterwards.
+
+`/update` recomputes the slug and normalises `pub_date`, so even an
+unchanged save can rename an article. Saves therefore only run together
+with `--start`, which then serves a scratch copy of the site (pages,
+templates, scripts and articles.db; the media directories are
+symlinked) from a temporary directory and deletes it afterwards. The
+report's `save_check` lists articles whose slug changed during the run.
+
+The result is one JSON document: throughput, error rate and latency
+percentiles overall and per request kind, plus status counts, so runs
+before and after a serving or regeneration change can be diffed.
+
+Run from the repo root:
+    python3 scripts/load_test.py --start --concurrency 32 --duration 30 --json before.json
+    python3 scripts/load_test.py --start --mix home=2,article=8,media=4,save=1 --user admin --password secret
+"""
+from pathlib import Path
+from urllib.parse import urlencode, urlsplit, quote
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import random
+import shutil
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+
+from content_store import iter_content
+from layout import iter_pages
+from media_index import MEDIA_DIRS
+
+ROOT = Path(__file__).resolve().parents[1]
+ART_DIR = ROOT / 'articles'
+DB_PATH = ROOT / 'articles.db'
+
+DEFAULT_MIX = {'home': 1, 'article': 8, 'media': 3, 'save': 0}
+RANGE_BYTES = 64 * 1024
+PERCENTILES = (50, 90, 95, 99)
+
+
+class Connection:
+    """One keep-alive HTTP/1.1 connection, reopened after errors or `Connection: close`."""
+
+    def __init__(self, host, port, timeout):
+        self.host, self.port, self.timeout = host, port, timeout
+        self.reader = self.writer = None
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            try:
+                await self.writer.wait_closed()
+            except OSError:
+                pass
+        self.reader = self.writer = None
+
+    async def request(self, method, path, headers=None, body=b''):
+        """Returns (status, headers, body length)."""
+        try:
+            return await asyncio.wait_for(self._request(method, path, headers or {}, body), self.timeout)
+        except BaseException:
+            await self.close()
+            raise
+
+    async def _request(self, method, path, headers, body):
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        lines = [f'{method} {path} HTTP/1.1', f'Host: {self.host}:{self.port}', 'Connection: keep-alive']
+        if body:
+            lines.append(f'Content-Length: {len(body)}')
+        lines += [f'{k}: {v}' for k, v in headers.items()]
+        self.writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + body)
+        await self.writer.drain()
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise ConnectionError('connection closed by server')
+        status = int(status_line.split()[1])
+        resp = {}
+        while True:
+            line = await self.reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            k, _, v = line.decode('latin-1').partition(':')
+            resp.setdefault(k.strip().lower(), []).append(v.strip())
+        size = 0
+        if 'chunked' in ','.join(resp.get('transfer-encoding', [])).lower():
+            while True:
+                n = int((await self.reader.readline()).split(b';')[0], 16)
+                await self.reader.readexactly(n + 2)
+                size += n
+                if n == 0:
+                    break
+        elif 'content-length' in resp:
+            size = int(resp['content-length'][0])
+            await self.reader.readexactly(size)
+        elif status not in (204, 304) and method != 'HEAD':
+            size = len(await self.reader.read())
+            await self.close()
+        if 'close' in ','.join(resp.get('connection', [])).lower():
+            await self.close()
+        return status, resp, size
+
+
+def article_urls():
+    return ['/' + quote(p.relative_to(ROOT).as_posix()) for p in iter_pages('*.html', ART_DIR)]
+
+
+def media_files(db_path=DB_PATH):
+    """(url, size) of facebook_media files, from the media index when it exists."""
+    try:
+        conn = sqlite3.connect(str(db_path))
+        rows = conn.execute("SELECT path, size FROM media WHERE path LIKE 'articles/facebook_media/%'").fetchall()
+        conn.close()
+    except sqlite3.OperationalError:
+        rows = []
+    if not rows:
+        rows = [(p.relative_to(ROOT).as_posix(), p.stat().st_size)
+                for d in MEDIA_DIRS[:1] if d.exists() for p in d.rglob('*') if p.is_file()]
+    return [('/' + quote(path), size) for path, size in rows]
+
+
+def save_forms(db_path=DB_PATH, limit=200):
+    """Form bodies that re-save existing articles with their stored fields."""
+    conn = sqlite3.connect(str(db_path))
+    forms = []
+    for id_, title, pub_date, content in iter_content(conn, 'id, title, pub_date', 'id IN (SELECT id FROM articles LIMIT ?)', (limit,)):
+        forms.append(urlencode({'id': id_, 'title': title or '', 'pub_date': pub_date or '',
+                                'content': content or ''}).encode('utf-8'))
+    conn.close()
+    return forms
+
+
+def slugs(db_path):
+    conn = sqlite3.connect(str(db_path))
+    rows = dict(conn.execute('SELECT id, slug FROM articles'))
+    conn.close()
+    return rows
+
+
+def scratch_site():
+    """Copy the site into a temporary directory for a run with saves; media directories are symlinked."""
+    dst = Path(tempfile.mkdtemp(prefix='skycity-load-'))
+    skip = {ROOT / '.git', ROOT / 'backups', ROOT / 'node_modules', *MEDIA_DIRS}
+
+    def ignore(d, names):
+        return [n for n in names if Path(d) / n in skip or n == '__pycache__']
+
+    shutil.copytree(ROOT, dst / 'site', symlinks=True, ignore=ignore)
+    for d in MEDIA_DIRS:
+        if d.exists():
+            (dst / 'site' / d.relative_to(ROOT)).symlink_to(d, target_is_directory=True)
+    return dst / 'site'
+
+
+async def login(host, port, user, password, timeout):
+    conn = Connection(host, port, timeout)
+    body = urlencode({'username': user, 'password': password}).encode('utf-8')
+    try:
+        _, headers, _ = await conn.request('POST', '/login', {'Content-Type': 'application/x-www-form-urlencoded'}, body)
+    finally:
+        await conn.close()
+    for cookie in headers.get('set-cookie', []):
+        if cookie.startswith('sessionId='):
+            return cookie.split(';', 1)[0]
+    raise SystemExit('login failed: no session cookie (check --user/--password)')
+
+
+class Stats:
+    def __init__(self):
+        self.kinds = {}
+
+    def add(self, kind, latency, status=None, size=0, error=None):
+        k = self.kinds.setdefault(kind, {'latencies': [], 'status': {}, 'errors': 0, 'bytes': 0, 'messages': {}})
+        k['latencies'].append(latency)
+        k['bytes'] += size
+        if status is not None:
+            k['status'][str(status)] = k['status'].get(str(status), 0) + 1
+        if error is not None or (status is not None and status >= 400):
+            k['errors'] += 1
+            if error is not None:
+                k['messages'][error] = k['messages'].get(error, 0) + 1
+
+    @staticmethod
+    def summarise(latencies, errors, size, elapsed):
+        lat = sorted(latencies)
+        n = len(lat)
+
+        def pct(p):
+            return round(lat[min(n - 1, max(0, -(-p * n // 100) - 1))] * 1000, 2) if n else None
+
+        return {
+            'requests': n,
+            'errors': errors,
+            'error_rate': round(errors / n, 4) if n else 0,
+            'throughput_rps': round(n / elapsed, 2) if elapsed else 0,
+            'bytes': size,
+            'latency_ms': {**{f'p{p}': pct(p) for p in PERCENTILES},
+                           'mean': round(sum(lat) / n * 1000, 2) if n else None,
+                           'max': round(lat[-1] * 1000, 2) if n else None},
+        }
+
+    def report(self, elapsed):
+        every = [x for k in self.kinds.values() for x in k['latencies']]
+        out = self.summarise(every, sum(k['errors'] for k in self.kinds.values()),
+                             sum(k['bytes'] for k in self.kinds.values()), elapsed)
+        out['by_kind'] = {name: {**self.summarise(k['latencies'], k['errors'], k['bytes'], elapsed),
+                                 'status': k['status'], 'error_messages': k['messages']}
+                          for name, k in sorted(self.kinds.items())}
+        return out
+
+
+async def worker(host, port, args, plan, stats, deadline, budget, rng):
+    conn = Connection(host, port, args.timeout)
+    kinds, weights = zip(*plan['mix'].items())
+    try:
+        while time.monotonic() < deadline:
+            if budget is not None:
+                if budget[0] <= 0:
+                    break
+                budget[0] -= 1
+            kind = rng.choices(kinds, weights)[0]
+            headers, body, method = {}, b'', 'GET'
+            if kind == 'home':
+                path = '/home.html'
+            elif kind == 'article':
+                path = rng.choice(plan['articles'])
+            elif kind == 'media':
+                path, size = rng.choice(plan['media'])
+                start = rng.randrange(max(1, size - RANGE_BYTES))
+                headers['Range'] = f'bytes={start}-{start + RANGE_BYTES - 1}'
+            else:
+                method, path, body = 'POST', '/update', rng.choice(plan['saves'])
+                headers = {'Content-Type': 'application/x-www-form-urlencoded', 'Cookie': plan['cookie']}
+            t0 = time.perf_counter()
+            try:
+                status, _, size = await conn.request(method, path, headers, body)
+            except (OSError, ConnectionError, ValueError, IndexError, asyncio.IncompleteReadError,
+                    asyncio.TimeoutError) as e:
+                stats.add(kind, time.perf_counter() - t0, error=type(e).__name__)
+                continue
+            if kind == 'media' and status == 200:
+                kind = 'media_full'  # Range ignored: a whole-file download, not a range read
+            stats.add(kind, time.perf_counter() - t0, status, size)
+    finally:
+        await conn.close()
+
+
+def parse_mix(text):
+    mix = dict(DEFAULT_MIX)
+    if text:
+        mix = {k: 0 for k in DEFAULT_MIX}
+        for part in text.split(','):
+            k, _, v = part.partition('=')
+            if k.strip() not in DEFAULT_MIX:
+                raise SystemExit(f'unknown request kind {k!r}; use {", ".join(DEFAULT_MIX)}')
+            mix[k.strip()] = float(v or 1)
+    return mix
+
+
+def port_open(host, port):
+    try:
+        socket.create_connection((host, port), 0.5).close()
+        return True
+    except OSError:
+        return False
+
+
+def free_port(host):
+    with socket.socket() as s:
+        s.bind((host, 0))
+        return s.getsockname()[1]
+
+
+def wait_for_port(host, port, server=None, timeout=20):
+    """True once `port` accepts connections; False on timeout or if `server` exits first."""
+    end = time.monotonic() + timeout
+    while time.monotonic() < end:
+        if server is not None and server.poll() is not None:
+            return False
+        if port_open(host, port):
+            return True
+        time.sleep(0.2)
+    return False
+
+
+def start_server(cmd, host, cwd):
+    """Start `cmd` on a free port (passed as PORT); returns (process, port, stderr file).
+
+    Fails instead of measuring another server: the port must be closed
+    before the start and the started process must still be running once
+    it opens.
+    """
+    port = free_port(host)
+    if port_open(host, port):
+        raise SystemExit(f'port {port} on {host} is already in use')
+    err = tempfile.TemporaryFile()
+    server = subprocess.Popen(cmd.split(), cwd=str(cwd), env=dict(os.environ, PORT=str(port)),
+                              stdout=subprocess.DEVNULL, stderr=err)
+    if not wait_for_port(host, port, server) or server.poll() is not None:
+        server.terminate()
+        server.wait(timeout=10)
+        err.seek(0)
+        detail = err.read().decode('utf-8', 'replace').strip()[-2000:]
+        raise SystemExit(f'{cmd!r} did not start listening on port {port}' + (f':\n{detail}' if detail else ''))
+    return server, port, err
+
+
+async def run(args):
+    parts = urlsplit(args.url)
+    host, port = parts.hostname or 'localhost', parts.port or 80
+    mix = parse_mix(args.mix)
+    plan = {'articles': article_urls(), 'media': media_files(args.db), 'saves': [], 'cookie': ''}
+    notes = []
+    if mix['save'] and not (args.user and args.password):
+        mix['save'] = 0
+        notes.append('save dropped from the mix: no --user/--password')
+    if mix['save'] and args.site is None:
+        raise SystemExit('save requests rewrite articles.db; they only run with --start, against a scratch copy')
+    if mix['save']:
+        plan['cookie'] = await login(host, port, args.user, args.password, args.timeout)
+        plan['saves'] = save_forms(args.db)
+    for kind, key in (('article', 'articles'), ('media', 'media'), ('save', 'saves')):
+        if mix[kind] and not plan[key]:
+            mix[kind] = 0
+            notes.append(f'{kind} dropped from the mix: nothing to request')
+    plan['mix'] = {k: v for k, v in mix.items() if v}
+    if not plan['mix']:
+        raise SystemExit('empty request mix')
+    before = slugs(args.db) if mix['save'] else None
+
+    stats = Stats()
+    rng = random.Random(args.seed)
+    budget = [args.requests] if args.requests else None
+    started = datetime.datetime.now().isoformat(timespec='seconds')
+    t0 = time.monotonic()
+    deadline = t0 + (args.duration if not args.requests else 1e9)
+    await asyncio.gather(*(worker(host, port, args, plan, stats, deadline, budget, random.Random(rng.random()))
+                           for _ in range(args.concurrency)))
+    elapsed = time.monotonic() - t0
+    report = stats.report(elapsed)
+    media = report['by_kind']
+    if 'media_full' in media:
+        full, ranged = media['media_full']['requests'], media.get('media', {}).get('requests', 0)
+        notes.append(f'the target ignored Range on {full} of {full + ranged} media requests (200 with the whole '
+                     'file); media_full measures whole-file downloads, not range reads')
+    check = None
+    if before is not None:
+        after = slugs(args.db)
+        changed = sorted((before[i], after.get(i)) for i in before if after.get(i) != before[i])
+        check = {'articles': len(before), 'slugs_changed': len(changed),
+                 'examples': [{'before': a, 'after': b} for a, b in changed[:10]]}
+        if changed:
+            notes.append(f'{len(changed)} articles changed slug during the run (scratch copy only)')
+    return {
+        'label': args.label,
+        'target': args.url,
+        'started': started,
+        'elapsed_s': round(elapsed, 3),
+        'config': {'concurrency': args.concurrency, 'duration': args.duration, 'requests': args.requests,
+                   'mix': plan['mix'], 'seed': args.seed, 'timeout': args.timeout,
+                   'articles': len(plan['articles']), 'media': len(plan['media'])},
+        'notes': notes,
+        **report,
+        **({'save_check': check} if check is not None else {}),
+    }
+
+
+def main():
+    p = argparse.ArgumentParser(description='Replay a concurrent request mix against the local site server')
+    p.add_argument('--url', default='http://localhost:3000', help='server base URL')
+    p.add_argument('--start', nargs='?', const='node admin_server.js', metavar='CMD',
+                   help='start the server with CMD (default: node admin_server.js) on a free port and stop it afterwards')
+    p.add_argument('--concurrency', type=int, default=16)
+    p.add_argument('--duration', type=float, default=20, help='seconds to run')
+    p.add_argument('--requests', type=int, help='stop after this many requests instead')
+    p.add_argument('--mix', help='weights, e.g. home=1,article=8,media=3,save=0')
+    p.add_argument('--user')
+    p.add_argument('--password')
+    p.add_argument('--timeout', type=float, default=30, help='per-request timeout in seconds')
+    p.add_argument('--seed', type=int, default=1)
+    p.add_argument('--label', default='', help='free text copied into the report')
+    p.add_argument('--json', help='write the report here instead of stdout')
+    p.add_argument('--db', default=str(DB_PATH))
+    args = p.parse_args()
+
+    server, args.site = None, None
+    try:
+        if args.start:
+            if parse_mix(args.mix)['save'] and args.user and args.password:
+                args.site = scratch_site()
+                args.db = str(args.site / 'articles.db')
+            parts = urlsplit(args.url)
+            host = parts.hostname or 'localhost'
+            server, port, _ = start_server(args.start, host, args.site or ROOT)
+            args.url = f"{parts.scheme or 'http'}://{host}:{port}"
+        report = asyncio.run(run(args))
+        if server is not None and server.poll() is not None:
+            raise SystemExit(f'the started server exited during the run (status {server.returncode})')
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=10)
+        if args.site is not None:
+            shutil.rmtree(args.site.parent, ignore_errors=True)
+    text = json.dumps(report, ensure_ascii=False, indent=1)
+    if args.json:
+        Path(args.json).write_text(text + '\n', encoding='utf-8')
+        print(f"{report['requests']} requests, {report['throughput_rps']} req/s, "
+              f"p50 {report['latency_ms']['p50']} ms, p99 {report['latency_ms']['p99']} ms, "
+              f"{report['error_rate'] * 100:.2f}% errors -> {args.json}")
+    else:
+        sys.stdout.write(text + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+"""Index of media files under `articles/` kept in articles.db.
+
+`media` has one row per file in MEDIA_DIRS: path (relative to the repo
+root, so `'/' + path` is its URL), size, mtime, SHA-256, width/height and
+type. `media_refs` records which article slugs reference each file.
+
+The importers and the image/video scripts call `record()` for the files
+and pages they write, so the index stays current without rescanning;
+`gc_media` calls `forget()` for what it removes. `refresh()` walks the
+directories once to catch anything else, hashing only files whose size
+or mtime changed.
+
+Listing is one query on the primary key, so the admin `/media-list`
+endpoint and `export_page()` page through tens of thousands of files
+without touching the disk.
+
+Run from the repo root:
+    python3 scripts/media_index.py                   # incremental rescan
+    python3 scripts/media_index.py --export --page 2 --per-page 200 --type image
+"""
+from hashlib import sha256
+from pathlib import Path
+import argparse
+import json
+import os
+import sqlite3
+import sys
+
+from check_links import extract_refs, is_remote, resolve_local
+from layout import iter_pages
+from lazy_images import image_size
+
+ROOT = Path(__file__).resolve().parents[1]
+ART_DIR = ROOT / 'articles'
+DB_PATH = ROOT / 'articles.db'
+MEDIA_DIRS = [ART_DIR / 'facebook_media', ART_DIR / 'media']
+
+TYPES = {
+    '.jpg': 'image', '.jpeg': 'image', '.png': 'image', '.gif': 'image', '.webp': 'image',
+    '.mp4': 'video', '.mov': 'video', '.webm': 'video',
+    '.mp3': 'audio',
+}
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS media (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    hash TEXT,
+    width INTEGER,
+    height INTEGER,
+    type TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_media_type ON media (type, path);
+CREATE TABLE IF NOT EXISTS media_refs (
+    path TEXT NOT NULL,
+    slug TEXT NOT NULL,
+    PRIMARY KEY (path, slug)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_media_refs_slug ON media_refs (slug);
+'''
+
+
+def connect(db_path=DB_PATH):
+    conn = sqlite3.connect(str(db_path))
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def _key(path):
+    return Path(path).resolve().relative_to(ROOT).as_posix()
+
+
+def _hash(path):
+    h = sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _video_size(conn, key):
+    try:
+        row = conn.execute('SELECT width, height FROM videos WHERE path = ?',
+                           (key[len('articles/'):],)).fetchone()
+    except sqlite3.OperationalError:
+        return None
+    return row
+
+
+def index_file(conn, path, known=None):
+    """Insert or refresh one file's row; returns True if it changed."""
+    path = Path(path)
+    kind = TYPES.get(path.suffix.lower())
+    if kind is None:
+        return False
+    key = _key(path)
+    try:
+        st = path.stat()
+    except FileNotFoundError:
+        conn.execute('DELETE FROM media WHERE path = ?', (key,))
+        return True
+    row = known.get(key) if known is not None else \
+        conn.execute('SELECT size, mtime FROM media WHERE path = ?', (key,)).fetchone()
+    if row is not None and tuple(row[:2]) == (st.st_size, st.st_mtime):
+        return False
+    dims = image_size(path) if kind == 'image' else _video_size(conn, key) if kind == 'video' else None
+    w, h = dims or (None, None)
+    conn.execute('INSERT OR REPLACE INTO media VALUES (?,?,?,?,?,?,?)',
+                 (key, st.st_size, st.st_mtime, _hash(path), w, h, kind))
+    return True
+
+
+def index_page(conn, page):
+    """Replace the media_refs rows of one article page."""
+    page = Path(page)
+    slug = page.stem
+    conn.execute('DELETE FROM media_refs WHERE slug = ?', (slug,))
+    if not page.exists():
+        return 0
+    refs = set()
+    for ref in extract_refs(page.read_text(encoding='utf-8', errors='ignore')):
+        if is_remote(ref):
+            continue
+        target = resolve_local(ref, page)
+        if target is not None and target.suffix.lower() in TYPES:
+            try:
+                refs.add(target.relative_to(ROOT).as_posix())
+            except ValueError:
+                pass
+    conn.executemany('INSERT OR IGNORE INTO media_refs VALUES (?, ?)', [(r, slug) for r in refs])
+    return len(refs)
+
+
+def record(paths=(), pages=(), db_path=DB_PATH):
+    """Hook for scripts that write media or pages: index just those."""
+    conn = connect(db_path)
+    with conn:
+        for p in paths:
+            index_file(conn, p)
+        for page in pages:
+            index_page(conn, page)
+    conn.close()
+
+
+def forget(paths, db_path=DB_PATH):
+    """Drop rows for files that were moved away or deleted."""
+    keys = []
+    for p in paths:
+        try:
+            keys.append((_key(p),))
+        except ValueError:
+            pass
+    conn = connect(db_path)
+    with conn:
+        conn.executemany('DELETE FROM media WHERE path = ?', keys)
+        conn.executemany('DELETE FROM media_refs WHERE path = ?', keys)
+    conn.close()
+
+
+def _walk(d):
+    with os.scandir(d) as it:
+        for entry in it:
+            if entry.is_dir(follow_symlinks=False):
+                yield from _walk(entry.path)
+            elif entry.is_file() and not entry.name.startswith('.'):
+                yield entry.path
+
+
+def refresh(conn, pages=True):
+    """Full incremental pass: new/changed files, vanished files, page references."""
+    known = {r[0]: r[1:] for r in conn.execute('SELECT path, size, mtime FROM media')}
+    seen = set()
+    changed = 0
+    with conn:
+        for d in MEDIA_DIRS:
+            if not d.exists():
+                continue
+            for f in _walk(d):
+                if Path(f).suffix.lower() not in TYPES:
+                    continue
+                seen.add(_key(f))
+                changed += index_file(conn, f, known)
+        gone = [(k,) for k in known if k not in seen]
+        conn.executemany('DELETE FROM media WHERE path = ?', gone)
+        if pages:
+            conn.execute('DELETE FROM media_refs')
+            for page in iter_pages('*.html', ART_DIR):
+                index_page(conn, page)
+    return len(seen), changed, len(gone)
+
+
+def export_page(conn, page=1, per_page=100, kind=None, prefix=None):
+    """One page of the index as a JSON-ready dict, ordered by path."""
+    where, params = [], []
+    if kind:
+        where.append('m.type = ?')
+        params.append(kind)
+    if prefix:
+        where.append('m.path >= ? AND m.path < ?')
+        params += [prefix, prefix + '\uffff']
+    sql_where = (' WHERE ' + ' AND '.join(where)) if where else ''
+    total = conn.execute(f'SELECT COUNT(1) FROM media m{sql_where}', params).fetchone()[0]
+    rows = conn.execute(
+        f'SELECT m.path, m.size, m.mtime, m.hash, m.width, m.height, m.type, '
+        f'(SELECT group_concat(r.slug) FROM media_refs r WHERE r.path = m.path) '
+        f'FROM media m{sql_where} ORDER BY m.path LIMIT ? OFFSET ?',
+        params + [per_page, (page - 1) * per_page]).fetchall()
+    items = [{'url': '/' + p, 'size': s, 'mtime': mt, 'hash': h, 'width': w, 'height': ht, 'type': t,
+              'slugs': refs.split(',') if refs else []} for p, s, mt, h, w, ht, t, refs in rows]
+    return {'page': page, 'per_page': per_page, 'total': total, 'items': items}
+
+
+if __name__ == '__main__':
+    p = argparse.ArgumentParser(description='Maintain and export the media index in articles.db')
+    p.add_argument('--db', default=str(DB_PATH))
+    p.add_argument('--export', action='store_true', help='print one page of the index as JSON')
+    p.add_argument('--page', type=int, default=1)
+    p.add_argument('--per-page', type=int, default=100)
+    p.add_argument('--type', choices=sorted(set(TYPES.values())))
+    p.add_argument('--prefix', help="only paths under this prefix, e.g. 'articles/facebook_media/'")
+    args = p.parse_args()
+    conn = connect(args.db)
+    if args.export:
+        json.dump(export_page(conn, args.page, args.per_page, args.type, args.prefix), sys.stdout,
+                  ensure_ascii=False, indent=1)
+        print()
+    else:
+        files, changed, gone = refresh(conn)
+        print(f'Indexed {files} media files ({changed} new or changed, {gone} removed)')
+    conn.close()
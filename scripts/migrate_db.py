@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""Migrate `articles.db` to the indexed listing schema.
+
+`pub_date` stays as the human-readable ISO text the admin server writes,
+but listing and timeline queries now sort and filter on `pub_ts`, an
+integer epoch (UTC) derived from it:
+
+  - `pub_ts` is backfilled in Python through `dates.parse_date`, so the
+    odd formats left by older imports are normalised too
+  - triggers keep `pub_ts` in sync when `pub_date` is inserted or updated
+    by anything else (the Node admin server, `sync_articles_from_files`),
+    using SQLite's own ISO parser
+  - `idx_articles_list` covers (pub_ts, id, slug, title, pub_date, excerpt),
+    so the card list, the admin list and year/month range filters are
+    answered from the index alone and never read the `content` pages
+  - `idx_articles_slug` covers slug lookups for the same columns
+
+The migration is idempotent; rerun it after bulk imports to re-normalise
+any rows SQLite could not parse (`pub_ts IS NULL`).
+
+Run from the repo root: `python3 scripts/migrate_db.py [--explain]`
+"""
+from pathlib import Path
+import argparse
+import datetime
+import sqlite3
+
+from dates import parse_date_or_none
+
+ROOT = Path(__file__).resolve().parents[1]
+DB_PATH = ROOT / 'articles.db'
+
+LIST_COLUMNS = 'id, slug, title, pub_date, pub_ts, excerpt'
+
+DDL = [
+    'CREATE INDEX IF NOT EXISTS idx_articles_list ON articles (pub_ts DESC, id DESC, slug, title, pub_date, excerpt)',
+    'CREATE INDEX IF NOT EXISTS idx_articles_slug ON articles (slug, id, title, pub_date, pub_ts, excerpt)',
+    '''CREATE TRIGGER IF NOT EXISTS articles_pub_ts_insert AFTER INSERT ON articles
+       WHEN NEW.pub_ts IS NULL
+       BEGIN
+           UPDATE articles SET pub_ts = CAST(strftime('%s', NEW.pub_date) AS INTEGER) WHERE id = NEW.id;
+       END''',
+    '''CREATE TRIGGER IF NOT EXISTS articles_pub_ts_update AFTER UPDATE OF pub_date ON articles
+       BEGIN
+           UPDATE articles SET pub_ts = CAST(strftime('%s', NEW.pub_date) AS INTEGER) WHERE id = NEW.id;
+       END''',
+]
+
+# queries the site runs; --explain shows they stay index-only
+LIST_QUERY = f'SELECT {LIST_COLUMNS} FROM articles ORDER BY pub_ts DESC, id DESC'
+RANGE_QUERY = f'SELECT {LIST_COLUMNS} FROM articles WHERE pub_ts >= ? AND pub_ts < ? ORDER BY pub_ts DESC, id DESC'
+TIMELINE_QUERY = 'SELECT DISTINCT pub_ts FROM articles ORDER BY pub_ts DESC'
+
+
+def to_epoch(pub_date):
+    dt = parse_date_or_none(pub_date)
+    if dt is None:
+        return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=datetime.timezone.utc)
+    return int(dt.timestamp())
+
+
+def month_range(year, month=None):
+    """[start, end) epoch bounds for a year or a single month, for RANGE_QUERY."""
+    utc = datetime.timezone.utc
+    if month is None:
+        start = datetime.datetime(year, 1, 1, tzinfo=utc)
+        end = datetime.datetime(year + 1, 1, 1, tzinfo=utc)
+    else:
+        start = datetime.datetime(year, month, 1, tzinfo=utc)
+        end = datetime.datetime(year + month // 12, month % 12 + 1, 1, tzinfo=utc)
+    return int(start.timestamp()), int(end.timestamp())
+
+
+def columns(conn, table='articles'):
+    return {r[1] for r in conn.execute(f'PRAGMA table_info({table})')}
+
+
+def migrate(conn, refresh=False):
+    if 'pub_ts' not in columns(conn):
+        conn.execute('ALTER TABLE articles ADD COLUMN pub_ts INTEGER')
+    where = '' if refresh else ' WHERE pub_ts IS NULL'
+    rows = conn.execute(f'SELECT id, pub_date FROM articles{where}').fetchall()
+    updates = [(to_epoch(d), i) for i, d in rows]
+    conn.executemany('UPDATE articles SET pub_ts = ? WHERE id = ?', updates)
+    for stmt in DDL:
+        conn.execute(stmt)
+    conn.commit()
+    conn.execute('ANALYZE')
+    return len(updates), sum(1 for ts, _ in updates if ts is None)
+
+
+def explain(conn):
+    y0, y1 = month_range(2008)
+    for label, sql, params in (('list', LIST_QUERY, ()), ('year', RANGE_QUERY, (y0, y1)),
+                               ('timeline', TIMELINE_QUERY, ())):
+        plan = ' | '.join(r[-1] for r in conn.execute('EXPLAIN QUERY PLAN ' + sql, params))
+        print(f'{label}: {plan}')
+
+
+if __name__ == '__main__':
+    p = argparse.ArgumentParser(description='Add pub_ts and covering indexes to articles.db')
+    p.add_argument('--db', default=str(DB_PATH))
+    p.add_argument('--refresh', action='store_true', help='recompute pub_ts for every row, not just missing ones')
+    p.add_argument('--explain', action='store_true', help='print query plans for the listing queries')
+    args = p.parse_args()
+    conn = sqlite3.connect(args.db)
+    n, bad = migrate(conn, args.refresh)
+    print(f'Normalised pub_ts for {n} articles ({bad} unparseable pub_date values)')
+    if args.explain:
+        explain(conn)
+    conn.close()
@@ -1,10 +1,12 @@
 #!/usr/bin/env python3
 from pathlib import Path
 from bs4 import BeautifulSoup
-from dateutil import parser as dateparser
+from dates import parse_date
 import argparse
 
-TEMPLATE = Path('article_template.html').read_text(encoding='utf-8')
+from layout import iter_pages
+from safe_write import WriteBatch, write_text
+from templates import render
 
 def normalize_article(path):
     p = Path(path)
@@ -17,7 +19,7 @@ def normalize_article(path):
     date_div = soup.find(class_='_a72d')
     date_text = date_div.get_text(strip=True) if date_div else ''
     try:
-        dt = dateparser.parse(date_text)
+        dt = parse_date(date_text)
         date_str = dt.strftime('%Y.%m.%d')
     except Exception:
         date_str = ''
@@ -27,15 +29,14 @@ def normalize_article(path):
         content_html = ''.join(str(c) for c in sec.contents)
     else:
         content_html = ''.join(str(c) for c in soup.body.contents) if soup.body else text
-    # Fill template
-    out = TEMPLATE.replace('{{TITLE}}', title).replace('{{DATE}}', date_str).replace('{{CONTENT}}', content_html)
-    p.write_text(out, encoding='utf-8')
+    write_text(p, render('article', TITLE=title, DATE=date_str, CONTENT=content_html))
 
 def main(articles_dir):
     p = Path(articles_dir)
-    files = sorted(p.glob('article_fb_*.html'))
-    for f in files:
-        normalize_article(f)
+    files = list(iter_pages('article_fb_*.html', p))
+    with WriteBatch(journal=True):
+        for f in files:
+            normalize_article(f)
     return len(files)
 
 if __name__ == '__main__':
@@ -0,0 +1,357 @@
+#!/usr/bin/env python3
+"""Lossless recompression and metadata stripping for archived photos.
+
+Works on the media directories of the index (`articles/facebook_media`
+and the `articles/media/<stem>/` copies written by process_wp_images.py):
+
+  - JPEG: EXIF, XMP and IPTC blocks and comments are dropped. ICC
+    profiles and the Adobe marker (needed to decode CMYK) are kept, and a
+    non-default orientation is written back as a minimal EXIF block that
+    holds only that tag, so photos still display upright. With `jpegtran`
+    on PATH the scan is then rewritten with optimized Huffman tables,
+    both baseline and progressive, and the smaller result kept
+  - PNG: text, time and EXIF chunks are dropped and the image data is
+    re-deflated at level 9 with several strategies; `oxipng` or
+    `optipng`, if installed, run afterwards. Animated PNGs are only
+    stripped
+
+A candidate is verified before it replaces anything. Its dimensions,
+including orientation, must match the original. A re-deflated PNG must
+inflate to the same pixel stream. With Pillow installed, the decoded
+pixels are compared too. Files that would not shrink are left alone.
+The original is copied to `backups/image_originals/` before the
+optimized file replaces it. `--prune-originals` deletes those copies
+only when every optimized file still matches its recorded hash and
+passes verification against its copy.
+
+Files are optimized in a process pool (`--workers`). The `image_opt`
+table in articles.db records each file's size, mtime and hash after its
+run. On later runs a file is skipped when its size and mtime match,
+or failing that its hash.
+
+Run from the repo root: `python3 scripts/optimize_images.py [--workers 4] [--dry-run] [--prune-originals]`
+"""
+from concurrent.futures import ProcessPoolExecutor
+from hashlib import sha256
+from pathlib import Path
+import argparse
+import datetime
+import os
+import shutil
+import sqlite3
+import struct
+import subprocess
+import tempfile
+import zlib
+
+from lazy_images import image_size, jpeg_orientation
+from media_index import MEDIA_DIRS, record
+from safe_write import WriteBatch, copy_file, write_bytes
+
+try:
+    from PIL import Image
+except Exception:
+    Image = None
+
+ROOT = Path(__file__).resolve().parents[1]
+ORIGINALS_DIR = ROOT / 'backups' / 'image_originals'
+DB_PATH = ROOT / 'articles.db'
+
+JPEG_EXTS = {'.jpg', '.jpeg'}
+PNG_EXTS = {'.png'}
+PNG_SIG = b'\x89PNG\r\n\x1a\n'
+PNG_KEEP = {b'IHDR', b'PLTE', b'IDAT', b'IEND', b'tRNS', b'gAMA', b'cHRM', b'sRGB', b'iCCP', b'sBIT',
+            b'pHYs', b'bKGD', b'acTL', b'fcTL', b'fdAT'}
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS image_opt (
+    path TEXT PRIMARY KEY,
+    size INTEGER,
+    mtime REAL,
+    hash TEXT,
+    orig_size INTEGER,
+    orig_hash TEXT,
+    tool TEXT,
+    updated TEXT
+);
+'''
+
+
+def tools():
+    """External optimizers found on PATH: {'jpeg': path or None, 'png': (name, path) or None}."""
+    png = next(((name, shutil.which(name)) for name in ('oxipng', 'optipng') if shutil.which(name)), None)
+    return {'jpeg': shutil.which('jpegtran'), 'png': png}
+
+
+def _sha(data):
+    return sha256(data).hexdigest()
+
+
+def _jpeg_segments(data):
+    """(marker, segment) for each header segment, then (None, rest) from the first SOS."""
+    pos = 2
+    while pos + 4 <= len(data):
+        if data[pos] != 0xFF:
+            raise ValueError('bad JPEG marker')
+        marker = data[pos + 1]
+        if marker == 0xFF:
+            pos += 1
+            continue
+        if marker == 0xDA:
+            break
+        if marker == 0x01 or 0xD0 <= marker <= 0xD7:
+            yield marker, data[pos:pos + 2]
+            pos += 2
+            continue
+        length = struct.unpack('>H', data[pos + 2:pos + 4])[0]
+        yield marker, data[pos:pos + 2 + length]
+        pos += 2 + length
+    yield None, data[pos:]
+
+
+def orientation_app1(orientation):
+    """APP1 segment with an EXIF IFD holding only the orientation tag."""
+    tiff = b'MM\x00*\x00\x00\x00\x08' + struct.pack('>HHHIHH', 1, 0x0112, 3, 1, orientation, 0) + b'\x00' * 4
+    body = b'Exif\x00\x00' + tiff
+    return b'\xff\xe1' + struct.pack('>H', len(body) + 2) + body
+
+
+def strip_jpeg(data):
+    """Drop metadata segments, keeping JFIF, ICC, Adobe and the orientation."""
+    if not data.startswith(b'\xff\xd8'):
+        raise ValueError('not a JPEG')
+    out, orientation, jfif_at = [b'\xff\xd8'], 1, None
+    for marker, seg in _jpeg_segments(data):
+        if marker is None:
+            out.append(seg)
+            break
+        body = seg[4:]
+        if marker == 0xE1:
+            if orientation == 1:
+                orientation = jpeg_orientation(body)
+            continue
+        if marker == 0xFE or (0xE0 < marker <= 0xEF and not (
+                (marker == 0xE2 and body.startswith(b'ICC_PROFILE\x00')) or
+                (marker == 0xEE and body.startswith(b'Adobe')))):
+            continue
+        out.append(seg)
+        if marker == 0xE0 and jfif_at is None:
+            jfif_at = len(out)
+    if orientation != 1:
+        out.insert(jfif_at or 1, orientation_app1(orientation))
+    return b''.join(out)
+
+
+def optimise_jpeg(data, found):
+    best, tool = strip_jpeg(data), 'strip'
+    if found['jpeg']:
+        for progressive in (False, True):
+            args = [found['jpeg'], '-copy', 'all', '-optimize'] + (['-progressive'] if progressive else [])
+            try:
+                out = subprocess.run(args, input=best, capture_output=True, check=True).stdout
+            except subprocess.CalledProcessError:
+                continue
+            if out and len(out) < len(best):
+                best, tool = out, 'jpegtran'
+    return best, tool
+
+
+def _png_chunks(data):
+    pos = 8
+    while pos + 8 <= len(data):
+        length, ctype = struct.unpack('>I4s', data[pos:pos + 8])
+        yield ctype, data[pos + 8:pos + 8 + length]
+        pos += 12 + length
+        if ctype == b'IEND':
+            break
+
+
+def _png_chunk(ctype, body):
+    return struct.pack('>I', len(body)) + ctype + body + struct.pack('>I', zlib.crc32(ctype + body) & 0xFFFFFFFF)
+
+
+def png_pixels(data):
+    """The inflated (still filtered) image data of a PNG."""
+    return zlib.decompress(b''.join(body for ctype, body in _png_chunks(data) if ctype == b'IDAT'))
+
+
+def recompress_png(data):
+    """Strip ancillary chunks and re-deflate IDAT with the smallest zlib strategy."""
+    if not data.startswith(PNG_SIG):
+        raise ValueError('not a PNG')
+    chunks = [(t, b) for t, b in _png_chunks(data) if t in PNG_KEEP]
+    animated = any(t == b'acTL' for t, _ in chunks)
+    idat = b''.join(b for t, b in chunks if t == b'IDAT')
+    if not animated:
+        raw = zlib.decompress(idat)
+        for strategy in (zlib.Z_DEFAULT_STRATEGY, zlib.Z_FILTERED):
+            c = zlib.compressobj(9, zlib.DEFLATED, 15, 9, strategy)
+            z = c.compress(raw) + c.flush()
+            if len(z) < len(idat):
+                idat = z
+    out, merged = [PNG_SIG], False
+    for t, b in chunks:
+        if t == b'IDAT' and not animated:
+            if not merged:
+                out.append(_png_chunk(t, idat))
+                merged = True
+            continue
+        out.append(_png_chunk(t, b))
+    return b''.join(out)
+
+
+def optimise_png(data, found, scratch):
+    best, tool = recompress_png(data), 'deflate'
+    if found['png']:
+        name, exe = found['png']
+        scratch.write_bytes(best)
+        args = [exe, '-o', '2', '--strip', 'safe', '-q', str(scratch)] if name == 'oxipng' else \
+            [exe, '-quiet', '-o2', str(scratch)]
+        try:
+            subprocess.run(args, capture_output=True, check=True)
+            out = scratch.read_bytes()
+            if out and len(out) < len(best):
+                best, tool = out, name
+        except subprocess.CalledProcessError:
+            pass
+    return best, tool
+
+
+def verify(original, candidate, tool):
+    """Raise ValueError unless `candidate` shows the same image as `original` (both paths)."""
+    if image_size(original) != image_size(candidate):
+        raise ValueError('dimensions or orientation changed')
+    if tool == 'deflate' and png_pixels(original.read_bytes()) != png_pixels(candidate.read_bytes()):
+        raise ValueError('PNG pixel data changed')
+    if Image is not None:
+        with Image.open(original) as a, Image.open(candidate) as b:
+            if a.mode != b.mode or a.size != b.size or a.tobytes() != b.tobytes():
+                raise ValueError('decoded pixels differ')
+
+
+def process(job):
+    """Worker: optimise one file; returns the new bytes only if they are smaller and verified."""
+    path, found = job
+    path = Path(path)
+    try:
+        data = path.read_bytes()
+        r = {'path': str(path), 'before': len(data), 'orig_hash': _sha(data)}
+        with tempfile.TemporaryDirectory(prefix='optimg.') as tmp:
+            scratch = Path(tmp) / ('candidate' + path.suffix.lower())
+            if path.suffix.lower() in JPEG_EXTS:
+                new, tool = optimise_jpeg(data, found)
+            else:
+                new, tool = optimise_png(data, found, scratch)
+            if len(new) >= len(data):
+                return {**r, 'after': len(data), 'hash': r['orig_hash'], 'tool': None}
+            scratch.write_bytes(new)
+            verify(path, scratch, tool)
+        return {**r, 'after': len(new), 'hash': _sha(new), 'tool': tool, 'data': new}
+    except (OSError, ValueError, struct.error, zlib.error) as e:
+        return {'path': str(path), 'error': str(e)[-300:]}
+
+
+def pending(conn, force=False):
+    """Images not optimized since they last changed."""
+    known = {r[0]: r[1:] for r in conn.execute('SELECT path, size, mtime, hash FROM image_opt')}
+    for d in MEDIA_DIRS:
+        if not d.exists():
+            continue
+        for path in sorted(d.rglob('*')):
+            if path.name.startswith('.') or path.suffix.lower() not in JPEG_EXTS | PNG_EXTS or not path.is_file():
+                continue
+            rel = path.relative_to(ROOT).as_posix()
+            row = known.get(rel)
+            st = path.stat()
+            if not force and row is not None and (row[0], row[1]) == (st.st_size, st.st_mtime):
+                continue
+            if not force and row is not None and row[2] == _sha(path.read_bytes()):
+                conn.execute('UPDATE image_opt SET size = ?, mtime = ? WHERE path = ?', (st.st_size, st.st_mtime, rel))
+                continue
+            yield path
+
+
+def run(workers=None, force=False, dry_run=False, db_path=DB_PATH):
+    conn = sqlite3.connect(str(db_path))
+    conn.executescript(SCHEMA)
+    found = tools()
+    jobs = [(str(p), found) for p in pending(conn, force)]
+    conn.commit()
+    now = datetime.datetime.now().isoformat(timespec='seconds')
+    done = failed = smaller = saved = 0
+    changed = []
+    with ProcessPoolExecutor(max_workers=workers) as pool, WriteBatch():
+        for r in pool.map(process, jobs, chunksize=4):
+            path = Path(r['path'])
+            rel = path.relative_to(ROOT).as_posix()
+            if 'error' in r:
+                failed += 1
+                print(f"  {rel}: {r['error']}")
+                continue
+            done += 1
+            if r['tool']:
+                smaller += 1
+                saved += r['before'] - r['after']
+                print(f"  {rel}: {r['before']} -> {r['after']} bytes "
+                      f"(-{r['before'] - r['after']}, {100 * (r['before'] - r['after']) / r['before']:.1f}%, {r['tool']})")
+            if dry_run:
+                continue
+            if r['tool']:
+                # the original stays in backups/ until --prune-originals has re-verified the new file
+                original = ORIGINALS_DIR / rel
+                if not original.exists():
+                    original.parent.mkdir(parents=True, exist_ok=True)
+                    copy_file(path, original)
+                write_bytes(path, r['data'])
+                changed.append(path)
+            st = path.stat()
+            conn.execute('INSERT OR REPLACE INTO image_opt VALUES (?,?,?,?,?,?,?,?)',
+                         (rel, st.st_size, st.st_mtime, r['hash'], r['before'], r['orig_hash'], r['tool'], now))
+    conn.commit()
+    conn.close()
+    if changed:
+        record(changed, db_path=db_path)
+    return done, failed, smaller, saved
+
+
+def prune_originals(db_path=DB_PATH):
+    """Delete kept originals once their optimized file still matches and verifies."""
+    conn = sqlite3.connect(str(db_path))
+    conn.executescript(SCHEMA)
+    rows = conn.execute('SELECT path, hash, tool FROM image_opt WHERE tool IS NOT NULL').fetchall()
+    conn.close()
+    pruned, kept = 0, []
+    for rel, h, tool in rows:
+        original, path = ORIGINALS_DIR / rel, ROOT / rel
+        if not original.exists():
+            continue
+        try:
+            if _sha(path.read_bytes()) != h:
+                raise ValueError('changed since it was optimized')
+            verify(original, path, tool)
+        except (OSError, ValueError, zlib.error) as e:
+            kept.append((rel, str(e)))
+            continue
+        original.unlink()
+        pruned += 1
+    for rel, why in kept:
+        print(f'  kept backup of {rel}: {why}')
+    return pruned, len(kept)
+
+
+if __name__ == '__main__':
+    p = argparse.ArgumentParser(description='Losslessly recompress and strip metadata from archived photos')
+    p.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='worker processes')
+    p.add_argument('--force', action='store_true', help='reprocess images even if already optimized')
+    p.add_argument('--dry-run', action='store_true', help='report savings without replacing files')
+    p.add_argument('--prune-originals', action='store_true',
+                   help='delete backups/image_originals copies whose optimized file verifies')
+    p.add_argument('--db', default=str(DB_PATH))
+    args = p.parse_args()
+    if args.prune_originals:
+        pruned, kept = prune_originals(args.db)
+        print(f'Removed {pruned} original copies, kept {kept}')
+    else:
+        done, failed, smaller, saved = run(args.workers, args.force, args.dry_run, args.db)
+        verb = 'would shrink' if args.dry_run else 'shrank'
+        print(f'Checked {done} images ({failed} failed), {verb} {smaller}, saving {saved} bytes')
@@ -3,6 +3,10 @@ from bs4 import BeautifulSoup
 from pathlib import Path
 import sqlite3
 
+from content_store import set_content, write_codec
+from layout import iter_pages, relink
+from safe_write import WriteBatch, write_text
+
 ROOT = Path(__file__).resolve().parents[1]
 ART_DIR = ROOT / 'articles'
 DB_PATH = ROOT / 'articles.db'
@@ -46,28 +50,30 @@ def build_fragment(container):
 
 def main():
     conn = sqlite3.connect(str(DB_PATH))
-    cur = conn.cursor()
+    codec = write_codec(conn)
     updated = 0
-    for p in sorted(ART_DIR.glob('*.html')):
-        s = BeautifulSoup(p.read_text(encoding='utf-8'), 'html.parser')
-        cont = s.find('div', class_='article-content')
-        if not cont:
-            continue
-        frag = build_fragment(cont)
-        # Update file: replace inner HTML of content div
-        cont.clear()
-        newfrag = BeautifulSoup(frag, 'html.parser')
-        for c in newfrag.contents:
-            cont.append(c)
-        p.write_text(str(s), encoding='utf-8')
-        # Update DB
-        slug = p.name[:-5]
-        cur.execute('UPDATE articles SET content = ? WHERE slug = ?', (frag, slug))
-        if cur.rowcount:
-            updated += 1
-    conn.commit()
+    # files are journaled so a failed run leaves neither files nor DB half-updated
+    with WriteBatch(journal=True):
+        pages = list(iter_pages('*.html', ART_DIR))
+        for p in pages:
+            s = BeautifulSoup(p.read_text(encoding='utf-8'), 'html.parser')
+            cont = s.find('div', class_='article-content')
+            if not cont:
+                continue
+            frag = build_fragment(cont)
+            # Update file: replace inner HTML of content div
+            cont.clear()
+            newfrag = BeautifulSoup(frag, 'html.parser')
+            for c in newfrag.contents:
+                cont.append(c)
+            write_text(p, str(s))
+            # Update DB
+            slug = p.name[:-5]
+            if set_content(conn, slug, relink(frag, p.parent, ART_DIR), codec):
+                updated += 1
+        conn.commit()
     conn.close()
-    print(f'Processed {len(list(ART_DIR.glob("*.html")))} files, updated DB for {updated} articles')
+    print(f'Processed {len(pages)} files, updated DB for {updated} articles')
 
 if __name__ == '__main__':
     main()
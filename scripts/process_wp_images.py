@@ -3,8 +3,13 @@ import sys
 from pathlib import Path
 import re
 import shutil
+import sqlite3
 import urllib.request
 
+from layout import find_page
+from media_index import record
+from safe_write import copy_file, write_text
+
 try:
     from bs4 import BeautifulSoup
 except Exception:
@@ -61,7 +66,8 @@ IGNORE_PREFIXES = ('data:', 'javascript:')
 
 
 def process_article(article_path: Path):
-    repo_root = article_path.parent.parent
+    # the page may sit in a YYYY/MM shard, see layout.py
+    repo_root = next(p.parent for p in article_path.resolve().parents if p.name == 'articles')
     html = article_path.read_text(encoding='utf-8')
 
     # parse
@@ -85,6 +91,7 @@ def process_article(article_path: Path):
     ensure_dir(dest_dir)
 
     anchors = []
+    written = []
     modified = False
 
     for img in imgs:
@@ -131,6 +138,7 @@ def process_article(article_path: Path):
 
             # create thumbnail
             make_thumb(local_full, local_thumb)
+            written.extend([local_full, local_thumb])
 
             # create anchor wrapper
             a = soup.new_tag('a', href=str(Path('articles') / 'media' / article_path.stem / filename))
@@ -168,17 +176,43 @@ def process_article(article_path: Path):
     if modified:
         backup = article_path.with_suffix(article_path.suffix + '.bak')
         if not backup.exists():
-            shutil.copy2(article_path, backup)
-        article_path.write_text(str(soup), encoding='utf-8')
+            copy_file(article_path, backup)
+        write_text(article_path, str(soup))
+        record(written, [article_path])
         print('Updated article:', article_path)
     else:
         print('No changes made to', article_path)
 
 
+def process_queue(db_path):
+    """Localize images for every article queued by import_wordpress.py."""
+    db_path = Path(db_path)
+    art_dir = db_path.parent / 'articles'
+    conn = sqlite3.connect(str(db_path))
+    try:
+        slugs = [s for (s,) in conn.execute("SELECT DISTINCT slug FROM image_queue WHERE status = 'pending'")]
+    except sqlite3.OperationalError:
+        print('No image queue in', db_path)
+        return
+    for slug in slugs:
+        article = find_page(slug, art_dir)
+        if not article.exists():
+            print('Skipping', slug, '(page not generated yet)')
+            continue
+        process_article(article)
+        conn.execute("UPDATE image_queue SET status = 'done' WHERE slug = ?", (slug,))
+        conn.commit()
+    conn.close()
+
+
 if __name__ == '__main__':
     if len(sys.argv) < 2:
         print('Usage: process_wp_images.py path/to/article.html')
+        print('       process_wp_images.py --from-queue [articles.db]')
         sys.exit(2)
+    if sys.argv[1] == '--from-queue':
+        process_queue(sys.argv[2] if len(sys.argv) > 2 else 'articles.db')
+        sys.exit(0)
     p = Path(sys.argv[1])
     if not p.exists():
         print('Article not found:', p)
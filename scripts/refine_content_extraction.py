@@ -3,6 +3,9 @@ from bs4 import BeautifulSoup
 from pathlib import Path
 import sqlite3
 
+from content_store import set_content, write_codec
+from layout import iter_pages, relink
+
 ROOT = Path(__file__).resolve().parents[1]
 ART_DIR = ROOT / 'articles'
 DB_PATH = ROOT / 'articles.db'
@@ -60,9 +63,9 @@ def find_best_candidate(container):
 
 def main():
     conn = sqlite3.connect(str(DB_PATH))
-    cur = conn.cursor()
+    codec = write_codec(conn)
     updated = 0
-    for p in sorted(ART_DIR.glob('*.html')):
+    for p in iter_pages('*.html', ART_DIR):
         slug = p.name[:-5]
         s = BeautifulSoup(p.read_text(encoding='utf-8'), 'html.parser')
         cont = s.find('div', class_='article-content')
@@ -75,8 +78,7 @@ def main():
         else:
             inner_html = ''.join(str(c) for c in cont.contents)
 
-        cur.execute('UPDATE articles SET content = ? WHERE slug = ?', (inner_html, slug))
-        if cur.rowcount:
+        if set_content(conn, slug, relink(inner_html, p.parent, ART_DIR), codec):
             updated += 1
     conn.commit()
     conn.close()
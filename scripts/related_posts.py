@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""Precompute related posts and prev/next links for every article.
+
+Runs at build time, before `generate_from_db.js`, and leaves three tables
+in `articles.db` that the generator reads in one query each:
+
+  related_posts  (slug, rank, related_slug, score)   top-k neighbours
+  article_nav    (slug, newer_slug, older_slug)      chronological neighbours
+  related_state  (slug, hash)                        body hash at last run
+
+Similarity is TF-IDF cosine over tokens that work for Chinese as well as
+English: CJK runs become overlapping character bigrams, Latin text becomes
+lower-cased words. Terms that occur in only one article, or in more than
+half of them, cannot tell articles apart and are dropped before scoring.
+Vectors are sparse dicts and neighbours come from an inverted index, so
+each article is only scored against articles sharing a term with it.
+
+Only articles whose body changed since the last run get a full
+recomputation. An unchanged article keeps its list, merged with the
+scores against the changed ones; it is recomputed in full only if one of
+its current neighbours changed or disappeared. IDF weights drift a little
+between full runs; `--all` recomputes everything.
+
+Run from the repo root: `python3 scripts/related_posts.py [--all] [--top 5]`
+"""
+from collections import Counter, defaultdict
+from hashlib import sha1
+from pathlib import Path
+import argparse
+import heapq
+import math
+import re
+import sqlite3
+
+from content_store import iter_content
+from migrate_db import columns
+from text_stats import CJK_RANGES, LATIN_WORD_RE, article_text
+
+ROOT = Path(__file__).resolve().parents[1]
+DB_PATH = ROOT / 'articles.db'
+
+TOP_K = 5
+MIN_SCORE = 0.05
+MAX_DF = 0.5
+
+CJK_RUN_RE = re.compile(f'[{CJK_RANGES}]+')
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS related_posts (
+    slug TEXT NOT NULL,
+    rank INTEGER NOT NULL,
+    related_slug TEXT NOT NULL,
+    score REAL NOT NULL,
+    PRIMARY KEY (slug, rank)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS article_nav (
+    slug TEXT PRIMARY KEY,
+    newer_slug TEXT,
+    older_slug TEXT
+);
+CREATE TABLE IF NOT EXISTS related_state (
+    slug TEXT PRIMARY KEY,
+    hash TEXT NOT NULL
+);
+'''
+
+
+def tokens(text):
+    """CJK character bigrams plus lower-cased Latin words."""
+    out = []
+    for run in CJK_RUN_RE.findall(text):
+        if len(run) == 1:
+            out.append(run)
+        else:
+            out.extend(run[i:i + 2] for i in range(len(run) - 1))
+    out.extend(w.lower() for w in LATIN_WORD_RE.findall(text) if len(w) > 1 and not w.isdigit())
+    return out
+
+
+def build_vectors(counts):
+    """{slug: Counter} -> {slug: {term: weight}}, L2-normalised TF-IDF."""
+    n = len(counts)
+    df = Counter()
+    for c in counts.values():
+        df.update(c.keys())
+    idf = {t: math.log((1 + n) / (1 + d)) + 1 for t, d in df.items() if 1 < d <= max(2, n * MAX_DF)}
+    vectors = {}
+    for slug, c in counts.items():
+        v = {t: (1 + math.log(f)) * idf[t] for t, f in c.items() if t in idf}
+        norm = math.sqrt(sum(w * w for w in v.values()))
+        vectors[slug] = {t: w / norm for t, w in v.items()} if norm else {}
+    return vectors
+
+
+def build_index(vectors):
+    index = defaultdict(list)
+    for slug, v in vectors.items():
+        for t, w in v.items():
+            index[t].append((slug, w))
+    return index
+
+
+def neighbours(slug, vectors, index, k=TOP_K):
+    acc = defaultdict(float)
+    for t, w in vectors[slug].items():
+        for other, w2 in index[t]:
+            acc[other] += w * w2
+    acc.pop(slug, None)
+    return heapq.nlargest(k, ((s, o) for o, s in acc.items() if s >= MIN_SCORE))
+
+
+def dot(a, b):
+    if len(a) > len(b):
+        a, b = b, a
+    return sum(w * b.get(t, 0.0) for t, w in a.items())
+
+
+def _hash(html):
+    return sha1((html or '').encode('utf-8')).hexdigest()
+
+
+def update_nav(conn):
+    order = 'pub_ts DESC, id DESC' if 'pub_ts' in columns(conn) else 'pub_date DESC, id DESC'
+    slugs = [s for (s,) in conn.execute(f'SELECT slug FROM articles WHERE slug IS NOT NULL ORDER BY {order}')]
+    rows = [(s, slugs[i - 1] if i > 0 else None, slugs[i + 1] if i + 1 < len(slugs) else None)
+            for i, s in enumerate(slugs)]
+    conn.execute('DELETE FROM article_nav')
+    conn.executemany('INSERT INTO article_nav VALUES (?, ?, ?)', rows)
+    return len(rows)
+
+
+def refresh(conn, everything=False, k=TOP_K):
+    """Update related_posts / article_nav; returns (articles, recomputed)."""
+    conn.executescript(SCHEMA)
+    previous = dict(conn.execute('SELECT slug, hash FROM related_state'))
+    counts, hashes = {}, {}
+    for slug, html in iter_content(conn, 'slug', 'slug IS NOT NULL'):
+        hashes[slug] = _hash(html)
+        counts[slug] = Counter(tokens(article_text(html)))
+    vectors = build_vectors(counts)
+    index = build_index(vectors)
+
+    changed = {s for s, h in hashes.items() if previous.get(s) != h}
+    removed = set(previous) - set(hashes)
+    stale = changed | removed
+    current = defaultdict(list)
+    for slug, related, score in conn.execute('SELECT slug, related_slug, score FROM related_posts ORDER BY slug, rank'):
+        current[slug].append((score, related))
+
+    results = {}
+    for slug in hashes:
+        if everything or not previous or slug in changed or any(o in stale for _, o in current[slug]):
+            results[slug] = neighbours(slug, vectors, index, k)
+        elif changed:
+            extra = [(dot(vectors[slug], vectors[c]), c) for c in changed]
+            merged = current[slug] + [(s, c) for s, c in extra if s >= MIN_SCORE]
+            new = heapq.nlargest(k, merged)
+            if new != current[slug]:
+                results[slug] = new
+
+    with conn:
+        conn.executemany('DELETE FROM related_posts WHERE slug = ?', [(s,) for s in list(results) + list(removed)])
+        conn.executemany('INSERT INTO related_posts VALUES (?, ?, ?, ?)',
+                         [(s, rank, o, round(score, 4)) for s, lst in results.items()
+                          for rank, (score, o) in enumerate(lst)])
+        conn.executemany('DELETE FROM related_state WHERE slug = ?', [(s,) for s in removed])
+        conn.executemany('INSERT OR REPLACE INTO related_state VALUES (?, ?)',
+                         [(s, hashes[s]) for s in (hashes if everything else changed)])
+        update_nav(conn)
+    return len(hashes), len(results)
+
+
+if __name__ == '__main__':
+    p = argparse.ArgumentParser(description='Precompute related posts and prev/next links in articles.db')
+    p.add_argument('--db', default=str(DB_PATH))
+    p.add_argument('--all', action='store_true', help='recompute every article')
+    p.add_argument('--top', type=int, default=TOP_K, help='neighbours to keep per article')
+    p.add_argument('--show', metavar='SLUG', help='print the stored neighbours of one article')
+    args = p.parse_args()
+    conn = sqlite3.connect(args.db)
+    if args.show:
+        for rank, related, score, title in conn.execute(
+                'SELECT r.rank, r.related_slug, r.score, a.title FROM related_posts r '
+                'LEFT JOIN articles a ON a.slug = r.related_slug WHERE r.slug = ? ORDER BY r.rank', (args.show,)):
+            print(f'{rank}  {score:.3f}  {related}  {title}')
+    else:
+        n, recomputed = refresh(conn, args.all, args.top)
+        print(f'{n} articles, neighbours recomputed for {recomputed}')
+    conn.close()
@@ -1,8 +1,12 @@
 #!/usr/bin/env python3
+import argparse
 import sqlite3
 from bs4 import BeautifulSoup
 from pathlib import Path
 
+from content_store import decode, encode, iter_content, write_codec
+from snapshot import STORE_PATH, iter_field, open_store
+
 ROOT = Path(__file__).resolve().parents[1]
 CUR_DB = ROOT / 'articles.db'
 BACKUP_DB = ROOT / 'articles.db.bak'
@@ -18,17 +22,29 @@ def extract_inner(content):
         return ''.join(str(c) for c in body.contents)
     return content
 
-def main():
-    if not BACKUP_DB.exists():
+def backup_rows(snapshot_id=None):
+    """(slug, content) pairs from a snapshot in backups/snapshots.db, or from articles.db.bak."""
+    if snapshot_id is not None:
+        store = open_store(STORE_PATH)
+        rows = list(iter_field(store, snapshot_id, 'content'))
+        store.close()
+        return rows
+    bconn = sqlite3.connect(str(BACKUP_DB))
+    rows = list(iter_content(bconn))
+    bconn.close()
+    return rows
+
+def main(snapshot_id=None):
+    if snapshot_id is None and not BACKUP_DB.exists():
         print('Backup DB not found:', BACKUP_DB)
         return
-    bconn = sqlite3.connect(str(BACKUP_DB))
-    bcur = bconn.cursor()
     cconn = sqlite3.connect(str(CUR_DB))
     ccur = cconn.cursor()
 
-    bcur.execute("SELECT slug, content FROM articles WHERE content LIKE '%<img%' OR content LIKE '%<video%'")
-    rows = bcur.fetchall()
+    # bodies may be compressed, so filter for media after decoding
+    rows = [(slug, content) for slug, content in backup_rows(snapshot_id)
+            if content and ('<img' in content or '<video' in content)]
+    codec = write_codec(cconn)
     restored = 0
     for slug, content in rows:
         inner = extract_inner(content)
@@ -38,16 +54,19 @@ def main():
         if not r:
             continue
         cur_id, cur_content = r
+        cur_content = decode(cur_content)
         # if current content lacks media, restore
         if cur_content is None or ('<img' not in cur_content and '<video' not in cur_content):
-            ccur.execute('UPDATE articles SET content = ? WHERE id = ?', (inner, cur_id))
+            ccur.execute('UPDATE articles SET content = ? WHERE id = ?', (encode(inner, codec), cur_id))
             if ccur.rowcount:
                 restored += 1
 
     cconn.commit()
-    bconn.close()
     cconn.close()
     print(f'Restored content with media for {restored} articles')
 
 if __name__ == '__main__':
-    main()
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--snapshot', type=int, help='restore from this snapshot id instead of articles.db.bak')
+    args = parser.parse_args()
+    main(args.snapshot)
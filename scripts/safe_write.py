@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""Crash-safe file writes shared by the article scripts.
+
+`write_text` / `write_bytes` skip the write entirely when the file already
+holds the same bytes (so mtimes only change when content does), otherwise
+write to a temp file in the same directory, fsync it and `os.replace` it
+over the target, so a reader or a crash never sees a half-written page.
+
+Inside a `WriteBatch`, directory fsyncs are deferred and done once per
+directory when the batch closes. With `journal=True` the batch also keeps
+a copy of every file it overwrites under `.write_journal/<run>/`; if the
+batch raises, the originals are put back and newly created files removed.
+A journal left behind by a killed run can be rolled back by hand:
+
+    python3 scripts/safe_write.py --list
+    python3 scripts/safe_write.py --rollback .write_journal/<run>
+"""
+from pathlib import Path
+import argparse
+import datetime
+import json
+import os
+import shutil
+import tempfile
+
+ROOT = Path(__file__).resolve().parents[1]
+JOURNAL_DIR = ROOT / '.write_journal'
+
+_batch = None
+
+
+def _fsync_dir(d):
+    try:
+        fd = os.open(str(d), os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def _same_bytes(path, data):
+    try:
+        if path.stat().st_size != len(data):
+            return False
+        return path.read_bytes() == data
+    except FileNotFoundError:
+        return False
+
+
+def write_bytes(path, data):
+    """Atomically write `data` to `path`; returns False if it was already identical."""
+    path = Path(path)
+    if _same_bytes(path, data):
+        if _batch is not None:
+            _batch.skipped += 1
+        return False
+    if _batch is not None:
+        _batch.record(path)
+    fd, tmp = tempfile.mkstemp(prefix=f'.{path.name}.', suffix='.tmp', dir=str(path.parent))
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        try:
+            os.chmod(tmp, path.stat().st_mode & 0o777)
+        except FileNotFoundError:
+            os.chmod(tmp, 0o644)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+    if _batch is not None:
+        _batch.dirs.add(path.parent)
+    else:
+        _fsync_dir(path.parent)
+    return True
+
+
+def write_text(path, text, encoding='utf-8'):
+    return write_bytes(path, text.encode(encoding))
+
+
+def copy_file(src, dst):
+    """Atomic, skip-if-identical copy (used for .bak copies)."""
+    return write_bytes(dst, Path(src).read_bytes())
+
+
+class WriteBatch:
+    """Group writes: one fsync per directory, optional rollback journal.
+
+        with WriteBatch(journal=True) as batch:
+            for p in files:
+                write_text(p, render(p))
+        print(batch.written, batch.skipped)
+    """
+
+    def __init__(self, journal=False, name=None):
+        self.journal = journal
+        self.name = name or datetime.datetime.now().strftime('%Y%m%d_%H%M%S_%f')
+        self.journal_path = JOURNAL_DIR / self.name
+        self.dirs = set()
+        self.entries = []
+        self.seen = set()
+        self.written = 0
+        self.skipped = 0
+
+    def record(self, path):
+        self.written += 1
+        if not self.journal or path in self.seen:
+            return
+        self.seen.add(path)
+        entry = {'path': str(path.resolve()), 'backup': None}
+        if path.exists():
+            backup = self.journal_path / f'{len(self.entries):06d}'
+            backup.parent.mkdir(parents=True, exist_ok=True)
+            shutil.copy2(path, backup)
+            entry['backup'] = backup.name
+        self.entries.append(entry)
+        self._save_manifest()
+
+    def _save_manifest(self):
+        self.journal_path.mkdir(parents=True, exist_ok=True)
+        manifest = self.journal_path / 'manifest.json'
+        tmp = manifest.with_suffix('.tmp')
+        tmp.write_text(json.dumps(self.entries, indent=1), encoding='utf-8')
+        os.replace(tmp, manifest)
+
+    def __enter__(self):
+        global _batch
+        if _batch is not None:
+            raise RuntimeError('WriteBatch does not nest')
+        _batch = self
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        global _batch
+        _batch = None
+        for d in self.dirs:
+            _fsync_dir(d)
+        if self.journal and self.entries:
+            if exc_type is not None:
+                n = rollback(self.journal_path)
+                print(f'Write batch failed, rolled back {n} files')
+            else:
+                shutil.rmtree(self.journal_path, ignore_errors=True)
+        return False
+
+
+def rollback(journal_path):
+    """Restore every file recorded in a journal directory, newest first."""
+    journal_path = Path(journal_path)
+    entries = json.loads((journal_path / 'manifest.json').read_text(encoding='utf-8'))
+    for entry in reversed(entries):
+        target = Path(entry['path'])
+        if entry['backup'] is None:
+            if target.exists():
+                target.unlink()
+        else:
+            write_bytes(target, (journal_path / entry['backup']).read_bytes())
+    shutil.rmtree(journal_path, ignore_errors=True)
+    return len(entries)
+
+
+if __name__ == '__main__':
+    p = argparse.ArgumentParser(description='Inspect or roll back write journals left by interrupted runs')
+    p.add_argument('--list', action='store_true', help='list pending journals')
+    p.add_argument('--rollback', help='journal directory to roll back')
+    args = p.parse_args()
+    if args.rollback:
+        n = rollback(args.rollback)
+        print(f'Restored {n} files from {args.rollback}')
+    else:
+        journals = sorted(JOURNAL_DIR.glob('*/manifest.json')) if JOURNAL_DIR.exists() else []
+        for m in journals:
+            entries = json.loads(m.read_text(encoding='utf-8'))
+            print(f'{m.parent}: {len(entries)} files')
+        if not journals:
+            print('No pending write journals')
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""Incremental, content-addressed snapshots of the `articles` table.
+
+`take` copies the live DB with SQLite's online backup API (safe while the
+admin server is writing), then records every (slug, field) of every
+article as a SHA-256 of its value. Values are stored once in `objects`,
+zlib-compressed and keyed by that hash, so a nightly snapshot of an
+unchanged archive only adds one small manifest row per field and no
+content. Bodies are hashed after `content_store.decode`, so switching the
+content codec does not duplicate anything.
+
+Restoring a slug or a single field is one primary-key lookup in the
+manifest plus one in `objects`.
+
+The store lives in `backups/snapshots.db`. Run from the repo root:
+    python3 scripts/snapshot.py take --note "before gallery rewrite"
+    python3 scripts/snapshot.py list
+    python3 scripts/snapshot.py show 3 --slug article_20080323_1397554556
+    python3 scripts/snapshot.py restore 3 --slug article_20080323_1397554556 --field content
+"""
+from hashlib import sha256
+from pathlib import Path
+import argparse
+import datetime
+import sqlite3
+import zlib
+
+from content_store import decode, encode, write_codec
+
+ROOT = Path(__file__).resolve().parents[1]
+DB_PATH = ROOT / 'articles.db'
+STORE_PATH = ROOT / 'backups' / 'snapshots.db'
+
+FIELDS = ('title', 'content', 'pub_date', 'excerpt')
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS objects (
+    hash TEXT PRIMARY KEY,
+    data BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS snapshots (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    created TEXT NOT NULL,
+    note TEXT,
+    rows INTEGER,
+    new_objects INTEGER,
+    new_bytes INTEGER
+);
+CREATE TABLE IF NOT EXISTS manifest (
+    snapshot_id INTEGER NOT NULL,
+    slug TEXT NOT NULL,
+    field TEXT NOT NULL,
+    hash TEXT,
+    PRIMARY KEY (snapshot_id, slug, field)
+) WITHOUT ROWID;
+'''
+
+
+def open_store(path=STORE_PATH):
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    store = sqlite3.connect(str(path))
+    store.executescript(SCHEMA)
+    return store
+
+
+def _hash(value):
+    return sha256(value.encode('utf-8')).hexdigest()
+
+
+def online_copy(db_path=DB_PATH):
+    """Consistent in-memory copy of the live DB via the backup API."""
+    src = sqlite3.connect(str(db_path))
+    mem = sqlite3.connect(':memory:')
+    src.backup(mem)
+    src.close()
+    return mem
+
+
+def take(db_path=DB_PATH, store_path=STORE_PATH, note=None):
+    live = online_copy(db_path)
+    store = open_store(store_path)
+    last = store.execute('SELECT MAX(id) FROM snapshots').fetchone()[0]
+    previous = {}
+    if last is not None:
+        previous = {(s, f): h for s, f, h in store.execute(
+            'SELECT slug, field, hash FROM manifest WHERE snapshot_id = ?', (last,))}
+    cur = store.execute('INSERT INTO snapshots (created, note) VALUES (?, ?)',
+                        (datetime.datetime.now().isoformat(timespec='seconds'), note))
+    snap_id = cur.lastrowid
+    manifest = []
+    new_objects = new_bytes = rows = 0
+    for row in live.execute(f'SELECT slug, {", ".join(FIELDS)} FROM articles WHERE slug IS NOT NULL'):
+        rows += 1
+        slug = row[0]
+        for field, value in zip(FIELDS, row[1:]):
+            if field == 'content':
+                value = decode(value)
+            if value is None:
+                manifest.append((snap_id, slug, field, None))
+                continue
+            value = str(value)
+            h = _hash(value)
+            manifest.append((snap_id, slug, field, h))
+            if previous.get((slug, field)) == h:
+                continue
+            data = zlib.compress(value.encode('utf-8'), 9)
+            c = store.execute('INSERT OR IGNORE INTO objects (hash, data) VALUES (?, ?)', (h, data))
+            if c.rowcount:
+                new_objects += 1
+                new_bytes += len(data)
+    live.close()
+    store.executemany('INSERT INTO manifest (snapshot_id, slug, field, hash) VALUES (?,?,?,?)', manifest)
+    store.execute('UPDATE snapshots SET rows = ?, new_objects = ?, new_bytes = ? WHERE id = ?',
+                  (rows, new_objects, new_bytes, snap_id))
+    store.commit()
+    store.close()
+    return snap_id, rows, new_objects, new_bytes
+
+
+def fetch(store, snapshot_id, slug, field):
+    """Value of one field of one slug as of a snapshot (None if it was NULL)."""
+    row = store.execute(
+        'SELECT o.data FROM manifest m LEFT JOIN objects o ON o.hash = m.hash '
+        'WHERE m.snapshot_id = ? AND m.slug = ? AND m.field = ?', (snapshot_id, slug, field)).fetchone()
+    if row is None:
+        raise KeyError(f'{slug}/{field} not in snapshot {snapshot_id}')
+    return zlib.decompress(row[0]).decode('utf-8') if row[0] is not None else None
+
+
+def iter_field(store, snapshot_id, field='content'):
+    """Yield (slug, value) for every article in a snapshot."""
+    for slug, data in store.execute(
+            'SELECT m.slug, o.data FROM manifest m LEFT JOIN objects o ON o.hash = m.hash '
+            'WHERE m.snapshot_id = ? AND m.field = ?', (snapshot_id, field)):
+        yield slug, zlib.decompress(data).decode('utf-8') if data is not None else None
+
+
+def restore(snapshot_id, slug, fields=FIELDS, db_path=DB_PATH, store_path=STORE_PATH):
+    store = open_store(store_path)
+    values = {f: fetch(store, snapshot_id, slug, f) for f in fields}
+    store.close()
+    conn = sqlite3.connect(str(db_path))
+    if 'content' in values:
+        values['content'] = encode(values['content'], write_codec(conn))
+    sets = ', '.join(f'{f} = ?' for f in values)
+    cur = conn.execute(f'UPDATE articles SET {sets} WHERE slug = ?', (*values.values(), slug))
+    if not cur.rowcount:
+        cols = ', '.join(values)
+        conn.execute(f'INSERT INTO articles (slug, {cols}) VALUES (?{", ?" * len(values)})',
+                     (slug, *values.values()))
+    conn.commit()
+    conn.close()
+    return list(values)
+
+
+if __name__ == '__main__':
+    p = argparse.ArgumentParser(description='Incremental snapshots of articles.db')
+    p.add_argument('--db', default=str(DB_PATH))
+    p.add_argument('--store', default=str(STORE_PATH))
+    sub = p.add_subparsers(dest='cmd', required=True)
+    t = sub.add_parser('take', help='take a snapshot of the live DB')
+    t.add_argument('--note')
+    sub.add_parser('list', help='list snapshots')
+    s = sub.add_parser('show', help='print a field from a snapshot')
+    s.add_argument('id', type=int)
+    s.add_argument('--slug', required=True)
+    s.add_argument('--field', default='content', choices=FIELDS)
+    r = sub.add_parser('restore', help='restore a slug (or one field of it) into the live DB')
+    r.add_argument('id', type=int)
+    r.add_argument('--slug', required=True)
+    r.add_argument('--field', choices=FIELDS, help='only restore this field')
+    args = p.parse_args()
+
+    if args.cmd == 'take':
+        snap_id, rows, n, size = take(args.db, args.store, args.note)
+        print(f'Snapshot {snap_id}: {rows} articles, {n} new objects ({size} bytes)')
+    elif args.cmd == 'list':
+        store = open_store(args.store)
+        for row in store.execute('SELECT id, created, rows, new_objects, new_bytes, note FROM snapshots ORDER BY id'):
+            print('{:>4}  {}  {:>5} rows  +{} objects  +{} bytes  {}'.format(*row[:5], row[5] or ''))
+        store.close()
+    elif args.cmd == 'show':
+        store = open_store(args.store)
+        print(fetch(store, args.id, args.slug, args.field))
+        store.close()
+    elif args.cmd == 'restore':
+        fields = (args.field,) if args.field else FIELDS
+        restored = restore(args.id, args.slug, fields, args.db, args.store)
+        print(f'Restored {", ".join(restored)} of {args.slug} from snapshot {args.id}')
@@ -4,6 +4,11 @@ from pathlib import Path
 import datetime
 import re
 
+from content_store import encode, write_codec
+from dates import parse_token
+from layout import iter_pages, relink
+from text_stats import article_text, make_excerpt
+
 DB = Path('articles.db')
 ART_DIR = Path('articles')
 
@@ -20,19 +25,17 @@ def extract_meta_from_file(p: Path):
         pub_date = datetime.datetime(y, mm, 1).isoformat()
     else:
         # fallback: parse date token from filename
-        m3 = re.search(r'(\d{8})', p.name)
-        if m3:
-            dt = datetime.datetime.strptime(m3.group(1), '%Y%m%d')
+        dt = parse_token(p.name)
+        if dt:
             pub_date = dt.isoformat()
-    # excerpt: first text content
-    txt = re.sub(r'<[^>]+>', '', text)
-    excerpt = ' '.join(txt.split())[:160]
-    return title, pub_date or datetime.datetime.now().isoformat(), text, excerpt
+    excerpt = make_excerpt(article_text(text), 160)
+    return title, pub_date or datetime.datetime.now().isoformat(), relink(text, p.parent, ART_DIR), excerpt
 
 def main():
     conn = sqlite3.connect(DB)
     cur = conn.cursor()
-    files = sorted(ART_DIR.glob('article_fb_*.html'))
+    codec = write_codec(conn)
+    files = list(iter_pages('article_fb_*.html', ART_DIR))
     inserted = 0
     for f in files:
         slug = f.stem
@@ -41,7 +44,7 @@ def main():
             continue
         title, pub_date, content, excerpt = extract_meta_from_file(f)
         cur.execute('INSERT INTO articles (title, content, pub_date, slug, excerpt) VALUES (?,?,?,?,?)',
-                    (title, content, pub_date, slug, excerpt))
+                    (title, encode(content, codec), pub_date, slug, excerpt))
         inserted += 1
     conn.commit()
     conn.close()
@@ -3,24 +3,26 @@ from bs4 import BeautifulSoup
 from pathlib import Path
 import sqlite3
 
+from content_store import set_content, write_codec
+from layout import iter_pages, relink
+
 ROOT = Path(__file__).resolve().parents[1]
 ART_DIR = ROOT / 'articles'
 DB_PATH = ROOT / 'articles.db'
 
 def main():
     conn = sqlite3.connect(str(DB_PATH))
-    cur = conn.cursor()
+    codec = write_codec(conn)
     updated = 0
-    for p in sorted(ART_DIR.glob('*.html')):
+    for p in iter_pages('*.html', ART_DIR):
         slug = p.name[:-5]
         s = BeautifulSoup(p.read_text(encoding='utf-8'), 'html.parser')
         cont = s.find('div', class_='article-content')
         if not cont:
             continue
-        inner_html = ''.join(str(c) for c in cont.contents)
+        inner_html = relink(''.join(str(c) for c in cont.contents), p.parent, ART_DIR)
         # Update content in DB for matching slug
-        cur.execute('UPDATE articles SET content = ? WHERE slug = ?', (inner_html, slug))
-        if cur.rowcount:
+        if set_content(conn, slug, inner_html, codec):
             updated += 1
     conn.commit()
     conn.close()
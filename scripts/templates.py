@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""Precompiled page templates for the Python page writers.
+
+`article_template.html` and `index_sidebar_template.html` are split once
+at their `{{NAME}}` placeholders into a list of literal segments and a
+list of names; rendering fills the names and does a single `''.join`, so
+the 13-16 KB of inline CSS and SVG is never copied by a chain of
+`str.replace` calls. Compiled templates are cached per process and
+recompiled when the file's mtime changes.
+
+Values are HTML-escaped unless the placeholder is in RAW (fragments that
+are already HTML). Placeholders filled at request time by the admin
+server (RUNTIME, i.e. `{{AUTH_LINKS}}`) are left in place; any other
+placeholder without a value renders as ''.
+
+`generate_from_db.js` compiles and renders the same templates the same
+way in JavaScript.
+
+The site header lives in the templates, so pages written through
+`render()` get it directly; `update_article_headers.py` re-renders old
+pages instead of patching a header string into them.
+
+    from templates import render
+    html = render('article', TITLE=title, DATE='2010.06.05', CONTENT=body)
+
+Run from the repo root: `python3 scripts/templates.py --bench`
+"""
+from html import escape
+from pathlib import Path
+import argparse
+import re
+import sqlite3
+import time
+
+ROOT = Path(__file__).resolve().parents[1]
+DB_PATH = ROOT / 'articles.db'
+
+TEMPLATES = {
+    'article': ROOT / 'article_template.html',
+    'index': ROOT / 'index_sidebar_template.html',
+}
+PLACEHOLDER_RE = re.compile(r'\{\{([A-Z_]+)\}\}')
+RAW = {'CONTENT', 'PREV_LINK', 'NEXT_LINK', 'RELATED_LINKS', 'READING_TIME', 'SIDEBAR_CONTENT', 'GRID_CONTENT'}
+RUNTIME = {'AUTH_LINKS'}
+
+_cache = {}
+
+
+class Template:
+    """A template split at its placeholders."""
+
+    def __init__(self, text):
+        parts = PLACEHOLDER_RE.split(text)
+        self.literals = parts[0::2]
+        self.names = parts[1::2]
+        self.size = len(text)
+
+    def render(self, values):
+        out = [''] * (len(self.literals) + len(self.names))
+        out[0::2] = self.literals
+        out[1::2] = [_fill(name, values) for name in self.names]
+        return ''.join(out)
+
+
+def _fill(name, values):
+    value = values.get(name)
+    if value is None:
+        return '{{' + name + '}}' if name in RUNTIME else ''
+    value = str(value)
+    return value if name in RAW else escape(value, quote=True)
+
+
+def load(name):
+    """Compiled template by name ('article' or 'index'), from the cache if unchanged."""
+    path = TEMPLATES[name]
+    mtime = path.stat().st_mtime
+    hit = _cache.get(name)
+    if hit is None or hit[0] != mtime:
+        hit = (mtime, Template(path.read_text(encoding='utf-8')))
+        _cache[name] = hit
+    return hit[1]
+
+
+def render(name, **values):
+    return load(name).render(values)
+
+
+def bench(db_path=DB_PATH, rounds=3):
+    """Render every article in the DB with the old replace chain and the compiled template."""
+    from content_store import iter_content
+
+    conn = sqlite3.connect(str(db_path))
+    rows = [(t or '', d or '', c or '') for t, d, c in iter_content(conn, 'title, pub_date')]
+    conn.close()
+    text = TEMPLATES['article'].read_text(encoding='utf-8')
+
+    def chained(t, d, c):
+        return text.replace('{{TITLE}}', t).replace('{{DATE}}', d).replace('{{CONTENT}}', c)
+
+    def compiled(t, d, c):
+        return render('article', TITLE=t, DATE=d[:10], CONTENT=c)
+
+    print(f'{len(rows)} articles, template {len(text)} bytes')
+    for label, fn in (('replace chain', chained), ('compiled', compiled)):
+        best = None
+        for _ in range(rounds):
+            t0 = time.perf_counter()
+            for r in rows:
+                fn(*r)
+            dt = time.perf_counter() - t0
+            best = dt if best is None else min(best, dt)
+        print(f'{label:14} {best * 1000:>8.1f}ms total  {best / max(len(rows), 1) * 1e6:>7.1f}us/page')
+
+
+if __name__ == '__main__':
+    p = argparse.ArgumentParser(description='Inspect or benchmark the compiled page templates')
+    p.add_argument('--bench', action='store_true', help='time rendering the whole archive')
+    p.add_argument('--db', default=str(DB_PATH))
+    args = p.parse_args()
+    if args.bench:
+        bench(args.db)
+    else:
+        for name in TEMPLATES:
+            t = load(name)
+            print(f'{name}: {t.size} bytes, {len(t.literals)} segments, placeholders {sorted(set(t.names))}')
@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+"""Excerpts and text statistics for articles, computed once and stored.
+
+This is the one place that turns article HTML into plain text and an
+excerpt; the import and cleanup scripts all call `html_to_text` /
+`make_excerpt` instead of keeping their own copies.
+
+Most of the archive is Chinese, which has no spaces between words, so
+nothing here is word-split on whitespace alone:
+
+  - `make_excerpt` cuts Latin text on a word boundary, but CJK text at the
+    limit (backing up to the last sentence or clause mark when one is
+    close), and counts the limit in characters either way
+  - `text_stats` counts every CJK character as a word next to Latin word
+    tokens, and estimates reading time with a separate rate for each
+
+`refresh` makes one batch pass over `articles.content`: rows whose body
+hash matches the stored one are skipped, the rest get their excerpt
+rewritten and a row in `text_stats`. `generate_from_db.js` renders the
+card excerpts from `articles.excerpt` and reads `reading_secs` from the
+table for the reading time next to each article's date.
+
+Run from the repo root:
+    python3 scripts/text_stats.py              # update changed articles
+    python3 scripts/text_stats.py --all        # recompute everything
+    python3 scripts/text_stats.py --bench      # throughput over the corpus
+"""
+from hashlib import sha1
+from html import unescape
+from html.parser import HTMLParser
+from pathlib import Path
+import argparse
+import re
+import sqlite3
+import time
+
+from content_store import iter_content
+
+ROOT = Path(__file__).resolve().parents[1]
+DB_PATH = ROOT / 'articles.db'
+
+EXCERPT_LENGTH = 160
+ELLIPSIS = '...'
+CJK_PER_MINUTE = 400
+WORDS_PER_MINUTE = 200
+
+CJK_RANGES = '\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uac00-\ud7af'
+CJK_RE = re.compile(f'[{CJK_RANGES}]')
+LATIN_WORD_RE = re.compile(f'[^\\W{CJK_RANGES}]+(?:[\'’.-][^\\W{CJK_RANGES}]+)*')
+WS_RE = re.compile(r'\s+')
+# places a CJK excerpt may end: sentence and clause marks
+CJK_BREAK_RE = re.compile('[。！？；，、：”」）!?;,]')
+
+# generated article pages: only the body counts, not the header/nav/footer
+ARTICLE_BODY_RE = re.compile(r'<div class="article-content"[^>]*>(.*?)(?:<nav class="article-nav"|<footer|$)', re.S)
+SKIP_TAGS = {'script', 'style', 'head', 'title', 'noscript', 'template'}
+BLOCK_TAGS = {'p', 'div', 'br', 'li', 'ul', 'ol', 'tr', 'td', 'th', 'table', 'blockquote',
+              'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'section', 'article', 'figure', 'figcaption', 'pre', 'hr'}
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS text_stats (
+    slug TEXT PRIMARY KEY,
+    hash TEXT NOT NULL,
+    chars INTEGER NOT NULL,
+    words INTEGER NOT NULL,
+    cjk_chars INTEGER NOT NULL,
+    cjk_ratio REAL NOT NULL,
+    reading_secs INTEGER NOT NULL
+);
+'''
+
+
+class _TextExtractor(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts = []
+        self.skip = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in SKIP_TAGS:
+            self.skip += 1
+        elif tag in BLOCK_TAGS:
+            self.parts.append(' ')
+
+    def handle_startendtag(self, tag, attrs):
+        if tag in BLOCK_TAGS:
+            self.parts.append(' ')
+
+    def handle_endtag(self, tag):
+        if tag in SKIP_TAGS:
+            self.skip = max(0, self.skip - 1)
+        elif tag in BLOCK_TAGS:
+            self.parts.append(' ')
+
+    def handle_data(self, data):
+        if not self.skip:
+            self.parts.append(data)
+
+
+def html_to_text(html):
+    """Visible text of an HTML fragment or page, whitespace collapsed."""
+    if not html:
+        return ''
+    if '<' not in html:
+        return WS_RE.sub(' ', unescape(html)).strip()
+    p = _TextExtractor()
+    p.feed(html)
+    p.close()
+    return WS_RE.sub(' ', ''.join(p.parts)).strip()
+
+
+def article_text(html):
+    """Like `html_to_text`, but only the `.article-content` of a full article page."""
+    m = ARTICLE_BODY_RE.search(html or '')
+    return html_to_text(m.group(1) if m else html)
+
+
+def make_excerpt(text, length=EXCERPT_LENGTH, ellipsis=ELLIPSIS):
+    """First `length` characters of `text`, cut on a word or clause boundary."""
+    t = WS_RE.sub(' ', text).strip()
+    if len(t) <= length:
+        return t
+    window = t[:length]
+    floor = length * 3 // 4
+    if CJK_RE.match(t[length - 1]) or CJK_RE.match(t[length]):
+        m = None
+        for m in CJK_BREAK_RE.finditer(window, floor):
+            pass
+        if m is not None:
+            window = window[:m.start()]
+    elif not t[length].isspace():
+        # mid-way through a Latin word: back up to the last space or CJK char
+        for i in range(length - 1, floor - 1, -1):
+            if window[i].isspace():
+                window = window[:i]
+                break
+            if CJK_RE.match(window[i]):
+                window = window[:i + 1]
+                break
+    return window.rstrip(' ,，、;；:：') + ellipsis
+
+
+def text_stats(text):
+    """Counts for plain text: chars (non-space), words, cjk_chars, cjk_ratio, reading_secs."""
+    chars = len(text) - sum(len(ws) for ws in WS_RE.findall(text))
+    cjk = len(CJK_RE.findall(text))
+    latin = len(LATIN_WORD_RE.findall(text))
+    secs = cjk * 60 / CJK_PER_MINUTE + latin * 60 / WORDS_PER_MINUTE
+    return {
+        'chars': chars,
+        'words': cjk + latin,
+        'cjk_chars': cjk,
+        'cjk_ratio': round(cjk / chars, 3) if chars else 0.0,
+        'reading_secs': int(round(secs)),
+    }
+
+
+def reading_minutes(secs):
+    return max(1, round(secs / 60))
+
+
+def analyse(html, length=EXCERPT_LENGTH):
+    """(excerpt, stats) for one article body."""
+    text = article_text(html)
+    return make_excerpt(text, length), text_stats(text)
+
+
+def _hash(html):
+    return sha1((html or '').encode('utf-8')).hexdigest()
+
+
+def refresh(conn, everything=False, length=EXCERPT_LENGTH):
+    """Recompute excerpts and stats for articles whose body changed.
+
+    Returns (checked, updated).
+    """
+    conn.executescript(SCHEMA)
+    known = {} if everything else dict(conn.execute('SELECT slug, hash FROM text_stats'))
+    excerpts, rows = [], []
+    checked = 0
+    for slug, html in iter_content(conn, 'slug', 'slug IS NOT NULL'):
+        checked += 1
+        h = _hash(html)
+        if known.get(slug) == h:
+            continue
+        excerpt, st = analyse(html, length)
+        excerpts.append((excerpt, slug))
+        rows.append((slug, h, st['chars'], st['words'], st['cjk_chars'], st['cjk_ratio'], st['reading_secs']))
+    with conn:
+        conn.executemany('UPDATE articles SET excerpt = ? WHERE slug = ?', excerpts)
+        conn.executemany('INSERT OR REPLACE INTO text_stats VALUES (?,?,?,?,?,?,?)', rows)
+        conn.execute('DELETE FROM text_stats WHERE slug NOT IN (SELECT slug FROM articles WHERE slug IS NOT NULL)')
+    return checked, len(rows)
+
+
+def bench(db_path=DB_PATH, rounds=3):
+    """Time the batch pass over every body against the old BeautifulSoup path."""
+    conn = sqlite3.connect(str(db_path))
+    bodies = [html or '' for _, html in iter_content(conn)]
+    conn.close()
+    size = sum(len(b.encode('utf-8')) for b in bodies)
+
+    def best(fn):
+        times = []
+        for _ in range(rounds):
+            t0 = time.perf_counter()
+            for b in bodies:
+                fn(b)
+            times.append(time.perf_counter() - t0)
+        return min(times)
+
+    results = [('text_stats', best(analyse))]
+    try:
+        from bs4 import BeautifulSoup
+
+        def old(html):
+            t = ' '.join(BeautifulSoup(html, 'html.parser').get_text(separator=' ', strip=True).split())
+            return t if len(t) <= EXCERPT_LENGTH else t[:EXCERPT_LENGTH].rsplit(' ', 1)[0] + ELLIPSIS
+        results.append(('bs4 excerpt only', best(old)))
+    except ImportError:
+        pass
+    print(f'{len(bodies)} articles, {size / 1e6:.1f} MB of HTML')
+    for label, t in results:
+        print(f'{label:18} {t * 1000:>8.1f}ms  {len(bodies) / t:>8.0f} articles/s  {size / t / 1e6:>6.1f} MB/s')
+    return results
+
+
+if __name__ == '__main__':
+    p = argparse.ArgumentParser(description='Compute excerpts and text statistics for articles.db')
+    p.add_argument('--db', default=str(DB_PATH))
+    p.add_argument('--all', action='store_true', help='recompute every article, not only changed ones')
+    p.add_argument('--length', type=int, default=EXCERPT_LENGTH, help='excerpt length in characters')
+    p.add_argument('--bench', action='store_true', help='measure batch throughput over the corpus')
+    args = p.parse_args()
+    if args.bench:
+        bench(args.db)
+    else:
+        conn = sqlite3.connect(args.db)
+        checked, updated = refresh(conn, args.all, args.length)
+        conn.close()
+        print(f'Checked {checked} articles, updated excerpts and stats for {updated}')
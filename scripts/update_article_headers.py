@@ -1,36 +1,81 @@
 #!/usr/bin/env python3
+"""Re-render old article pages that still carry the legacy `nav-bar` header.
+
+The site header is part of `article_template.html`, so instead of
+patching a copy of it into each page, pages with the old
+`<nav class="nav-bar">` are rebuilt from the template with their title,
+date and body, their prev/next links and related posts, and any other
+markup that sat next to the body. The original is kept as
+`<page>.html.bak`.
+"""
 import re
 from pathlib import Path
 
+from bs4 import BeautifulSoup
+
+from layout import iter_pages
+from safe_write import WriteBatch, copy_file, write_text
+from templates import render
+
 ROOT = Path(__file__).resolve().parents[1]
 ART_DIR = ROOT / 'articles'
 
 nav_re = re.compile(r"<nav class=\"nav-bar\">[\s\S]*?<\/nav>", re.IGNORECASE)
-new_header = (
-    '<header class="site-header" style="max-width:800px;margin:0 auto 24px;display:flex;align-items:center;justify-content:space-between;">\n'
-    '  <div class="brand" style="display:flex;align-items:center;gap:10px;">\n'
-    '    <a href="/" title="首页"><img src="/skycity_cutout.png" alt="logo" style="width:40px;height:40px;border-radius:6px;"/></a>\n'
-    '    <a href="/" title="首页" style="text-decoration:none;color:var(--ink);font-weight:600;">天空之城</a>\n'
-    '  </div>\n'
-    '  <div class="auth-bar">{{AUTH_LINKS}}</div>\n'
-    '</header>'
-)
+
+
+def rerender(txt):
+    soup = BeautifulSoup(txt, 'html.parser')
+    for nav in soup.select('nav.nav-bar'):
+        nav.decompose()
+    title_el = soup.select_one('.article-title') or soup.find('h1') or soup.find('h2')
+    title = title_el.get_text(strip=True) if title_el else ''
+    if not title and soup.title:
+        title = soup.title.get_text(strip=True).replace(' - 天空之城', '')
+    date_el = soup.select_one('.article-date')
+    reading = date_el.select_one('.reading-time').extract() if date_el and date_el.select_one('.reading-time') else None
+    date = date_el.get_text(strip=True) if date_el else ''
+    # prev/next links and related posts are carried over; the template puts them back in place
+    prev_link = next_link = related = None
+    nav = soup.select_one('nav.article-nav')
+    if nav is not None:
+        links = [c for c in nav.children if getattr(c, 'name', None)]
+        if len(links) == 2:
+            prev_link, next_link = str(links[0]), str(links[1])
+        for a in links if len(links) != 2 else []:
+            if 'next-link' in (a.get('class') or []):
+                next_link = str(a)
+            else:
+                prev_link = str(a)
+        nav.extract()
+    aside = soup.select_one('aside.related-posts')
+    if aside is not None:
+        related = str(aside.extract())
+    body = soup.select_one('.article-content')
+    if body is not None:
+        # anything else the old page kept next to the body stays with it, after the content
+        extra = [s for s in body.find_next_siblings()
+                 if s.name not in ('footer', 'script') and 'article-header' not in (s.get('class') or [])]
+        content = ''.join(str(c) for c in body.contents) + ''.join(str(s) for s in extra)
+    else:
+        body = soup.find('section') or soup.body or soup
+        content = ''.join(str(c) for c in body.contents)
+    return render('article', TITLE=title, DATE=date, READING_TIME=reading and str(reading), CONTENT=content,
+                  PREV_LINK=prev_link, NEXT_LINK=next_link, RELATED_LINKS=related)
+
 
 count = 0
-for p in ART_DIR.rglob('*.html'):
-    try:
-        txt = p.read_text(encoding='utf-8')
-    except Exception:
-        continue
-    if nav_re.search(txt):
-        bak = p.with_suffix(p.suffix + '.bak')
-        if not bak.exists():
-            p.replace(bak)
-            # restore original to txt variable
-            txt = bak.read_text(encoding='utf-8')
-        newtxt = nav_re.sub(new_header, txt, count=1)
-        if newtxt != txt:
-            p.write_text(newtxt, encoding='utf-8')
-            count += 1
+with WriteBatch(journal=True):
+    for p in iter_pages('*.html', ART_DIR):
+        try:
+            txt = p.read_text(encoding='utf-8')
+        except Exception:
+            continue
+        if nav_re.search(txt):
+            bak = p.with_suffix(p.suffix + '.bak')
+            if not bak.exists():
+                # keep the original in place until the new page is fully written
+                copy_file(p, bak)
+            if write_text(p, rerender(txt)):
+                count += 1
 
 print(f'Updated {count} article files in {ART_DIR}')
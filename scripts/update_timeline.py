@@ -3,27 +3,20 @@ from pathlib import Path
 from collections import defaultdict
 import re
 import argparse
-import datetime
+
+from dates import parse_token
+from layout import iter_pages
+from safe_write import write_text
 
 def collect_article_years(articles_dir):
     p = Path(articles_dir)
-    files = list(p.glob('article_*.html'))
+    files = iter_pages('article_*.html', p)
     years = defaultdict(set)
     for f in files:
-        name = f.stem
-        parts = name.split('_')
-        date_token = None
-        for tok in parts:
-            if len(tok) == 8 and tok.isdigit():
-                date_token = tok
-                break
-        if not date_token:
-            continue
-        try:
-            dt = datetime.datetime.strptime(date_token, '%Y%m%d')
-            years[dt.year].add(dt.month)
-        except Exception:
+        dt = parse_token(f.stem)
+        if not dt:
             continue
+        years[dt.year].add(dt.month)
     return years
 
 
@@ -90,7 +83,7 @@ def inject(home_path, html_snippet):
         new_text = text[:start] + new_block + text[sect_pos:]
     else:
         new_text = text[:start] + new_block + text[end:]
-    home.write_text(new_text, encoding='utf-8')
+    write_text(home, new_text)
 
 
 def find_matching_closing_ul(text, open_ul_pos):
@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+"""Poster frames and web-optimised MP4s for videos in facebook_media.
+
+For every `.mp4` under `articles/facebook_media` this stage:
+
+  - probes it with ffprobe and records duration, dimensions and codecs in
+    the `videos` table of articles.db
+  - rewrites it as a faststart MP4 (moov atom first, so playback starts
+    before the whole file is downloaded). H.264/AAC sources are remuxed
+    without re-encoding; anything else is transcoded to H.264/AAC capped
+    at MAX_WIDTH. The original is kept under `backups/video_originals/`,
+    and reprocessing a video this stage already wrote (`--force`) starts
+    from that copy again, so repeated runs never re-encode their own output
+  - extracts `<name>.poster.jpg` next to the video
+  - adds `poster="..."` and `preload="none"` to the `<video>` tags that play
+    it, in the article pages and in the DB copy of their content, so
+    opening a page no longer fetches video just to paint a frame
+
+Jobs run in a bounded thread pool (`--workers`, each job is an ffmpeg
+subprocess). A video is skipped when its size and mtime, or failing that
+its SHA-256, match what was recorded after the last run and its poster
+exists. Without ffmpeg/ffprobe on PATH the stage prints a note and does
+nothing.
+
+Run from the repo root: `python3 scripts/video_pipeline.py [--workers 2] [--force]`
+"""
+from concurrent.futures import ThreadPoolExecutor
+from hashlib import sha256
+from pathlib import Path
+import argparse
+import datetime
+import json
+import os
+import re
+import shutil
+import sqlite3
+import subprocess
+import tempfile
+
+from content_store import iter_content, set_content
+from layout import iter_pages
+from media_index import record
+from safe_write import WriteBatch, write_text
+
+ROOT = Path(__file__).resolve().parents[1]
+ART_DIR = ROOT / 'articles'
+MEDIA_DIR = ART_DIR / 'facebook_media'
+ORIGINALS_DIR = ROOT / 'backups' / 'video_originals'
+DB_PATH = ROOT / 'articles.db'
+
+MAX_WIDTH = 1280
+CRF = 23
+POSTER_SUFFIX = '.poster.jpg'
+
+VIDEO_RE = re.compile(r'<video\b([^>]*)>', re.I)
+SRC_RE = re.compile(r'''\bsrc\s*=\s*["']([^"']+\.mp4)["']''', re.I)
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS videos (
+    path TEXT PRIMARY KEY,
+    size INTEGER,
+    mtime REAL,
+    hash TEXT,
+    source_hash TEXT,
+    duration REAL,
+    width INTEGER,
+    height INTEGER,
+    vcodec TEXT,
+    acodec TEXT,
+    poster TEXT,
+    remuxed INTEGER,
+    updated TEXT
+);
+'''
+
+
+def tools():
+    """(ffmpeg, ffprobe) paths, or None if either is missing."""
+    ffmpeg, ffprobe = shutil.which('ffmpeg'), shutil.which('ffprobe')
+    return (ffmpeg, ffprobe) if ffmpeg and ffprobe else None
+
+
+def file_hash(path):
+    h = sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def probe(ffprobe, path):
+    out = subprocess.run([ffprobe, '-v', 'error', '-print_format', 'json', '-show_format', '-show_streams', str(path)],
+                         capture_output=True, check=True).stdout
+    info = json.loads(out or b'{}')
+    video = next((s for s in info.get('streams', []) if s.get('codec_type') == 'video'), {})
+    audio = next((s for s in info.get('streams', []) if s.get('codec_type') == 'audio'), {})
+    return {
+        'duration': float(info.get('format', {}).get('duration') or 0),
+        'width': video.get('width'),
+        'height': video.get('height'),
+        'vcodec': video.get('codec_name'),
+        'acodec': audio.get('codec_name'),
+        'pix_fmt': video.get('pix_fmt'),
+    }
+
+
+def optimise(ffmpeg, src, meta, dest=None):
+    """Write `src` as a faststart MP4 to `dest` (default: in place); returns True if it was only remuxed."""
+    dest = dest or src
+    remux = meta['vcodec'] == 'h264' and meta['pix_fmt'] in ('yuv420p', 'yuvj420p') \
+        and meta['acodec'] in ('aac', None) and (meta['width'] or 0) <= MAX_WIDTH
+    if remux:
+        codec_args = ['-c', 'copy']
+    else:
+        codec_args = ['-c:v', 'libx264', '-preset', 'medium', '-crf', str(CRF), '-pix_fmt', 'yuv420p',
+                      '-vf', f"scale='min({MAX_WIDTH},iw)':-2", '-c:a', 'aac', '-b:a', '128k']
+    fd, tmp = tempfile.mkstemp(prefix=f'.{dest.name}.', suffix='.mp4', dir=str(dest.parent))
+    os.close(fd)
+    try:
+        subprocess.run([ffmpeg, '-v', 'error', '-y', '-i', str(src), *codec_args, '-movflags', '+faststart', tmp],
+                       capture_output=True, check=True)
+        os.replace(tmp, dest)
+    finally:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+    return remux
+
+
+def extract_poster(ffmpeg, src, duration):
+    poster = src.with_name(src.stem + POSTER_SUFFIX)
+    at = min(1.0, duration / 2) if duration else 0
+    subprocess.run([ffmpeg, '-v', 'error', '-y', '-ss', f'{at:.2f}', '-i', str(src), '-frames:v', '1', '-q:v', '3',
+                    '-vf', f"scale='min({MAX_WIDTH},iw)':-2", str(poster)], capture_output=True, check=True)
+    return poster
+
+
+def process(job):
+    """Worker: keep the original, optimise from it and extract a poster for one video.
+
+    `ours` means the file on disk is this stage's own output, so the kept
+    original is the source; otherwise the file is new and replaces it.
+    """
+    (ffmpeg, ffprobe), path, source_hash, ours = job
+    rel = path.relative_to(ART_DIR).as_posix()
+    try:
+        original = ORIGINALS_DIR / rel
+        if ours and original.exists():
+            source_hash = file_hash(original)
+        else:
+            original.parent.mkdir(parents=True, exist_ok=True)
+            shutil.copy2(path, original)
+        meta = probe(ffprobe, original)
+        remuxed = optimise(ffmpeg, original, meta, path)
+        poster = extract_poster(ffmpeg, path, meta['duration'])
+        st = path.stat()
+        return {'path': rel, 'size': st.st_size, 'mtime': st.st_mtime, 'hash': file_hash(path),
+                'source_hash': source_hash, 'poster': poster.relative_to(ART_DIR).as_posix(),
+                'remuxed': int(remuxed), **meta}
+    except (subprocess.CalledProcessError, OSError, ValueError) as e:
+        err = getattr(e, 'stderr', b'') or b''
+        return {'path': rel, 'error': (err.decode('utf-8', 'ignore').strip() or str(e))[-300:]}
+
+
+def pending(conn, force=False):
+    """Videos that need work, as (path, hash, whether the file is our own output)."""
+    known = {r[0]: r[1:] for r in conn.execute('SELECT path, size, mtime, hash, poster FROM videos')}
+    for path in sorted(MEDIA_DIR.rglob('*.mp4')):
+        if path.name.startswith('.'):
+            continue
+        rel = path.relative_to(ART_DIR).as_posix()
+        row = known.get(rel)
+        st = path.stat()
+        poster_ok = row is not None and row[3] and (ART_DIR / row[3]).exists()
+        if not force and poster_ok and (row[0], row[1]) == (st.st_size, st.st_mtime):
+            continue
+        h = file_hash(path)
+        if not force and poster_ok and row[2] == h:
+            conn.execute('UPDATE videos SET size = ?, mtime = ? WHERE path = ?', (st.st_size, st.st_mtime, rel))
+            continue
+        yield path, h, row is not None and row[2] == h
+
+
+def add_posters(html, posters):
+    """Add poster/preload to <video> tags whose src is a processed video."""
+    def fix(m):
+        attrs = m.group(1)
+        src = SRC_RE.search(attrs)
+        if not src:
+            return m.group(0)
+        poster = posters.get(src.group(1).split('?')[0])
+        extra = []
+        if poster and 'poster=' not in attrs.lower():
+            extra.append(f'poster="{poster}"')
+        if poster and 'preload=' not in attrs.lower():
+            extra.append('preload="none"')
+        return f'<video{attrs} {" ".join(extra)}>' if extra else m.group(0)
+    return VIDEO_RE.sub(fix, html)
+
+
+def update_pages(conn, db_path=DB_PATH):
+    """Point <video> tags in pages and DB content at their posters."""
+    posters = {p: poster for p, poster in conn.execute('SELECT path, poster FROM videos WHERE poster IS NOT NULL')
+               if (ART_DIR / poster).exists()}
+    pages = []
+    rows = 0
+    with WriteBatch():
+        for page in iter_pages('*.html', ART_DIR):
+            html = page.read_text(encoding='utf-8')
+            if '<video' in html:
+                new = add_posters(html, posters)
+                if new != html and write_text(page, new):
+                    pages.append(page)
+    # bodies may be compressed BLOBs (content_store.py), so match on the decoded text
+    for slug, html in list(iter_content(conn)):
+        if not html or '<video' not in html:
+            continue
+        new = add_posters(html, posters)
+        if new != html:
+            rows += set_content(conn, slug, new)
+    conn.commit()
+    record(pages=pages, db_path=db_path)
+    return len(pages), rows
+
+
+def run(workers=2, force=False, db_path=DB_PATH):
+    found = tools()
+    if found is None:
+        print('ffmpeg/ffprobe not found on PATH; skipping video pipeline')
+        return None
+    conn = sqlite3.connect(str(db_path))
+    conn.executescript(SCHEMA)
+    jobs = [(found, path, h, ours) for path, h, ours in pending(conn, force)]
+    conn.commit()
+    done = failed = 0
+    now = datetime.datetime.now().isoformat(timespec='seconds')
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        for r in pool.map(process, jobs):
+            if 'error' in r:
+                failed += 1
+                print(f"  {r['path']}: {r['error']}")
+                continue
+            done += 1
+            conn.execute('INSERT OR REPLACE INTO videos VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?)',
+                         (r['path'], r['size'], r['mtime'], r['hash'], r['source_hash'], r['duration'],
+                          r['width'], r['height'], r['vcodec'], r['acodec'], r['poster'], r['remuxed'], now))
+            conn.commit()
+            record([ART_DIR / r['path'], ART_DIR / r['poster']], db_path=db_path)
+    pages, rows = update_pages(conn, db_path)
+    conn.close()
+    return done, failed, pages, rows
+
+
+if __name__ == '__main__':
+    p = argparse.ArgumentParser(description='Extract posters and write faststart MP4s for facebook_media videos')
+    p.add_argument('--workers', type=int, default=min(2, os.cpu_count() or 1), help='concurrent ffmpeg jobs')
+    p.add_argument('--force', action='store_true', help='reprocess videos even if unchanged')
+    p.add_argument('--db', default=str(DB_PATH))
+    args = p.parse_args()
+    result = run(args.workers, args.force, args.db)
+    if result is not None:
+        done, failed, pages, rows = result
+        print(f'Processed {done} videos ({failed} failed); posters added to {pages} pages and {rows} DB rows')